@@ -0,0 +1,469 @@
+# adj_factor.py
+"""
+复权因子表（data/bars/adj_factor.sqlite）
+
+原始日线（不复权）在存储里永远不改；复权在读取时按因子向量化相乘：
+- 每只股票只存「除权除息事件」：(日期, 比例)，比例 = 前一日收盘 / 当日除权参考价
+- 后复权因子 F(t) = 截至 t 的比例连乘（上市首日为 1）→ hfq 价格 = 原价 × F(t)
+- 前复权 qfq 价格 = 原价 × F(t) / F(最新)，最新价不变
+- 新事件只影响之后的 hfq 价格，历史 hfq 不变（增量指标状态可继续用）；
+  均线交叉对整体缩放不敏感，因此 hfq / qfq 信号相同
+
+事件来源（都按进度增量，不重下历史）：
+- eastmoney：同一接口的后复权日线（fqt=2）÷ 存储里的不复权收盘 = 逐日后复权因子，因子跳变日即除权日
+             （不复权日线的涨跌额相对的是不复权前收，本地日线本身推不出除权）
+- tushare  ：pro.adj_factor 累计因子，相邻之比 ≠ 1 的日期即除权日
+
+只有同步过的股票才有因子（covered）；没同步过的读取时等同不复权，由调用方标明
+
+用法：
+    python adj_factor.py                    # 从 Eastmoney 增量拉取
+    python adj_factor.py --source tushare   # 从 tushare 增量拉取
+    python adj_factor.py --check            # 对照录制数据里已知的除权日核对因子表（没核对到任何一个也算失败）
+    python adj_factor.py --record-hfq       # 录制 --check 依赖的后复权日线到 data/manual/stocks/hfq/（需联网）
+
+--check 依赖的录制：不复权 data/manual/stocks/{code}.json（前收），后复权 data/manual/stocks/hfq/{code}.json
+（经 mock_eastmoney_server.py 同步出因子表）
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from collections import Counter
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import instrument
+from bar_store import (
+    STORE_DIR,
+    from_days,
+    list_codes,
+    read_bars,
+    read_columns,
+    restore_prices,
+    to_days,
+)
+from kline_fetcher import CONCURRENCY, EASTMONEY_BASE_URL, FQT_HFQ, RATE_PER_SEC, fetch_many
+from mock_eastmoney_server import HFQ_SUBDIR
+from kline_parser import parse_klines
+
+ADJ_NAME = "adj_factor.sqlite"
+
+ADJUST_MODES = ("hfq", "qfq")
+SOURCES = ("eastmoney", "tushare")
+
+MANUAL_DIR = Path("data/manual/stocks")
+# 录制数据里已知的除权除息：(代码, 除权日, 每股派现, 每股送转)
+EX_DATE_CHECKS = [
+    ("000333", "2023-06-01", 2.5, 0.0),     # 美的集团 2022 年度 10 派 25（前收 51.33，不复权涨跌额 -2.44）
+]
+CHECK_TOLERANCE = 0.002     # 回购专户不参与分配，折算后每股派现略小于公告值
+
+TS_TOKEN = os.getenv("TUSHARE_TOKEN")
+SLEEP_SEC = 0.6             # TuShare 免费限频
+START_DATE = "19900101"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    code    TEXT NOT NULL,
+    day     INTEGER NOT NULL,
+    ratio   REAL NOT NULL,
+    source  TEXT NOT NULL,
+    PRIMARY KEY (code, day)
+);
+CREATE TABLE IF NOT EXISTS progress (
+    code        TEXT NOT NULL,
+    source      TEXT NOT NULL,
+    gen         INTEGER,
+    rows        INTEGER,
+    last_day    INTEGER,
+    last_value  REAL,
+    updated_at  TEXT NOT NULL,
+    PRIMARY KEY (code, source)
+);
+"""
+
+
+def adj_path(store_dir: Path) -> Path:
+    return store_dir / ADJ_NAME
+
+
+def _connect(store_dir: Path) -> sqlite3.Connection:
+    store_dir.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(adj_path(store_dir), timeout=30)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# =========================
+# 1. 读取时复权（向量化）
+# =========================
+
+def load_events(codes, store_dir: Path = STORE_DIR) -> dict:
+    """{code: (天数数组, 比例数组)}，按日期排序；没有事件的代码不出现"""
+    if not adj_path(store_dir).exists():
+        return {}
+
+    wanted = set(codes)
+    with closing(_connect(store_dir)) as conn:
+        rows = conn.execute(
+            f"SELECT code, day, ratio FROM events WHERE source IN ({', '.join('?' * len(SOURCES))}) ORDER BY code, day",
+            SOURCES,
+        ).fetchall()
+
+    out = {}
+    for code, day, ratio in rows:
+        if code in wanted:
+            out.setdefault(code, ([], []))
+            out[code][0].append(day)
+            out[code][1].append(ratio)
+    return {code: (np.array(days, dtype=np.int64), np.array(ratios)) for code, (days, ratios) in out.items()}
+
+
+def factors(days: np.ndarray, events, how: str = "hfq") -> np.ndarray:
+    """每个日期的复权乘数（float64）；events 为 None 时全为 1"""
+    days = np.asarray(days, dtype=np.int64)
+    if events is None or len(events[0]) == 0:
+        return np.ones(len(days))
+    if how not in ADJUST_MODES:
+        raise ValueError(f"未知复权方式: {how}（可选 {', '.join(ADJUST_MODES)}）")
+
+    event_days, ratios = events
+    cum = np.concatenate([[1.0], np.cumprod(ratios)])
+    out = cum[np.searchsorted(event_days, days, side="right")]
+    if how == "qfq":
+        out = out / cum[-1]
+    return out
+
+
+def hfq_factor_at(day: int, events) -> float:
+    """某日的后复权因子（截至该日的事件连乘）"""
+    return float(factors(np.array([day]), events, "hfq")[0])
+
+
+def latest_factor(events) -> float:
+    """最新后复权因子（hfq → qfq 的除数）"""
+    return 1.0 if events is None else float(np.prod(events[1]))
+
+
+def universe_factors(
+        loaded: list,
+        days: np.ndarray,
+        offsets: np.ndarray,
+        events: dict,
+        how: str = "hfq",
+) -> np.ndarray:
+    """load_universe 拼接数组的逐行复权乘数（只对有事件的股票计算）"""
+    out = np.ones(len(days))
+    for i, code in enumerate(loaded):
+        if code in events:
+            lo, hi = offsets[i], offsets[i + 1]
+            out[lo:hi] = factors(days[lo:hi], events[code], how)
+    return out
+
+
+def adjust_frame(df: pd.DataFrame, events, how: str | None) -> pd.DataFrame:
+    """对 read_bars 格式的 DataFrame 的价格列复权（返回新表，成交量等不动）"""
+    if how is None or events is None:
+        return df
+    mult = factors(to_days(df["date"]), events, how)
+    out = df.copy()
+    for col in ["open", "high", "low", "close", "change"]:
+        if col in out.columns:
+            out[col] = out[col] * mult
+    return out
+
+
+def read_adjusted(
+        code: str,
+        how: str | None = "qfq",
+        columns=None,
+        store_dir: Path = STORE_DIR,
+) -> pd.DataFrame | None:
+    """read_bars + 复权"""
+    df = read_bars(code, columns, store_dir)
+    if df is None:
+        return None
+    return adjust_frame(df, load_events([code], store_dir).get(code), how)
+
+
+# =========================
+# 2. Eastmoney 后复权 K 线（增量）
+# =========================
+
+def hfq_events(
+        days: np.ndarray,
+        raw_close: np.ndarray,
+        hfq_close: np.ndarray,
+        half_tick: float,
+        last_value: float | None = None,
+) -> tuple[np.ndarray, np.ndarray, float | None]:
+    """(除权日天数, 比例, 最新因子)
+
+    逐日因子 = 后复权收盘 ÷ 不复权收盘；后复权价按报价单位四舍五入，因子误差 ≤ 半个报价单位 ÷ 不复权收盘，
+    相邻两日之差超过两者误差之和才算跳变；两次跳变之间的因子 = 段内后复权收盘之和 ÷ 不复权收盘之和（摊薄舍入误差），
+    相邻两段之比即事件比例
+    last_value：上次同步的最新因子，与本次第一根比较（None = 从上市首日起，首段不算事件）
+    """
+    raw_close = np.asarray(raw_close, dtype=np.float64)
+    hfq_close = np.asarray(hfq_close, dtype=np.float64)
+    ok = np.isfinite(raw_close) & np.isfinite(hfq_close) & (raw_close > 0) & (hfq_close > 0)
+    days, raw_close, hfq_close = np.asarray(days)[ok], raw_close[ok], hfq_close[ok]
+    if len(days) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0), last_value
+
+    value = hfq_close / raw_close
+    err = half_tick / raw_close
+    starts = np.flatnonzero(np.abs(np.diff(value)) > err[1:] + err[:-1]) + 1
+    bounds = np.concatenate([[0], starts])
+    levels = np.add.reduceat(hfq_close, bounds) / np.add.reduceat(raw_close, bounds)
+
+    event_days = days[starts]
+    ratios = levels[1:] / levels[:-1]
+    if last_value is not None and abs(levels[0] - last_value) > 2 * err[0]:
+        event_days = np.concatenate([days[:1], event_days])
+        ratios = np.concatenate([[levels[0] / last_value], ratios])
+    return event_days.astype(np.int64), ratios, float(levels[-1])
+
+
+def _progress(conn: sqlite3.Connection, source: str) -> dict:
+    rows = conn.execute(
+        "SELECT code, gen, rows, last_day, last_value FROM progress WHERE source = ?",
+        (source,),
+    ).fetchall()
+    return {code: (gen, n, last_day, last_value) for code, gen, n, last_day, last_value in rows}
+
+
+def _yyyymmdd(day: int) -> str:
+    return str(from_days(np.array([day]))[0]).replace("-", "")
+
+
+def covered(codes, store_dir: Path = STORE_DIR) -> set:
+    """同步过复权因子的代码（任一来源有进度）；其余代码没有因子，只能按不复权处理"""
+    if not adj_path(store_dir).exists():
+        return set()
+
+    wanted = set(codes)
+    with closing(_connect(store_dir)) as conn:
+        rows = conn.execute(
+            f"SELECT DISTINCT code FROM progress WHERE source IN ({', '.join('?' * len(SOURCES))})",
+            SOURCES,
+        ).fetchall()
+    return {code for (code,) in rows if code in wanted}
+
+
+def sync_from_eastmoney(
+        codes,
+        store_dir: Path = STORE_DIR,
+        base_url: str = EASTMONEY_BASE_URL,
+        concurrency: int = CONCURRENCY,
+        rate: float = RATE_PER_SEC,
+) -> Counter:
+    """后复权日线从上次同步日起拉（含该日，用来接上次的最新因子），与存储里的不复权收盘逐日相除
+
+    返回各方式计数（create / append / noop / missing / failed）
+    """
+    codes = list(dict.fromkeys(codes))
+    with closing(_connect(store_dir)) as conn:
+        progress = _progress(conn, "eastmoney")
+
+    jobs = [(code, _yyyymmdd(progress[code][2]) if code in progress else START_DATE) for code in codes]
+    modes = Counter()
+    now = datetime.now().isoformat(timespec="seconds")
+
+    for code, raw, error in fetch_many(jobs, concurrency, rate, base_url=base_url, fqt=FQT_HFQ):
+        if error is not None:
+            print(f"❌ {code} 后复权日线拉取失败: {error}")
+            modes["failed"] += 1
+            continue
+
+        data = (raw or {}).get("data") or {}
+        hfq = parse_klines(data.get("klines") or [])
+        arrays = read_columns(code, ["date", "close"], store_dir)
+        if arrays is None or len(hfq["date"]) == 0:
+            modes["missing"] += 1
+            continue
+
+        # 只比较两边都有的交易日
+        hfq_days = hfq["date"].astype(np.int64)
+        pos = np.minimum(np.searchsorted(arrays["date"], hfq_days), len(arrays["date"]) - 1)
+        matched = arrays["date"][pos] == hfq_days
+        if not matched.any():
+            modes["missing"] += 1
+            continue
+
+        old = progress.get(code)
+        last_day = int(hfq_days[matched][-1])
+        event_days, ratios, last_value = hfq_events(
+            hfq_days[matched],
+            restore_prices(arrays["close"][pos[matched]]),
+            hfq["close"][matched],
+            0.5 * 10 ** -int(data.get("decimal", 2)),
+            old[3] if old else None,
+        )
+
+        with closing(_connect(store_dir)) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO events (code, day, ratio, source) VALUES (?, ?, ?, 'eastmoney')",
+                [(code, int(d), float(r)) for d, r in zip(event_days, ratios)],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO progress VALUES (?, 'eastmoney', NULL, NULL, ?, ?, ?)",
+                (code, last_day, last_value, now),
+            )
+        modes["create" if old is None else "noop" if last_day == old[2] and len(ratios) == 0 else "append"] += 1
+
+    return modes
+
+
+# =========================
+# 3. tushare 累计因子（增量）
+# =========================
+
+def sync_from_tushare(codes, store_dir: Path = STORE_DIR, token: str | None = TS_TOKEN, sleep: float = SLEEP_SEC) -> Counter:
+    """pro.adj_factor 从上次拉到的日期起拉，累计因子相邻之比 ≠ 1 的日期记为事件"""
+    from data_sources import TushareSource
+
+    source = TushareSource(token, sleep=sleep)
+    with closing(_connect(store_dir)) as conn:
+        progress = _progress(conn, "tushare")
+
+    modes = Counter()
+    now = datetime.now().isoformat(timespec="seconds")
+    for i, code in enumerate(dict.fromkeys(codes)):
+        if i and sleep:
+            with instrument.stage("sleep"):
+                time.sleep(sleep)
+
+        old = progress.get(code)
+        start = _yyyymmdd(old[2]) if old else START_DATE
+        try:
+            instrument.count("http_calls")
+            with instrument.stage("fetch"):
+                df = source.pro.adj_factor(ts_code=source.ts_code(code), start_date=start)
+        except Exception as e:
+            print(f"❌ {code} 复权因子拉取失败: {e}")
+            modes["failed"] += 1
+            continue
+
+        if df is None or df.empty:
+            modes["noop"] += 1
+            continue
+
+        df = df.sort_values("trade_date")
+        days = to_days(pd.to_datetime(df["trade_date"].astype(str)))
+        cum = df["adj_factor"].to_numpy(dtype=np.float64)
+        prev = np.concatenate([[old[3] if old else cum[0]], cum[:-1]])
+        hit = np.abs(cum / prev - 1) > 1e-9
+
+        with closing(_connect(store_dir)) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO events (code, day, ratio, source) VALUES (?, ?, ?, 'tushare')",
+                [(code, int(d), float(r)) for d, r in zip(days[hit], (cum / prev)[hit])],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO progress VALUES (?, 'tushare', NULL, NULL, ?, ?, ?)",
+                (code, int(days[-1]), float(cum[-1]), now),
+            )
+        modes["append" if old else "create"] += 1
+
+    return modes
+
+
+# =========================
+# 4. 对照录制的除权日核对
+# =========================
+
+def check_ex_dates(store_dir: Path = STORE_DIR, manual_dir: Path = MANUAL_DIR, checks=EX_DATE_CHECKS) -> list:
+    """[(代码, 除权日, 原因)]，只返回没通过的；缺录制数据 / 因子表没有事件都算没通过
+
+    期望比例 = 前收 ÷ 除权参考价，参考价 = (前收 - 每股派现) ÷ (1 + 每股送转)，前收取录制的不复权 JSON
+    """
+    failures = []
+    for code, day, cash, bonus in checks:
+        json_path = manual_dir / f"{code}.json"
+        if not json_path.exists():
+            failures.append((code, day, f"缺少录制数据 {json_path}"))
+            continue
+
+        with open(json_path, "r", encoding="utf-8") as f:
+            bars = parse_klines(json.load(f)["data"]["klines"])
+        target = int(to_days([day])[0])
+        days = bars["date"].astype(np.int64)
+        pos = int(np.searchsorted(days, target))
+        if pos == 0 or pos == len(days) or days[pos] != target:
+            failures.append((code, day, f"录制数据 {json_path} 不含该除权日及前一日"))
+            continue
+        prev = float(bars["close"][pos - 1])
+        expected = prev / ((prev - cash) / (1 + bonus))
+
+        events = load_events([code], store_dir).get(code)
+        hit = None if events is None else np.flatnonzero(events[0] == target)
+        if hit is None or not len(hit):
+            hfq_path = manual_dir / HFQ_SUBDIR / f"{code}.json"
+            hint = "" if hfq_path.exists() else f"（缺少后复权录制 {hfq_path}，先 --record-hfq）"
+            failures.append((code, day, f"期望比例 {expected:.4f}，因子表无事件{hint}"))
+            continue
+        actual = float(events[1][hit[0]])
+        if abs(actual / expected - 1) > CHECK_TOLERANCE:
+            failures.append((code, day, f"期望比例 {expected:.4f}，因子表 {actual:.4f}"))
+    return failures
+
+
+def record_hfq(codes, manual_dir: Path = MANUAL_DIR, base_url: str = EASTMONEY_BASE_URL) -> list:
+    """拉取后复权日线原样存为 {manual_dir}/hfq/{code}.json（mock_eastmoney_server 的 fqt=2 录制），返回写入的代码"""
+    out_dir = manual_dir / HFQ_SUBDIR
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for code, raw, error in fetch_many([(code, START_DATE) for code in codes], base_url=base_url, fqt=FQT_HFQ):
+        if error is not None or not ((raw or {}).get("data") or {}).get("klines"):
+            print(f"❌ {code} 后复权日线录制失败: {error or '无数据'}")
+            continue
+        with open(out_dir / f"{code}.json", "w", encoding="utf-8") as f:
+            json.dump(raw, f, ensure_ascii=False, separators=(",", ":"))
+        written.append(code)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="复权因子表增量更新")
+    parser.add_argument("--source", choices=list(SOURCES), default="eastmoney")
+    parser.add_argument("--store-dir", type=Path, default=STORE_DIR)
+    parser.add_argument("--base-url", default=EASTMONEY_BASE_URL, help="Eastmoney 接口地址（可指向本地 mock）")
+    parser.add_argument("--manual-dir", type=Path, default=MANUAL_DIR, help="录制数据目录")
+    parser.add_argument("--check", action="store_true", help="不拉取，只对照录制的除权日核对因子表")
+    parser.add_argument("--record-hfq", action="store_true", help="录制 --check 用到的股票的后复权日线")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.install_from_args("adj_factor", args)
+
+    if args.record_hfq:
+        codes = list(dict.fromkeys(code for code, *_ in EX_DATE_CHECKS))
+        written = record_hfq(codes, args.manual_dir, args.base_url)
+        print(f"📁 后复权录制：{len(written)} / {len(codes)} 只 → {args.manual_dir / HFQ_SUBDIR}")
+        raise SystemExit(0 if len(written) == len(codes) else 1)
+
+    if args.check:
+        failures = check_ex_dates(args.store_dir, args.manual_dir)
+        for code, day, reason in failures:
+            print(f"❌ {code} {day}：{reason}")
+        passed = len(EX_DATE_CHECKS) - len(failures)
+        print(f"🩺 核对 {len(EX_DATE_CHECKS)} 个除权日，通过 {passed} 个，未通过 {len(failures)} 个")
+        raise SystemExit(1 if failures or not passed else 0)
+
+    codes = list_codes(args.store_dir)
+    print(f"🗂 存储股票数：{len(codes)}")
+
+    if args.source == "tushare":
+        modes = sync_from_tushare(codes, args.store_dir)
+    else:
+        modes = sync_from_eastmoney(codes, args.store_dir, args.base_url)
+
+    events = load_events(codes, args.store_dir)
+    print(f"🎯 完成：{dict(modes)}，有除权事件 {len(events)} 只，共 {sum(len(e[0]) for e in events.values())} 次")
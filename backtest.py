@@ -0,0 +1,365 @@
+# backtest.py
+"""
+Close/MA 交叉策略回测（向量化，全部标的一次跑）
+
+规则与 归档/run_daily.py 完全一致：
+- 日线 MA_WINDOW 均线（按各自交易日滚动，停牌日不计）
+- 收盘上穿 → BUY，收盘下穿 → SELL
+- 止损价 = round(收盘 * (1 - STOP_LOSS_PCT), 3)
+- 仓位 = RISK_PER_TRADE / (收盘 - 止损价)，向下取整到 100 股
+
+价格：默认前复权（adj_factor 因子表，--adjust），除权缺口不会误触止损 / 均线交叉；
+没同步过因子的股票按不复权（先运行 adj_factor.py）
+
+撮合假设：
+- 信号日收盘价成交
+- 持仓期间最低价触及止损 → 以 min(开盘, 止损价) 离场（跳空按开盘）
+- 不计手续费 / 滑点，不设资金上限（每笔风险固定）
+
+用法：
+    python backtest.py
+    python backtest.py --codes 510300 159919   # ETF 与股票共用 data/bars（归档/fetch_data.py 增量写入）
+    python backtest.py --point-in-time   # 按当日成分股开仓（universe/history.csv，无幸存者偏差）
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import adj_factor
+from bar_store import STORE_DIR, from_days, load_universe, restore_prices
+from universe_history import HISTORY_FILE, ever_members, load, membership_matrix
+
+UNIVERSE_FILE = Path("universe/final_universe.csv")
+OUTPUT_DIR = Path("backtest")
+
+MA_WINDOW = 20
+RISK_PER_TRADE = 100
+STOP_LOSS_PCT = 0.02
+INITIAL_CAPITAL = 100_000
+LOT_SIZE = 100
+
+TRADING_DAYS = 252
+
+
+# =========================
+# 1. 面板
+# =========================
+
+def load_price_panel(
+        codes,
+        store_dir: Path = STORE_DIR,
+        start: str | None = None,
+        adjust: str | None = "qfq",
+) -> dict:
+    """载入「日期 × 代码」矩阵 + 每只股票按交易日排列的长表
+
+    adjust：qfq / hfq 按因子表复权（没有因子的股票不复权），None 为不复权
+    返回 dict：
+    - dates / codes
+    - open / low / close：二维矩阵，无 K 线处为 NaN
+    - long_close / long_row / long_col / offsets：长表（供按交易日滚动）
+    """
+    loaded, arrays, offsets = load_universe(codes, ["date", "open", "low", "close"], store_dir)
+
+    days = arrays["date"]
+    col_of_row = np.repeat(np.arange(len(loaded)), np.diff(offsets))
+    dates = np.unique(days)
+    row_of = np.searchsorted(dates, days)
+    mult = None
+    if adjust is not None:
+        mult = adj_factor.universe_factors(loaded, days, offsets, adj_factor.load_events(loaded, store_dir), adjust)
+
+    panel = {
+        "dates": from_days(dates),
+        "codes": loaded,
+        "long_row": row_of,
+        "long_col": col_of_row,
+        "offsets": offsets,
+    }
+    for col in ["open", "low", "close"]:
+        values = restore_prices(arrays[col])
+        if mult is not None:
+            values = values * mult
+        matrix = np.full((len(dates), len(loaded)), np.nan)
+        matrix[row_of, col_of_row] = values
+        panel[col] = matrix
+        if col == "close":
+            panel["long_close"] = values
+
+    return slice_panel(panel, start)[0] if start is not None else panel
+
+
+def slice_panel(panel: dict, start: str | None) -> tuple[dict, np.ndarray]:
+    """只保留 start 及之后的交易日
+
+    返回 (切好的面板, 保留的长表行号)；在完整历史上算好的长表数值（均线、上市天数）按行号取出即可对齐
+    """
+    first = 0 if start is None else int(np.searchsorted(panel["dates"], np.datetime64(start, "D")))
+    rows = np.flatnonzero(panel["long_row"] >= first)
+
+    col_of_row = panel["long_col"][rows]
+    counts = np.bincount(col_of_row, minlength=len(panel["codes"]))
+    sliced = {
+        "dates": panel["dates"][first:],
+        "codes": panel["codes"],
+        "long_row": panel["long_row"][rows] - first,
+        "long_col": col_of_row,
+        "offsets": np.concatenate([[0], np.cumsum(counts)]),
+        "long_close": panel["long_close"][rows],
+    }
+    for col in ["open", "low", "close"]:
+        sliced[col] = panel[col][first:]
+    return sliced, rows
+
+
+def rolling_ma(panel: dict, ma_window: int) -> np.ndarray:
+    """各股票按自己的交易日滚动均线（与逐只 rolling(MA_WINDOW).mean() 相同），返回矩阵"""
+    groups = np.repeat(np.arange(len(panel["codes"])), np.diff(panel["offsets"]))
+    ma_long = (
+        pd.Series(panel["long_close"])
+        .groupby(groups, sort=False)
+        .rolling(ma_window)
+        .mean()
+        .to_numpy()
+    )
+
+    return to_matrix(panel, ma_long)
+
+
+def to_matrix(panel: dict, long_values: np.ndarray, fill=np.nan) -> np.ndarray:
+    """长表（按股票 → 交易日）数值散回「日期 × 代码」矩阵"""
+    matrix = np.full(panel["close"].shape, fill, dtype=np.asarray(long_values).dtype)
+    matrix[panel["long_row"], panel["long_col"]] = long_values
+    return matrix
+
+
+def cross_signals(panel: dict, ma: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """BUY / SELL 矩阵：今天 vs 该股票上一根 K 线（不是上一个日历日）"""
+    close_long = panel["long_close"]
+    ma_long = ma[panel["long_row"], panel["long_col"]]
+
+    prev_close = np.roll(close_long, 1)
+    prev_ma = np.roll(ma_long, 1)
+    first = np.zeros(len(close_long), dtype=bool)
+    first[panel["offsets"][:-1][np.diff(panel["offsets"]) > 0]] = True
+    prev_close[first] = np.nan
+    prev_ma[first] = np.nan
+
+    buy_long = (close_long > ma_long) & (prev_close <= prev_ma)
+    sell_long = (close_long < ma_long) & (prev_close >= prev_ma)
+
+    return to_matrix(panel, buy_long, False), to_matrix(panel, sell_long, False)
+
+
+# =========================
+# 2. 回测
+# =========================
+
+def run_backtest(
+        panel: dict,
+        ma: np.ndarray | None = None,
+        ma_window: int = MA_WINDOW,
+        stop_loss_pct: float = STOP_LOSS_PCT,
+        risk_per_trade: float = RISK_PER_TRADE,
+        initial_capital: float = INITIAL_CAPITAL,
+        entry_mask: np.ndarray | None = None,
+) -> dict:
+    """逐日推进、全部标的同时向量化撮合
+
+    ma：可传入预先算好的均线矩阵（参数扫描时复用）
+    entry_mask：额外开仓闸门（日期 × 代码 布尔矩阵，False 时不开新仓）
+
+    返回 {"equity": DataFrame, "trades": DataFrame, "summary": dict}
+    """
+    if ma is None:
+        ma = rolling_ma(panel, ma_window)
+
+    buy, sell = cross_signals(panel, ma)
+    if entry_mask is not None:
+        buy &= entry_mask
+
+    open_, low, close = panel["open"], panel["low"], panel["close"]
+    dates, codes = panel["dates"], panel["codes"]
+    n_days, n_codes = close.shape
+
+    # 开仓参数（信号日就能算好）
+    stop_all = np.round(close * (1 - stop_loss_pct), 3)
+    risk_all = close - stop_all
+    with np.errstate(divide="ignore", invalid="ignore"):
+        qty_all = np.where(risk_all > 0, np.floor(risk_per_trade / risk_all), 0)
+    qty_all = np.nan_to_num(qty_all // LOT_SIZE * LOT_SIZE)
+
+    qty = np.zeros(n_codes)
+    entry_price = np.zeros(n_codes)
+    stop = np.zeros(n_codes)
+    entry_day = np.zeros(n_codes, dtype=np.int64)
+    last_close = np.full(n_codes, np.nan)
+
+    realized = 0.0
+    equity = np.empty(n_days)
+    realized_curve = np.empty(n_days)
+    positions = np.empty(n_days, dtype=np.int64)
+    trades = []
+
+    def close_out(mask, fill, t, reason):
+        nonlocal realized
+        idx = np.flatnonzero(mask)
+        pnl = (fill[idx] - entry_price[idx]) * qty[idx]
+        realized += pnl.sum()
+        for i, price, p in zip(idx, fill[idx], pnl):
+            trades.append((codes[i], dates[entry_day[i]], entry_price[i], dates[t], price, qty[i], p, reason))
+        qty[idx] = 0
+
+    for t in range(n_days):
+        has_bar = ~np.isnan(close[t])
+        in_pos = qty > 0
+
+        # 止损（盘中）
+        stopped = in_pos & has_bar & (low[t] <= stop)
+        if stopped.any():
+            fill = np.where(np.isnan(open_[t]), stop, np.minimum(open_[t], stop))
+            close_out(stopped, fill, t, "STOP")
+
+        # SELL 信号（收盘）
+        exits = (qty > 0) & sell[t]
+        if exits.any():
+            close_out(exits, close[t], t, "SELL")
+
+        # BUY 信号（收盘）
+        entries = (qty == 0) & buy[t] & (qty_all[t] > 0)
+        if entries.any():
+            qty[entries] = qty_all[t][entries]
+            entry_price[entries] = close[t][entries]
+            stop[entries] = stop_all[t][entries]
+            entry_day[entries] = t
+
+        last_close = np.where(has_bar, close[t], last_close)
+        held = qty > 0
+        unrealized = ((last_close[held] - entry_price[held]) * qty[held]).sum()
+
+        equity[t] = initial_capital + realized + unrealized
+        realized_curve[t] = realized
+        positions[t] = held.sum()
+
+    # 期末未平仓按最后收盘价计
+    still_open = qty > 0
+    if still_open.any():
+        idx = np.flatnonzero(still_open)
+        for i in idx:
+            pnl = (last_close[i] - entry_price[i]) * qty[i]
+            trades.append((codes[i], dates[entry_day[i]], entry_price[i], dates[-1], last_close[i], qty[i], pnl, "OPEN"))
+
+    equity_df = pd.DataFrame({
+        "date": pd.to_datetime(dates),
+        "equity": equity,
+        "realized": realized_curve,
+        "positions": positions,
+    })
+    trades_df = pd.DataFrame(trades, columns=[
+        "code", "entry_date", "entry_price", "exit_date", "exit_price", "qty", "pnl", "exit_reason",
+    ])
+
+    return {
+        "equity": equity_df,
+        "trades": trades_df,
+        "summary": summarize(equity_df, trades_df, initial_capital),
+    }
+
+
+def summarize(equity: pd.DataFrame, trades: pd.DataFrame, initial_capital: float) -> dict:
+    """汇总指标"""
+    curve = equity["equity"].to_numpy()
+    if len(curve) == 0:
+        return {"trades": 0}
+
+    drawdown = curve / np.maximum.accumulate(curve) - 1
+    daily = np.diff(curve) / curve[:-1] if len(curve) > 1 else np.zeros(0)
+    std = daily.std()
+    closed = trades[trades["exit_reason"] != "OPEN"]
+    wins = closed["pnl"] > 0
+    losses = -closed.loc[~wins, "pnl"].sum()
+
+    return {
+        "start": str(equity["date"].iloc[0].date()),
+        "end": str(equity["date"].iloc[-1].date()),
+        "final_equity": round(float(curve[-1]), 2),
+        "total_return": round(float(curve[-1] / initial_capital - 1), 4),
+        "max_drawdown": round(float(drawdown.min()), 4),
+        "sharpe": round(float(daily.mean() / std * np.sqrt(TRADING_DAYS)), 3) if std > 0 else 0.0,
+        "trades": int(len(closed)),
+        "open_positions": int(len(trades) - len(closed)),
+        "win_rate": round(float(wins.mean()), 4) if len(closed) else 0.0,
+        "avg_pnl": round(float(closed["pnl"].mean()), 2) if len(closed) else 0.0,
+        "profit_factor": round(float(closed.loc[wins, "pnl"].sum() / losses), 3) if losses > 0 else None,
+        "stop_exits": int((closed["exit_reason"] == "STOP").sum()),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Close/MA 交叉策略回测")
+    parser.add_argument("--codes", nargs="*", help="标的代码（默认 universe）")
+    parser.add_argument("--universe", type=Path, default=UNIVERSE_FILE)
+    parser.add_argument("--store-dir", type=Path, default=STORE_DIR)
+    parser.add_argument("--start", help="起始日期 YYYY-MM-DD")
+    parser.add_argument("--adjust", choices=["qfq", "hfq", "none"], default="qfq", help="复权方式（默认前复权）")
+    parser.add_argument("--ma-window", type=int, default=MA_WINDOW)
+    parser.add_argument("--stop-loss", type=float, default=STOP_LOSS_PCT)
+    parser.add_argument("--risk", type=float, default=RISK_PER_TRADE)
+    parser.add_argument("--capital", type=float, default=INITIAL_CAPITAL)
+    parser.add_argument("--out", type=Path, default=OUTPUT_DIR)
+    parser.add_argument("--point-in-time", action="store_true", help="只在当日成分股上开仓（时点成分股库）")
+    parser.add_argument("--history", type=Path, default=HISTORY_FILE, help="时点成分股库")
+    args = parser.parse_args()
+
+    history = load(args.history) if args.point_in_time else None
+    if history is not None and not history.codes:
+        print(f"⚠️ 时点成分股库为空：{args.history}（先运行 universe_history.py --bootstrap / --import-akshare）")
+        exit(1)
+    if args.codes:
+        codes = args.codes
+    elif history is not None:
+        codes = ever_members(history, args.start)      # 回测期内出现过的全部成分股
+    else:
+        codes = pd.read_csv(args.universe, dtype=str)["code"].tolist()
+
+    started = time.perf_counter()
+    adjust = None if args.adjust == "none" else args.adjust
+    panel = load_price_panel(codes, args.store_dir, args.start, adjust)
+    if adjust is not None:
+        missing = len(panel["codes"]) - len(adj_factor.covered(panel["codes"], args.store_dir))
+        if missing:
+            print(f"⚠️ {missing} 只没有复权因子（先运行 adj_factor.py），按不复权回测")
+    print(f"📊 面板：{len(panel['codes'])} 只 × {len(panel['dates'])} 天")
+
+    entry_mask = None
+    if history is not None:
+        _, entry_mask = membership_matrix(history, panel["dates"], panel["codes"])
+        print(f"🕰 时点成分股：平均每天 {entry_mask.sum(axis=1).mean():.0f} 只可开仓")
+
+    result = run_backtest(
+        panel,
+        ma_window=args.ma_window,
+        stop_loss_pct=args.stop_loss,
+        risk_per_trade=args.risk,
+        initial_capital=args.capital,
+        entry_mask=entry_mask,
+    )
+    elapsed = time.perf_counter() - started
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    result["equity"].to_csv(args.out / "equity.csv", index=False)
+    result["trades"].to_csv(args.out / "trades.csv", index=False, encoding="utf-8-sig")
+    with open(args.out / "summary.json", "w", encoding="utf-8") as f:
+        json.dump(result["summary"], f, indent=2, ensure_ascii=False)
+
+    print("========== BACKTEST ==========")
+    for key, value in result["summary"].items():
+        print(f"{key:<15}: {value}")
+    print("==============================")
+    print(f"⏱ 耗时：{elapsed:.2f}s")
+    print(f"📁 输出目录：{args.out}")
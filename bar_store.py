@@ -0,0 +1,626 @@
+# bar_store.py
+"""
+日线 OHLCV 列式二进制存储（替代 data/stocks/{code}.csv）
+
+布局：
+    data/bars/{code}/meta.json           行数 & 代数 & 首末日期 & 列类型
+    data/bars/{code}/{column}.{gen}.bin  每列一个小端原始数组
+
+- date 用 int32（距 1970-01-01 的天数），价格 float32，成交量 / 成交额 float64
+- 除 OHLCV 外保留成交额、振幅、涨跌幅、涨跌额、换手率：数据源给了才落盘（meta.columns 记录
+  实际存了哪些列），没给的不建文件，读取时记 NaN
+- 读取走 np.memmap，全市场载入几乎零拷贝、无需再 parse 文本 / to_datetime
+- 所有脚本共用同一套 读 / 合并 接口
+
+写入一致性：
+- meta.json 是唯一的提交点（临时文件 + rename 原子替换）
+- 读取只认 meta 里的行数，列文件末尾多出的未提交字节会被忽略
+- 增量合并只动尾部；全量重写写新一代列文件，提交 meta 后再删旧代
+- 任何时刻崩溃，已提交的数据都完整可读
+- 每次提交后顺带更新 manifest.sqlite（最后日期 / 行数 / 来源 / 校验和）
+- 校验和：meta 里存每列的 CRC32，追加时只对新写入的字节续算；修订末根 / 旧 meta 才全量重算
+- append_many：多只股票一次合并（按交易日批量更新），清单最后批量写
+"""
+
+import json
+import os
+import zlib
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import instrument
+import manifest
+
+STORE_DIR = Path("data/bars")
+
+ETF_PREFIXES = ("51", "56", "58", "159")    # 沪市 51x / 56x / 58x，深市 159x（与股票共用存储）
+
+CORE_COLUMNS = {
+    "date": "<i4",
+    "open": "<f4",
+    "high": "<f4",
+    "low": "<f4",
+    "close": "<f4",
+    "volume": "<f8",
+}
+
+# 可选列：有值才落盘，没有文件的列读取时记 NaN
+EXTRA_COLUMNS = {
+    "amount": "<f8",       # 成交额
+    "amplitude": "<f4",    # 振幅 %
+    "pct_chg": "<f4",      # 涨跌幅 %
+    "change": "<f4",       # 涨跌额
+    "turnover": "<f4",     # 换手率 %
+}
+
+COLUMNS = {**CORE_COLUMNS, **EXTRA_COLUMNS}
+
+PRICE_COLUMNS = ["open", "high", "low", "close"]
+PRICE_DECIMALS = 4      # A 股 / ETF 价格最多 3 位小数，float32 → float64 后按此还原
+
+
+# =========================
+# 日期编码
+# =========================
+
+def to_days(dates) -> np.ndarray:
+    """任意日期序列（字符串 / datetime）→ int32 天数"""
+    values = pd.to_datetime(pd.Series(dates)).to_numpy().astype("datetime64[D]")
+    return values.astype(np.int32)
+
+
+def _meta_day(value: str) -> int:
+    """meta 里的 YYYY-MM-DD → int32 天数"""
+    return int(np.datetime64(value, "D").astype(np.int64))
+
+
+def from_days(days: np.ndarray) -> np.ndarray:
+    """int32 天数 → datetime64[D]"""
+    return np.asarray(days).astype("datetime64[D]")
+
+
+def restore_prices(values: np.ndarray) -> np.ndarray:
+    """float32 价格 / 百分比 → float64，并抹掉 float32 的尾差（4.718 而非 4.71799993）"""
+    return np.round(np.asarray(values, dtype=np.float64), PRICE_DECIMALS)
+
+
+# =========================
+# 读取
+# =========================
+
+def _symbol_dir(code: str, store_dir: Path) -> Path:
+    return store_dir / code
+
+
+def _column_path(symbol_dir: Path, col: str, gen: int) -> Path:
+    # gen 0 为早期无代数的布局
+    if gen == 0:
+        return symbol_dir / f"{col}.bin"
+    return symbol_dir / f"{col}.{gen}.bin"
+
+
+def read_meta(code: str, store_dir: Path = STORE_DIR) -> dict | None:
+    """读取单只股票的 meta（不存在返回 None）"""
+    meta_path = _symbol_dir(code, store_dir) / "meta.json"
+    if not meta_path.exists():
+        return None
+
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def is_etf(code: str) -> bool:
+    return code.startswith(ETF_PREFIXES)
+
+
+def list_codes(store_dir: Path = STORE_DIR) -> list:
+    """存储中已有的全部代码（排序）"""
+    if not store_dir.exists():
+        return []
+    return sorted(p.parent.name for p in store_dir.glob("*/meta.json"))
+
+
+def read_columns(
+        code: str,
+        columns=None,
+        store_dir: Path = STORE_DIR,
+) -> dict | None:
+    """按列读取（只读 memmap，零拷贝），不存在返回 None"""
+    meta = read_meta(code, store_dir)
+    if meta is None:
+        return None
+
+    rows = meta["rows"]
+    gen = meta.get("gen", 0)
+    columns = columns or list(meta["columns"])
+    symbol_dir = _symbol_dir(code, store_dir)
+
+    out = {}
+    for col in columns:
+        if col not in meta["columns"]:
+            # 数据源没给的可选列
+            out[col] = np.full(rows, np.nan, dtype=COLUMNS[col])
+            continue
+        dtype = np.dtype(meta["columns"][col])
+        if rows == 0:
+            out[col] = np.empty(0, dtype=dtype)
+            continue
+        path = _column_path(symbol_dir, col, gen)
+        out[col] = np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+
+    instrument.count("rows_read", rows)
+    return out
+
+
+def read_bars(
+        code: str,
+        columns=None,
+        store_dir: Path = STORE_DIR,
+) -> pd.DataFrame | None:
+    """读取为标准 DataFrame（date 为 datetime64，数值为 float64），不存在返回 None"""
+    columns = columns or list(COLUMNS)
+    if "date" not in columns:
+        columns = ["date"] + list(columns)
+
+    arrays = read_columns(code, columns, store_dir)
+    if arrays is None:
+        return None
+
+    df = pd.DataFrame({col: np.array(arr) for col, arr in arrays.items()})
+    df["date"] = pd.to_datetime(from_days(arrays["date"]))
+    for col in df.columns:
+        if df[col].dtype == np.float32:
+            df[col] = restore_prices(df[col])
+    return df
+
+
+def last_date(code: str, store_dir: Path = STORE_DIR) -> str | None:
+    """最后一根 K 线日期（YYYY-MM-DD），无数据返回 None"""
+    meta = read_meta(code, store_dir)
+    if meta is None or meta["rows"] == 0:
+        return None
+    return meta["last_date"]
+
+
+# =========================
+# 写入
+# =========================
+
+def _normalize(df: pd.DataFrame, keep_code: bool = False) -> pd.DataFrame:
+    """统一列 & 类型，按日期排序去重（同日期保留最后一条）
+
+    keep_code：多只股票的长表，保留 code 列，按 code → 日期 排序去重
+    """
+    missing = [col for col in CORE_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"缺少列: {missing}")
+
+    out = pd.DataFrame({"date": to_days(df["date"])})
+    for col, dtype in COLUMNS.items():
+        if col == "date":
+            continue
+        if col not in df.columns:
+            out[col] = np.full(len(df), np.nan, dtype=dtype)
+            continue
+        out[col] = pd.to_numeric(df[col], errors="coerce").to_numpy().astype(dtype)
+
+    keys = ["date"]
+    if keep_code:
+        out.insert(0, "code", df["code"].astype(str).to_numpy())
+        keys = ["code", "date"]
+
+    return (
+        out.drop_duplicates(subset=keys, keep="last")
+        .sort_values(keys, kind="stable")
+        .reset_index(drop=True)
+    )
+
+
+def _supplied(values) -> bool:
+    """可选列是否有任何非空值"""
+    return not np.isnan(np.asarray(values, dtype=np.float64)).all()
+
+
+def _stored_columns(bars) -> dict:
+    """要落盘的列：核心列 + 有值的可选列（bars 为 DataFrame 或 {列: 数组}）"""
+    return {
+        col: dtype for col, dtype in COLUMNS.items()
+        if col in CORE_COLUMNS or _supplied(bars[col])
+    }
+
+
+def _fsync_write(path: Path, data: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    instrument.count("bytes_written", len(data))
+
+
+def _commit_meta(
+        symbol_dir: Path,
+        rows: int,
+        gen: int,
+        first_day,
+        last_day,
+        columns: dict,
+        crc: dict | None = None,
+) -> None:
+    """原子提交 meta（临时文件 + rename）
+
+    columns：实际落盘的列；crc：各列 CRC32，None = 未知（下次写入时全量重算）
+    """
+    meta = {
+        "rows": rows,
+        "gen": gen,
+        "first_date": str(from_days(first_day)) if rows else None,
+        "last_date": str(from_days(last_day)) if rows else None,
+        "columns": columns,
+    }
+    if crc is not None:
+        meta["crc"] = crc
+    tmp_path = symbol_dir / "meta.json.tmp"
+    _fsync_write(tmp_path, json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+    os.replace(tmp_path, symbol_dir / "meta.json")
+
+
+def _remove_stale_columns(symbol_dir: Path, gen: int, columns: dict) -> None:
+    """删除非当前代 / 不再存的列文件（崩溃残留 / 旧代）"""
+    keep = {_column_path(symbol_dir, col, gen).name for col in columns}
+    for path in symbol_dir.glob("*.bin"):
+        if path.name in keep:
+            continue
+        try:
+            path.unlink()
+        except OSError:
+            pass    # 可能仍被其他进程 mmap（Windows），下次再清
+
+
+def _file_crcs(symbol_dir: Path, columns: dict, gen: int, rows: int) -> dict:
+    """各列文件前 rows 行字节的 CRC32（全量读：只在修订末根 / 旧 meta 没有 crc 时用）"""
+    crcs = {}
+    for col, dtype in columns.items():
+        nbytes = rows * np.dtype(dtype).itemsize
+        crc = 0
+        with open(_column_path(symbol_dir, col, gen), "rb") as f:
+            while nbytes > 0:
+                chunk = f.read(min(nbytes, 1 << 20))
+                if not chunk:
+                    break
+                crc = zlib.crc32(chunk, crc)
+                nbytes -= len(chunk)
+        crcs[col] = crc
+    instrument.count("crc_rescans")
+    return crcs
+
+
+def _combine(crcs: dict) -> int:
+    """各列 CRC32 按 COLUMNS 顺序串联再求 CRC32"""
+    crc = 0
+    for col in COLUMNS:
+        if col in crcs:
+            crc = zlib.crc32(int(crcs[col]).to_bytes(4, "little"), crc)
+    return crc
+
+
+def checksum(code: str, store_dir: Path = STORE_DIR) -> int:
+    """已提交数据的校验和（meta 里的各列 CRC32 合成；旧 meta 没有时按列文件全量计算）"""
+    meta = read_meta(code, store_dir)
+    crcs = meta.get("crc")
+    if crcs is None:
+        crcs = _file_crcs(_symbol_dir(code, store_dir), meta["columns"], meta.get("gen", 0), meta["rows"])
+    return _combine(crcs)
+
+
+def _manifest_row(code: str, store_dir: Path, source: str | None) -> tuple:
+    meta = read_meta(code, store_dir)
+    return code, meta["rows"], meta["last_date"], checksum(code, store_dir), source
+
+
+def _record(code: str, store_dir: Path, source: str | None) -> None:
+    manifest.record_many(store_dir, [_manifest_row(code, store_dir, source)])
+
+
+def _rewrite(code: str, bars: pd.DataFrame, store_dir: Path, source: str | None) -> int:
+    """全量重写：写新一代列文件 → 提交 meta → 删旧代"""
+    symbol_dir = _symbol_dir(code, store_dir)
+    symbol_dir.mkdir(parents=True, exist_ok=True)
+
+    meta = read_meta(code, store_dir)
+    gen = (meta.get("gen", 0) if meta else 0) + 1
+
+    columns = _stored_columns(bars)
+    crcs = {}
+    for col, dtype in columns.items():
+        data = bars[col].to_numpy().astype(dtype).tobytes()
+        _fsync_write(_column_path(symbol_dir, col, gen), data)
+        crcs[col] = zlib.crc32(data)
+
+    dates = bars["date"].to_numpy()
+    rows = len(bars)
+    first_day, last_day = (dates[0], dates[-1]) if rows else (None, None)
+    _commit_meta(symbol_dir, rows, gen, first_day, last_day, columns, crcs)
+    _remove_stale_columns(symbol_dir, gen, columns)
+    _record(code, store_dir, source)
+    return rows
+
+
+def _write_tail(
+        code: str,
+        meta: dict,
+        start: int,
+        tail: pd.DataFrame,
+        store_dir: Path,
+        source: str | None,
+        record: bool = True,
+) -> int:
+    """从第 start 行起覆盖写入 tail（DataFrame 或 {列: 数组}，其余历史不动），返回新行数
+
+    只写 meta 里已有的列（tail 带来新可选列时调用方应走全量重写）
+
+    - start < 已提交行数（修订末根）：先把行数回退到 start 并提交，
+      崩溃时最多丢掉被修订的末根，下次更新会重新拉到
+    - 写完各列并 fsync 后，再提交新的行数
+    - 纯追加时各列 CRC32 从 meta 里的值对新字节续算；修订末根（或旧 meta 无 crc）才全量重算
+    - record=False：不写清单（批量调用方最后统一写）
+    """
+    symbol_dir = _symbol_dir(code, store_dir)
+    gen = meta.get("gen", 0)
+    columns = meta["columns"]
+    dates = np.asarray(tail["date"])
+    first_day = _meta_day(meta["first_date"]) if start else dates[0]
+    crcs = dict(meta["crc"]) if start == meta["rows"] and meta.get("crc") is not None else None
+
+    if start < meta["rows"]:
+        prev_last = read_columns(code, ["date"], store_dir)["date"][start - 1] if start else None
+        _commit_meta(symbol_dir, start, gen, first_day, prev_last, columns)
+
+    for col, dtype in columns.items():
+        dtype = np.dtype(dtype)
+        with open(_column_path(symbol_dir, col, gen), "r+b") as f:
+            f.seek(start * dtype.itemsize)
+            data = np.asarray(tail[col]).astype(dtype).tobytes()
+            f.write(data)
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+        instrument.count("bytes_written", len(data))
+        if crcs is not None:
+            crcs[col] = zlib.crc32(data, crcs[col])
+
+    rows = start + len(dates)
+    if crcs is None:
+        crcs = _file_crcs(symbol_dir, columns, gen, rows)
+    _commit_meta(symbol_dir, rows, gen, first_day, dates[-1], columns, crcs)
+    if record:
+        _record(code, store_dir, source)
+    return rows
+
+
+@instrument.timed("write")
+def write_bars(
+        code: str,
+        df: pd.DataFrame,
+        store_dir: Path = STORE_DIR,
+        source: str | None = None,
+) -> int:
+    """整只股票全量写入（原子覆盖），返回行数"""
+    return _rewrite(code, _normalize(df), store_dir, source)
+
+
+def _same_rows(old: dict, new: pd.DataFrame, positions: np.ndarray) -> np.ndarray:
+    """逐行比较已有行（positions）与新行是否完全一致（NaN 视为相等；old 没存的列视为全 NaN）"""
+    same = np.ones(len(positions), dtype=bool)
+    for col in COLUMNS:
+        if col in old:
+            a = np.asarray(old[col][positions])
+        else:
+            a = np.full(len(positions), np.nan, dtype=COLUMNS[col])
+        b = new[col].to_numpy().astype(COLUMNS[col])
+        equal = a == b
+        if a.dtype.kind == "f":
+            equal |= np.isnan(a) & np.isnan(b)
+        same &= equal
+    return same
+
+
+def _keep_stored_extras(old: dict, overlap: pd.DataFrame, positions: np.ndarray, matched: np.ndarray) -> pd.DataFrame:
+    """与已有日期重合的行（matched）里新数据为 NaN 的可选列沿用已存的值
+
+    新数据源不提供成交额 / 换手率等时，修订末根不会把已存的值改成 NaN
+    """
+    out = overlap
+    for col in EXTRA_COLUMNS:
+        if col not in old:
+            continue
+        values = overlap[col].to_numpy()
+        stored = np.asarray(old[col][positions])
+        fill = matched & np.isnan(values) & ~np.isnan(stored)
+        if fill.any():
+            if out is overlap:
+                out = overlap.copy()
+            out[col] = np.where(fill, stored, values).astype(COLUMNS[col])
+    return out
+
+
+@instrument.timed("merge")
+def merge_bars(
+        code: str,
+        df: pd.DataFrame,
+        store_dir: Path = STORE_DIR,
+        source: str | None = None,
+) -> tuple[int, str]:
+    """增量合并新数据，返回 (合并后总行数, 写入方式)
+
+    写入方式：
+    - "noop"    ：没有新信息
+    - "append"  ：只追加新日期
+    - "revise"  ：修订已有末根（+ 追加新日期），只重写尾部
+    - "rewrite" ：历史发生变化（插入 / 修订更早的 K 线），全量原子重写
+    - "create"  ：首次写入
+
+    只读取 meta 与重叠部分的尾部，不加载整段历史。
+    与已有日期重合的行里新数据缺的可选列（NaN）沿用已存的值。
+    """
+    new = _normalize(df)
+    meta = read_meta(code, store_dir)
+
+    if meta is None or meta["rows"] == 0:
+        if new.empty:
+            return 0, "noop"
+        return _rewrite(code, new, store_dir, source), "create"
+
+    rows = meta["rows"]
+    if new.empty:
+        return rows, "noop"
+
+    old = read_columns(code, list(meta["columns"]), store_dir)
+    old_dates = old["date"]
+    new_dates = new["date"].to_numpy()
+
+    # -------------------------
+    # 与已有历史重叠的部分（只看尾部）
+    # -------------------------
+    n_overlap = int(np.searchsorted(new_dates, old_dates[-1], side="right"))
+    overlap = new.iloc[:n_overlap]
+    fresh = new.iloc[n_overlap:]
+
+    if n_overlap:
+        positions = np.searchsorted(old_dates, overlap["date"].to_numpy())
+        positions = np.minimum(positions, rows - 1)
+        inserted = np.asarray(old_dates[positions]) != overlap["date"].to_numpy()
+        overlap = _keep_stored_extras(old, overlap, positions, ~inserted)
+        changed = ~_same_rows(old, overlap, positions)
+    else:
+        positions = np.empty(0, dtype=np.int64)
+        inserted = changed = np.zeros(0, dtype=bool)
+
+    # 插入新日期 / 修订末根之前的历史 / 新数据带来存储里没有的可选列 → 全量重写
+    history_changed = (
+        inserted.any()
+        or (changed & (positions < rows - 1)).any()
+        or not set(_stored_columns(new)) <= set(meta["columns"])
+    )
+    if history_changed:
+        merged = pd.DataFrame({col: np.array(arr) for col, arr in old.items()})
+    del old, old_dates     # 释放 memmap，再动文件
+
+    if history_changed:
+        merged = pd.concat([merged, overlap, fresh], ignore_index=True)
+        merged = (
+            merged.drop_duplicates(subset=["date"], keep="last")
+            .sort_values("date", kind="stable")
+            .reset_index(drop=True)
+        )
+        return _rewrite(code, merged, store_dir, source), "rewrite"
+
+    if changed.any():
+        # 修订末根：从末根开始重写尾部
+        tail = pd.concat([overlap[changed], fresh], ignore_index=True)
+        return _write_tail(code, meta, rows - 1, tail, store_dir, source), "revise"
+
+    if fresh.empty:
+        return rows, "noop"
+
+    return _write_tail(code, meta, rows, fresh.reset_index(drop=True), store_dir, source), "append"
+
+
+@instrument.timed("append_many")
+def append_many(
+        batch: pd.DataFrame,
+        store_dir: Path = STORE_DIR,
+        source: str | None = None,
+) -> Counter:
+    """多只股票的长表（含 code 列）一次合并，返回各写入方式计数
+
+    按交易日批量更新用：
+    - 类型转换 / 排序 / 去重对整批只做一次
+    - 新日期都晚于已有最后日期（纯追加）的直接写尾部，不读任何历史
+    - 其余（新股 / 修订 / 插入 / 带来存储里没有的可选列）逐只走 merge_bars
+    - 纯追加的清单记录最后一个事务批量写入
+    """
+    new = _normalize(batch, keep_code=True)
+    codes = new["code"].to_numpy()
+    arrays = {col: new[col].to_numpy() for col in COLUMNS}
+    bounds = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    starts = np.concatenate([[0], bounds])
+    ends = np.concatenate([bounds, [len(new)]])
+
+    modes = Counter()
+    records = []
+    for lo, hi in zip(starts, ends):
+        if lo == hi:
+            continue
+        code = codes[lo]
+        part = {col: arr[lo:hi] for col, arr in arrays.items()}
+        meta = read_meta(code, store_dir)
+
+        pure_append = (
+            meta is not None
+            and meta["rows"] > 0
+            and set(_stored_columns(part)) <= set(meta["columns"])
+            and part["date"][0] > _meta_day(meta["last_date"])
+        )
+        if not pure_append:
+            part = pd.DataFrame(part)
+            part["date"] = from_days(part["date"])
+            _, mode = merge_bars(code, part, store_dir, source)
+            modes[mode] += 1
+            continue
+
+        _write_tail(code, meta, meta["rows"], part, store_dir, source, record=False)
+        records.append(_manifest_row(code, store_dir, source))
+        modes["append"] += 1
+
+    manifest.record_many(store_dir, records)
+    return modes
+
+
+def rebuild_manifest(store_dir: Path = STORE_DIR) -> int:
+    """按现有 meta 重建清单（旧存储 / 清单丢失时用），返回只数"""
+    codes = list_codes(store_dir)
+    manifest.record_many(store_dir, [_manifest_row(code, store_dir, None) for code in codes])
+    return len(codes)
+
+
+# =========================
+# 全市场载入
+# =========================
+
+def load_universe(
+        codes,
+        columns=None,
+        store_dir: Path = STORE_DIR,
+) -> tuple[list, dict, np.ndarray]:
+    """一次载入多只股票的指定列
+
+    返回 (loaded_codes, arrays, offsets)：
+    - arrays[col] 为所有股票首尾相接的一维数组
+    - 第 i 只股票的数据是 arrays[col][offsets[i]:offsets[i + 1]]
+    """
+    columns = columns or list(COLUMNS)
+    loaded = []
+    parts = {col: [] for col in columns}
+
+    for code in dict.fromkeys(codes):
+        arrays = read_columns(code, columns, store_dir)
+        if arrays is None:
+            continue
+        loaded.append(code)
+        for col in columns:
+            parts[col].append(arrays[col])
+
+    lengths = [len(p) for p in parts[columns[0]]]
+    offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+
+    merged = {}
+    for col in columns:
+        if parts[col]:
+            merged[col] = np.concatenate(parts[col])
+        else:
+            merged[col] = np.empty(0, dtype=COLUMNS[col])
+
+    return loaded, merged, offsets
@@ -0,0 +1,88 @@
+# bench/kline_parse.py
+"""
+klines 解析基准：逐行 dict 解析（旧） vs kline_parser 批量解析（新）
+
+用法（仓库根目录）：
+    python -m bench.kline_parse
+    python -m bench.kline_parse --bars 6000 --repeat 50
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from kline_parser import parse_klines
+
+PAYLOAD = Path("data/manual/stocks/000157.json")
+
+
+def parse_per_row(klines: list) -> pd.DataFrame:
+    """旧实现：每根 K 线一个 dict + 逐字段 float()，只保留 OHLCV"""
+    rows = []
+    for line in klines:
+        parts = line.split(",")
+        if len(parts) < 6:
+            continue
+
+        rows.append({
+            "date": parts[0],
+            "open": float(parts[1]),
+            "close": float(parts[2]),
+            "high": float(parts[3]),
+            "low": float(parts[4]),
+            "volume": float(parts[5]),
+        })
+
+    return pd.DataFrame(rows)
+
+
+def parse_bulk(klines: list) -> pd.DataFrame:
+    return pd.DataFrame(parse_klines(klines))
+
+
+def best_of(fn, klines: list, repeat: int) -> float:
+    """多次运行取最快（毫秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(klines)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def load_klines(payload: Path, bars: int | None) -> list:
+    """读取录制 payload；bars 超过录制长度时循环平铺"""
+    with open(payload, "r", encoding="utf-8") as f:
+        klines = json.load(f)["data"]["klines"]
+
+    if bars is None:
+        return klines
+    return (klines * (bars // len(klines) + 1))[:bars]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="klines 解析基准")
+    parser.add_argument("--payload", type=Path, default=PAYLOAD)
+    parser.add_argument("--bars", type=int, default=6000, help="平铺到的 K 线根数")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    klines = load_klines(args.payload, args.bars)
+
+    # 结果一致性（旧解析只有 OHLCV）
+    old = parse_per_row(klines)
+    new = parse_bulk(klines)
+    for col in ["open", "close", "high", "low", "volume"]:
+        assert np.array_equal(old[col].to_numpy(), new[col].to_numpy()), col
+
+    old_ms = best_of(parse_per_row, klines, args.repeat)
+    new_ms = best_of(parse_bulk, klines, args.repeat)
+
+    print(f"📦 {args.payload.name}：{len(klines)} 根 K 线")
+    print(f"🐢 逐行解析（6 列）：{old_ms:.2f} ms")
+    print(f"🚀 批量解析（11 列）：{new_ms:.2f} ms")
+    print(f"⚡ 加速：{old_ms / new_ms:.1f}x")
@@ -0,0 +1,361 @@
+# bench/pipeline.py
+"""
+全链路基准：合成市场 → 各热点阶段计时 → 写入历史并检查回退
+
+阶段（与生产脚本一一对应）：
+- csv_load          read_csv + 日期解析（migrate_csv_to_store.py 的读入）
+- migrate           write_bars（历史部分，留出最后 --update-days 个交易日给更新阶段；
+                    有 JSON 的代码历史取自 JSON，带涨跌额）
+- adj_factor        本地 mock 拉后复权 JSON，与存储的不复权收盘相除得除权事件（adj_factor.sync_from_eastmoney）
+- manual_merge      Eastmoney JSON 解析 + merge_bars（parse_manual_data.py）
+- http_update       本地 mock + EastmoneySource 并发拉取 + merge_bars（update_data_direct_http.py）
+- by_date_update    读交易日快照 + append_many（update_by_date.py）
+- load_panel        列式存储 → 长表面板 + 后复权（run_market_scan.py，按分片）
+- weekly_scan       周线 resample + MA + 判定（scan_weekly_trend_up，按分片）
+- stream_scan       流式扫描（只读尾部，单一 WEEKLY_TREND_UP）
+- signal_scan       全部已注册信号同一遍（run_market_scan.py 默认路径）
+- state_build       首次增量扫描（为每只股票建周线状态）
+- state_scan        再次增量扫描（无新数据，只读 meta）
+- breadth           全历史市场宽度（breadth.py --rebuild）
+- build_universe    成分股合并 / 去重 / 去 ST（build_universe.py）
+
+每次运行追加一条记录到 --history（参数、提交、各阶段秒数）；
+与相同参数的历史中位数比，慢 REGRESSION_RATIO 以上且绝对差超过 REGRESSION_MIN_SEC 时告警。
+
+用法（仓库根目录）：
+    python -m bench.pipeline                               # 默认 1000 只 × 10 年
+    python -m bench.pipeline --symbols 5000 --years 20     # 全市场量级
+    python -m bench.pipeline --fail-on-regression          # 有回退时退出码 1
+"""
+
+import argparse
+import json
+import shutil
+import statistics
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from adj_factor import sync_from_eastmoney
+from bar_store import append_many, merge_bars, write_bars
+from bench.synth_market import GENERATOR_VERSION, SEED, SYMBOLS, YEARS, market_days, write_market
+from breadth import update_breadth
+from build_universe import build_universe
+from data_sources import EastmoneySource, ManualSource, normalize
+from mock_eastmoney_server import serve
+from scan_engine import SHARD_SIZE, load_panel, scan_incremental, scan_streaming, scan_weekly_trend_up
+from signals import SignalParams, scan_signals
+from update_by_date import read_snapshot, write_snapshot
+
+WORK_DIR = Path("bench/work")
+HISTORY_FILE = Path("bench/history.json")
+
+JSON_SYMBOLS = 400          # 写 Eastmoney JSON 的只数（一半手工合并，一半走 HTTP）
+UPDATE_DAYS = 5             # 留给更新阶段的交易日数
+MA_WINDOW = 20
+MIN_LIST_DAYS = 120
+
+REGRESSION_RATIO = 0.25     # 比历史中位数慢 25% 以上
+REGRESSION_MIN_SEC = 0.05   # 且绝对差超过 50ms（过滤小阶段的抖动）
+
+
+class Timer:
+    """按阶段累计耗时（同一阶段可多次进入，如按分片）"""
+
+    def __init__(self):
+        self.seconds = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - started
+
+
+@contextmanager
+def mock_server(manual_dir: Path):
+    """后台线程跑本地 Eastmoney mock，产出 base_url"""
+    server = serve(0, manual_dir)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def git_commit() -> str:
+    """当前提交（短哈希；工作区有改动时加 -dirty）"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "-uno"], capture_output=True, text=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty.strip() else "")
+
+
+# =========================
+# 1. 准备合成市场（按参数缓存）
+# =========================
+
+def prepare_market(params: dict, work_dir: Path) -> Path:
+    """合成市场目录；相同参数已生成过则直接复用"""
+    market_dir = work_dir / (
+        f"market-v{params['generator']}-{params['symbols']}x{params['years']}"
+        f"-s{params['seed']}-j{params['json_symbols']}"
+    )
+    done = market_dir / "params.json"
+    if done.exists():
+        return market_dir
+
+    shutil.rmtree(market_dir, ignore_errors=True)
+    print(f"🧪 生成合成市场：{params['symbols']} 只 × {params['years']} 年 ...")
+    info = write_market(market_dir, params["symbols"], params["years"], params["seed"], params["json_symbols"])
+    print(f"   {info['rows']} 根 K 线，{info['seconds']:.1f}s")
+    done.write_text(json.dumps(params), encoding="utf-8")
+    return market_dir
+
+
+# =========================
+# 2. 各阶段
+# =========================
+
+def run_stages(market_dir: Path, run_dir: Path, params: dict, timer: Timer) -> dict:
+    """依次跑全部阶段，返回各阶段处理量（行 / 只 / 请求）"""
+    store_dir = run_dir / "bars"
+    snapshot_dir = run_dir / "snapshots"
+    manual_dir = market_dir / "manual"
+    counts = {}
+
+    days = market_days(params["years"])
+    cutoff = days[-params["update_days"] - 1]
+    start_date = (cutoff + pd.Timedelta(days=1)).strftime("%Y%m%d")
+
+    json_codes = sorted(p.stem for p in manual_dir.glob("*.json"))
+    json_source = ManualSource(manual_dir)
+    manual_codes = set(json_codes[:len(json_codes) // 2])
+    http_codes = set(json_codes[len(json_codes) // 2:])
+
+    # -------------------------
+    # CSV 读入 + 写历史（留出尾部）
+    # -------------------------
+    csv_files = sorted((market_dir / "stocks").glob("*.csv"))
+    tails = []
+    rows = 0
+    for csv_path in csv_files:
+        code = csv_path.stem
+        with timer.stage("csv_load"):
+            df = pd.read_csv(csv_path)
+            df["date"] = pd.to_datetime(df["date"])
+        rows += len(df)
+
+        if code in manual_codes or code in http_codes:
+            df = json_source.fetch(code).drop(columns="code")
+        else:
+            tails.append(df[df["date"] > cutoff].assign(code=code))
+        history = df[df["date"] <= cutoff]
+        with timer.stage("migrate"):
+            write_bars(code, history, store_dir, source="csv")
+    counts["csv_load"] = counts["migrate"] = rows
+
+    # 尾部按交易日录成快照（不计时，对应 update_by_date 录制的当日全市场）
+    # 全部股票都写了 JSON（--symbols <= --json-symbols）时没有尾部，按交易日更新为空
+    if tails:
+        market_tail = normalize(pd.concat(tails, ignore_index=True))
+        for day, part in market_tail.groupby("date"):
+            write_snapshot(snapshot_dir, day.strftime("%Y%m%d"), part)
+
+    # -------------------------
+    # 手工 JSON 合并
+    # -------------------------
+    source = ManualSource(manual_dir)
+    with timer.stage("manual_merge"):
+        for code, batch, error in source.fetch_batch([(code, start_date) for code in sorted(manual_codes)]):
+            if error is None and not batch.empty:
+                merge_bars(code, batch, store_dir, source=source.name)
+    counts["manual_merge"] = len(manual_codes)
+
+    # -------------------------
+    # HTTP 更新（本地 mock，无限速 / 无注入失败）
+    # -------------------------
+    with mock_server(manual_dir) as base_url:
+        source = EastmoneySource(concurrency=8, rate=1e6, burst=64, base_url=base_url)
+        with timer.stage("http_update"):
+            for code, batch, error in source.fetch_batch([(code, start_date) for code in sorted(http_codes)]):
+                if error is None and not batch.empty:
+                    merge_bars(code, batch, store_dir, source=source.name)
+    counts["http_update"] = len(http_codes)
+
+    # -------------------------
+    # 按交易日更新
+    # -------------------------
+    with timer.stage("by_date_update"):
+        frames = [read_snapshot(snapshot_dir, day.strftime("%Y%m%d")) for day in days[-params["update_days"]:]]
+        frames = [f for f in frames if f is not None]
+        if frames:
+            batch = pd.concat(frames, ignore_index=True)
+            append_many(batch, store_dir, source="snapshot")
+    counts["by_date_update"] = sum(len(f) for f in frames)
+
+    # -------------------------
+    # 复权因子 + 全市场扫描（按分片，与 scan_universe 相同的内存上限）
+    # -------------------------
+    codes = [p.stem for p in csv_files]
+    with mock_server(manual_dir) as base_url, timer.stage("adj_factor"):
+        sync_from_eastmoney(json_codes, store_dir, base_url, concurrency=8, rate=1e6)
+    counts["adj_factor"] = len(json_codes)
+
+    hits = 0
+    for i in range(0, len(codes), SHARD_SIZE):
+        shard = codes[i:i + SHARD_SIZE]
+        with timer.stage("load_panel"):
+            panel = load_panel(shard, store_dir, "hfq")
+        with timer.stage("weekly_scan"):
+            hits += len(scan_weekly_trend_up(panel, MA_WINDOW, MIN_LIST_DAYS))
+        del panel
+    counts["load_panel"] = counts["weekly_scan"] = len(codes)
+
+    with timer.stage("stream_scan"):
+        streamed = scan_streaming(codes, store_dir, MA_WINDOW, MIN_LIST_DAYS, adjust=True)
+    counts["stream_scan"] = len(codes)
+
+    with timer.stage("signal_scan"):
+        table = scan_signals(codes, store_dir, None, SignalParams(MA_WINDOW, MIN_LIST_DAYS), adjust="hfq")
+    counts["signal_scan"] = len(codes)
+
+    with timer.stage("state_build"):
+        built = scan_incremental(codes, store_dir, MA_WINDOW, MIN_LIST_DAYS, adjust=True)
+    with timer.stage("state_scan"):
+        again = scan_incremental(codes, store_dir, MA_WINDOW, MIN_LIST_DAYS, adjust=True)
+    counts["state_build"] = counts["state_scan"] = len(codes)
+    trend_up = int(table["WEEKLY_TREND_UP"].sum())
+    if not (len(built) == len(again) == len(streamed) == trend_up == hits):
+        print(
+            f"⚠️ 扫描结果不一致：全量 {hits} / 流式 {len(streamed)} / 多信号 {trend_up} / "
+            f"增量首建 {len(built)} / 增量 {len(again)}"
+        )
+    counts["hits"] = hits
+
+    # -------------------------
+    # 宽度 & universe
+    # -------------------------
+    with timer.stage("breadth"):
+        series = update_breadth(store_dir, run_dir / "breadth.csv", rebuild=True)
+    counts["breadth"] = len(series)
+
+    universe_dir = market_dir / "universe"
+    with timer.stage("build_universe"):
+        frames = [pd.read_csv(universe_dir / f"{name}.csv", dtype=str) for name in ["hs300", "dividend"]]
+        universe = build_universe(frames)
+    counts["build_universe"] = len(universe)
+
+    return counts
+
+
+# =========================
+# 3. 历史 & 回退检查
+# =========================
+
+def load_history(path: Path) -> list:
+    if not path.exists():
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def find_regressions(record: dict, history: list) -> list:
+    """与相同参数历史记录的各阶段中位数比较，返回 [(阶段, 本次, 中位数)]"""
+    same = [r for r in history if r["params"] == record["params"]]
+    regressions = []
+    for name, seconds in record["stages"].items():
+        past = [r["stages"][name] for r in same if name in r["stages"]]
+        if not past:
+            continue
+        baseline = statistics.median(past)
+        if seconds > baseline * (1 + REGRESSION_RATIO) and seconds - baseline > REGRESSION_MIN_SEC:
+            regressions.append((name, seconds, baseline))
+    return regressions
+
+
+def save_history(path: Path, history: list) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(history, f, ensure_ascii=False, indent=1)
+    tmp_path.replace(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="全链路基准（合成市场）")
+    parser.add_argument("--symbols", type=int, default=SYMBOLS)
+    parser.add_argument("--years", type=int, default=YEARS)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--json-symbols", type=int, default=JSON_SYMBOLS, help="写 Eastmoney JSON 的只数")
+    parser.add_argument("--update-days", type=int, default=UPDATE_DAYS, help="留给更新阶段的交易日数")
+    parser.add_argument("--work-dir", type=Path, default=WORK_DIR)
+    parser.add_argument("--history", type=Path, default=HISTORY_FILE)
+    parser.add_argument("--no-record", action="store_true", help="不写入历史")
+    parser.add_argument("--fail-on-regression", action="store_true", help="有回退时退出码 1")
+    args = parser.parse_args()
+
+    params = {
+        "generator": GENERATOR_VERSION,
+        "symbols": args.symbols,
+        "years": args.years,
+        "seed": args.seed,
+        "json_symbols": min(args.json_symbols, args.symbols),
+        "update_days": args.update_days,
+    }
+
+    market_dir = prepare_market(params, args.work_dir)
+    run_dir = args.work_dir / "run"
+    shutil.rmtree(run_dir, ignore_errors=True)
+
+    timer = Timer()
+    started = time.perf_counter()
+    counts = run_stages(market_dir, run_dir, params, timer)
+    total = time.perf_counter() - started
+
+    # -------------------------
+    # 报告
+    # -------------------------
+    print(f"\n📊 {params['symbols']} 只 × {params['years']} 年（{counts['csv_load']} 根 K 线）")
+    for name, seconds in timer.seconds.items():
+        n = counts.get(name)
+        rate = f"{n / seconds:>12,.0f} /s" if n and seconds else ""
+        print(f"   {name:<16}{seconds:>9.3f}s {rate}")
+    print(f"   {'total':<16}{total:>9.3f}s")
+    print(f"🎯 命中：{counts['hits']} 只")
+
+    record = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "params": params,
+        "stages": {name: round(seconds, 4) for name, seconds in timer.seconds.items()},
+        "counts": counts,
+        "total": round(total, 4),
+    }
+
+    history = load_history(args.history)
+    regressions = find_regressions(record, history)
+    for name, seconds, baseline in regressions:
+        print(f"⚠️ 回退：{name} {seconds:.3f}s（历史中位数 {baseline:.3f}s，+{seconds / baseline - 1:.0%}）")
+    if not regressions and any(r["params"] == params for r in history):
+        print("✅ 无回退")
+
+    if not args.no_record:
+        save_history(args.history, history + [record])
+        print(f"📁 已记录：{args.history}（{len(history) + 1} 条）")
+
+    if regressions and args.fail_on_regression:
+        raise SystemExit(1)
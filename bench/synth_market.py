@@ -0,0 +1,193 @@
+# bench/synth_market.py
+"""
+合成 A 股日线市场（基准 / 压测用）
+
+- 几何随机游走价格，价格保留 2 位小数，带 11 个 Eastmoney 字段
+- 上市日期随机（有的股票历史很短），少量停牌（成交量为 0 / 缺日）
+- 约每年一次除权除息：不复权价向下跳空，涨跌额相对不复权前收（与真实接口 fqt=0 一致）
+- 输出三种现有布局：
+    {out}/stocks/{code}.csv           与 data/stocks 相同（date,open,high,low,close,volume）
+    {out}/manual/{code}.json          与 data/manual/stocks 相同的 Eastmoney 原始 JSON
+    {out}/manual/hfq/{code}.json      同一只的后复权 JSON（fqt=2，adj_factor.py 经 mock 拉取）
+    {out}/universe/{hs300,dividend}.csv  成分股表（含少量 ST）
+
+用法（仓库根目录）：
+    python -m bench.synth_market --symbols 5000 --years 20 --out bench/work/market
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SYMBOLS = 1000
+YEARS = 10
+END_DATE = "2026-01-30"
+SEED = 0
+DIVIDEND_RATE = 1 / 250     # 每根 K 线发生除权除息的概率
+GENERATOR_VERSION = 3       # 生成逻辑变化时加一（基准缓存 & 历史按它区分）
+
+CSV_COLUMNS = ["date", "open", "high", "low", "close", "volume"]
+KLINE_COLUMNS = [
+    "date", "open", "close", "high", "low", "volume", "amount", "amplitude", "pct_chg", "change", "turnover",
+]
+
+
+def market_days(years: int, end_date: str = END_DATE) -> pd.DatetimeIndex:
+    """工作日近似交易日，去掉每年春节前后一周"""
+    end = pd.Timestamp(end_date)
+    days = pd.bdate_range(end - pd.DateOffset(years=years), end)
+    spring = (days.month == 2) & (days.day >= 10) & (days.day <= 17)
+    return days[~spring]
+
+
+def symbol_codes(n: int) -> list:
+    """沪深各半：600000 起 / 000001 起"""
+    half = n // 2
+    return [f"{600000 + i:06d}" for i in range(half)] + [f"{1 + i:06d}" for i in range(n - half)]
+
+
+def generate_symbol(code: str, days: pd.DatetimeIndex, rng: np.random.Generator) -> pd.DataFrame:
+    """单只股票全部 11 个字段 + hfq_factor（后复权因子，只用于写后复权 JSON）"""
+    start = int(rng.integers(0, len(days) // 2)) if rng.random() < 0.7 else 0
+    d = days[start:]
+    if rng.random() < 0.1:
+        d = d[rng.random(len(d)) > 0.03]      # 零星停牌缺日
+
+    n = len(d)
+    base = rng.uniform(3, 60)
+    gaps = np.where(rng.random(n) < DIVIDEND_RATE, rng.uniform(0.95, 0.995, n), 1.0)
+    gaps[0] = 1.0
+    close = np.round(base * np.exp(np.cumsum(rng.normal(0.0002, 0.02, n))) * np.cumprod(gaps), 2)
+    prev_close = np.concatenate([[close[0]], close[:-1]])
+    prev = np.where(gaps < 1, np.round(prev_close * gaps, 2), prev_close)     # 除权参考价
+    open_ = np.round(prev * (1 + rng.normal(0, 0.005, n)), 2)
+    high = np.round(np.maximum(open_, close) * (1 + rng.uniform(0, 0.02, n)), 2)
+    low = np.round(np.minimum(open_, close) * (1 - rng.uniform(0, 0.02, n)), 2)
+    volume = rng.integers(1_000, 2_000_000, n).astype(np.float64)
+    if rng.random() < 0.03:
+        volume[-10:] = 0                     # 近期停牌
+
+    change = np.round(close - prev_close, 2)
+    return pd.DataFrame({
+        "date": d,
+        "open": open_,
+        "close": close,
+        "high": high,
+        "low": low,
+        "volume": volume,
+        "amount": np.round(volume * close * 100, 2),
+        "amplitude": np.round((high - low) / prev_close * 100, 2),
+        "pct_chg": np.round(change / prev_close * 100, 2),
+        "change": change,
+        "turnover": np.round(rng.uniform(0.1, 5, n), 2),
+        "hfq_factor": np.cumprod(prev_close / prev),
+    })
+
+
+def generate_market(n_symbols: int = SYMBOLS, years: int = YEARS, seed: int = SEED):
+    """逐只产出 (code, DataFrame)，内存里同一时刻只有一只"""
+    rng = np.random.default_rng(seed)
+    days = market_days(years)
+    for code in symbol_codes(n_symbols):
+        yield code, generate_symbol(code, days, rng)
+
+
+# =========================
+# 写出现有布局
+# =========================
+
+def write_csv(df: pd.DataFrame, path: Path) -> None:
+    df[CSV_COLUMNS].to_csv(path, index=False, date_format="%Y-%m-%d")
+
+
+def to_eastmoney_json(code: str, df: pd.DataFrame) -> dict:
+    """还原 Eastmoney K 线接口的原始返回"""
+    table = df[KLINE_COLUMNS].assign(date=df["date"].dt.strftime("%Y-%m-%d"))
+    klines = table.astype(str).agg(",".join, axis=1).tolist()
+    return {
+        "rc": 0,
+        "data": {
+            "code": code,
+            "market": 1 if code.startswith("6") else 0,
+            "name": f"合成{code}",
+            "decimal": 2,
+            "dktotal": len(klines),
+            "klines": klines,
+        },
+    }
+
+
+def to_hfq(df: pd.DataFrame) -> pd.DataFrame:
+    """后复权价（价格 × 因子，保留 2 位；涨跌额 / 涨跌幅相对后复权前收）"""
+    out = df.copy()
+    for col in ["open", "close", "high", "low"]:
+        out[col] = np.round(df[col] * df["hfq_factor"], 2)
+    prev_close = np.concatenate([out["close"].to_numpy()[:1], out["close"].to_numpy()[:-1]])
+    out["change"] = np.round(out["close"] - prev_close, 2)
+    out["pct_chg"] = np.round(out["change"] / prev_close * 100, 2)
+    return out
+
+
+def write_json(code: str, df: pd.DataFrame, path: Path) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(to_eastmoney_json(code, df), f, ensure_ascii=False)
+
+
+def write_universe(codes: list, out_dir: Path, seed: int = SEED) -> None:
+    """两张成分股表（有重叠、约 2% ST）"""
+    rng = np.random.default_rng(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for name, size in [("hs300", 300), ("dividend", 100)]:
+        picked = sorted(rng.choice(codes, size=min(size, len(codes)), replace=False))
+        names = [f"ST合成{c}" if rng.random() < 0.02 else f"合成{c}" for c in picked]
+        pd.DataFrame({"code": picked, "name": names}).to_csv(out_dir / f"{name}.csv", index=False)
+
+
+def write_market(
+        out_dir: Path,
+        n_symbols: int = SYMBOLS,
+        years: int = YEARS,
+        seed: int = SEED,
+        json_symbols: int | None = None,
+) -> dict:
+    """生成并写出全部布局，返回 {"symbols", "rows", "seconds"}
+
+    json_symbols：只为前 N 只写 Eastmoney JSON（JSON 体积大），None = 全部
+    """
+    started = time.perf_counter()
+    stocks_dir = out_dir / "stocks"
+    manual_dir = out_dir / "manual"
+    stocks_dir.mkdir(parents=True, exist_ok=True)
+    (manual_dir / "hfq").mkdir(parents=True, exist_ok=True)
+
+    codes = []
+    rows = 0
+    for i, (code, df) in enumerate(generate_market(n_symbols, years, seed)):
+        write_csv(df, stocks_dir / f"{code}.csv")
+        if json_symbols is None or i < json_symbols:
+            write_json(code, df, manual_dir / f"{code}.json")
+            write_json(code, to_hfq(df), manual_dir / "hfq" / f"{code}.json")
+        codes.append(code)
+        rows += len(df)
+
+    write_universe(codes, out_dir / "universe", seed)
+    return {"symbols": len(codes), "rows": rows, "seconds": time.perf_counter() - started}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="合成 A 股日线市场")
+    parser.add_argument("--symbols", type=int, default=SYMBOLS)
+    parser.add_argument("--years", type=int, default=YEARS)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--json-symbols", type=int, help="只为前 N 只写 Eastmoney JSON")
+    parser.add_argument("--out", type=Path, default=Path("bench/work/market"))
+    args = parser.parse_args()
+
+    info = write_market(args.out, args.symbols, args.years, args.seed, args.json_symbols)
+    print(f"🧪 {info['symbols']} 只 × {args.years} 年，共 {info['rows']} 根 K 线")
+    print(f"⏱ 耗时：{info['seconds']:.1f}s")
+    print(f"📁 输出目录：{args.out}")
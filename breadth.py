@@ -0,0 +1,271 @@
+# breadth.py
+"""
+本地市场宽度（替代远程 stock_market_activity_legu）
+
+从 data/bars 的日线面板一次向量化算出每个交易日的（收盘按后复权比较，除权日不算下跌 / 新低；
+没同步复权因子的股票按不复权，先运行 adj_factor.py，同步后用 --rebuild 重算历史）：
+- total          当日有收盘的股票数
+- advances       上涨家数（收盘 > 该股票上一根收盘）
+- declines       下跌家数
+- unchanged      平盘家数
+- up_ratio       advances / total
+- above_ma       收盘高于周线 MA20 的家数（当周未走完时用当日收盘作本周收盘，与扫描口径一致）
+- above_ma_pct   above_ma / 有周线 MA20 的家数
+- new_highs      收盘创 NEW_HIGH_DAYS 根新高的家数
+- new_lows       收盘创 NEW_HIGH_DAYS 根新低的家数
+
+结果存为 data/breadth/breadth.csv（每个交易日一行）：
+- 闸门不依赖网络、结果确定
+- 可以按历史日期回测闸门
+- 按批读取（批次按 --max-rss-mb 自适应）；增量补算时每只只读尾部切片，不载入整段历史
+
+闸门取 latest_complete()：最新一日有收盘的股票数不到近 COVERAGE_DAYS 日中位数的 MIN_COVERAGE
+（盘中 / 只更新了一部分股票）时，退回最近一个覆盖完整的交易日
+
+用法：
+    python breadth.py             # 只补算新交易日（尾部约两年重算）
+    python breadth.py --rebuild   # 全历史重算
+"""
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import adj_factor
+from bar_store import PRICE_DECIMALS, STORE_DIR, from_days, is_etf, list_codes, read_columns, restore_prices
+from scan_engine import MAX_RSS_MB, STREAM_BATCH, RssGuard
+
+BREADTH_FILE = Path("data/breadth/breadth.csv")
+
+MA_WEEKS = 20             # 周线 MA20
+NEW_HIGH_DAYS = 250       # 新高 / 新低回看根数（约一年）
+TAIL_DAYS = 730           # 增量补算时回看的自然日（覆盖 MA20 周 & 250 根新高）
+MIN_COVERAGE = 0.8        # 当日有收盘的股票数 / 近 COVERAGE_DAYS 日中位数，低于此视为数据不全
+COVERAGE_DAYS = 20
+
+PRICE_SCALE = 10 ** PRICE_DECIMALS
+
+COLUMNS = [
+    "date", "total", "advances", "declines", "unchanged", "up_ratio",
+    "above_ma", "above_ma_pct", "new_highs", "new_lows",
+]
+
+
+# =========================
+# 1. 计算（一次向量化）
+# =========================
+
+def _weekly_ma_asof(days: np.ndarray, close: np.ndarray, group: np.ndarray, n_groups: int) -> np.ndarray:
+    """每根日线「截至当日」的周线 MA：前 MA_WEEKS - 1 个完整周收盘 + 当日收盘
+
+    整数报价单位求和，均线精确；窗口内有整周缺失（停牌）时为 NaN
+    """
+    week = (days + 3) // 7                  # 1970-01-01 周四；同一自然周（周一 ~ 周日）同一编号
+    week0 = week.min()
+    n_weeks = int(week.max() - week0) + 1
+    wk = week - week0
+
+    # 每只股票每周最后一个非空收盘 →「周 × 代码」整数矩阵
+    valid = ~np.isnan(close)
+    ticks = np.zeros(len(close), dtype=np.int64)
+    ticks[valid] = np.round(close[valid] * PRICE_SCALE).astype(np.int64)
+
+    keys = group[valid].astype(np.int64) * n_weeks + wk[valid]
+    last = np.flatnonzero(np.append(keys[1:] != keys[:-1], True))
+    weekly = np.zeros(n_groups * n_weeks, dtype=np.int64)
+    has = np.zeros(n_groups * n_weeks, dtype=bool)
+    weekly[keys[last]] = ticks[valid][last]
+    has[keys[last]] = True
+    weekly = weekly.reshape(n_groups, n_weeks)
+    has = has.reshape(n_groups, n_weeks)
+
+    # 截至第 w - 1 周的 MA_WEEKS - 1 周前缀和
+    k = MA_WEEKS - 1
+    csum = np.concatenate([np.zeros((n_groups, 1), dtype=np.int64), np.cumsum(weekly, axis=1)], axis=1)
+    cnt = np.concatenate([np.zeros((n_groups, 1), dtype=np.int64), np.cumsum(has, axis=1)], axis=1)
+    lo = np.maximum(wk - k, 0)
+    prev_sum = csum[group, wk] - csum[group, lo]
+    prev_cnt = cnt[group, wk] - cnt[group, lo]
+
+    ok = valid & (wk >= k) & (prev_cnt == k)
+    ma = np.full(len(close), np.nan)
+    ma[ok] = (prev_sum[ok] + ticks[ok]) / (PRICE_SCALE * MA_WEEKS)
+    return ma
+
+
+def _read_since(code: str, store_dir: Path, from_day: int | None, events=None) -> tuple | None:
+    """单只 from_day 及之后的 (日期, 后复权收盘)：memmap 上二分定位，只拷贝尾部切片
+
+    events 为 None（没有复权因子）时收盘不复权
+    """
+    arrays = read_columns(code, ["date", "close"], store_dir)
+    if arrays is None:
+        return None
+    lo = int(np.searchsorted(arrays["date"], from_day)) if from_day is not None else 0
+    days = np.array(arrays["date"][lo:], dtype=np.int64)
+    close = restore_prices(arrays["close"][lo:]) * adj_factor.factors(days, events, "hfq")
+    return days, close
+
+
+def _batch_counts(parts: list) -> pd.DataFrame:
+    """一批股票的逐日计数（各股票互不影响，批次之间按日期相加即为全市场）"""
+    counts = np.array([len(p[0]) for p in parts], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    days = np.concatenate([p[0] for p in parts])
+    close = np.concatenate([p[1] for p in parts])
+    group = np.repeat(np.arange(len(parts)), counts)
+    rank = np.arange(len(days)) - np.repeat(offsets[:-1], counts)
+
+    # 涨跌：与该股票上一根 K 线比
+    prev = np.roll(close, 1)
+    prev[rank == 0] = np.nan
+    advance = close > prev
+    decline = close < prev
+    unchanged = close == prev
+
+    # 周线 MA20（截至当日）
+    ma = _weekly_ma_asof(days, close, group, len(parts))
+    has_ma = ~np.isnan(ma)
+    above = close > ma
+
+    # NEW_HIGH_DAYS 根新高 / 新低（含当日）
+    rolled = pd.Series(close).groupby(group, sort=False).rolling(NEW_HIGH_DAYS)
+    high = rolled.max().to_numpy()
+    low = rolled.min().to_numpy()
+    new_high = close >= high
+    new_low = close <= low
+
+    return pd.DataFrame({
+        "date": days,
+        "total": ~np.isnan(close),
+        "advances": advance,
+        "declines": decline,
+        "unchanged": unchanged,
+        "has_ma": has_ma,
+        "above_ma": above,
+        "new_highs": new_high,
+        "new_lows": new_low,
+    }).groupby("date").sum()
+
+
+def compute_breadth(
+        codes=None,
+        store_dir: Path = STORE_DIR,
+        start: str | None = None,
+        batch_size: int = STREAM_BATCH,
+        max_rss_mb: float = MAX_RSS_MB,
+) -> pd.DataFrame:
+    """按日期汇总的宽度时间序列
+
+    start：只输出 start 及之后的日期，每只只读 start 前 TAIL_DAYS 天起的尾部做回看
+    收盘按后复权（adj_factor 事件表）比较；没有因子的股票按不复权
+    按批读取 & 计数（批次按 max_rss_mb 自适应），批次之间按日期相加
+    """
+    # 默认只统计股票（ETF 与股票共用存储，不计入宽度）
+    codes = [code for code in list_codes(store_dir) if not is_etf(code)] if codes is None else list(codes)
+    start_day = int(np.datetime64(start, "D").astype(np.int64)) if start is not None else None
+    from_day = start_day - TAIL_DAYS if start_day is not None else None
+    events = adj_factor.load_events(codes, store_dir)
+
+    guard = RssGuard(max_rss_mb, batch_size)
+    totals = []
+    pos = 0
+    while pos < len(codes):
+        chunk = codes[pos:pos + guard.batch_size]
+        pos += len(chunk)
+        parts = [_read_since(code, store_dir, from_day, events.get(code)) for code in chunk]
+        parts = [p for p in parts if p is not None]
+        if parts and sum(len(p[0]) for p in parts):
+            totals.append(_batch_counts(parts))
+        del parts
+        guard.check()
+
+    if not totals:
+        return pd.DataFrame(columns=COLUMNS)
+
+    out = pd.concat(totals).groupby(level=0).sum()
+    if start_day is not None:
+        out = out[out.index >= start_day]
+
+    out["up_ratio"] = (out["advances"] / out["total"]).round(4)
+    out["above_ma_pct"] = (out["above_ma"] / out["has_ma"]).round(4)
+    out.index = pd.to_datetime(from_days(out.index.to_numpy()))
+    out.index.name = "date"
+    return out.reset_index()[COLUMNS]
+
+
+# =========================
+# 2. 时间序列文件
+# =========================
+
+def load_breadth(breadth_file: Path = BREADTH_FILE) -> pd.DataFrame | None:
+    """读取已保存的宽度序列（date 为 datetime64），不存在返回 None"""
+    if not breadth_file.exists():
+        return None
+    return pd.read_csv(breadth_file, parse_dates=["date"])
+
+
+def update_breadth(
+        store_dir: Path = STORE_DIR,
+        breadth_file: Path = BREADTH_FILE,
+        rebuild: bool = False,
+        max_rss_mb: float = MAX_RSS_MB,
+) -> pd.DataFrame:
+    """补算到存储里的最新交易日并落盘，返回完整序列
+
+    增量：每只只读最后日期前 TAIL_DAYS 天起的尾部，替换最后日期起的行
+    （最后一天可能是盘中数据，每次都重算）
+    """
+    old = None if rebuild else load_breadth(breadth_file)
+
+    if old is None or old.empty:
+        series = compute_breadth(store_dir=store_dir, max_rss_mb=max_rss_mb)
+    else:
+        last = old["date"].iloc[-1]
+        tail = compute_breadth(store_dir=store_dir, start=str(last.date()), max_rss_mb=max_rss_mb)
+        series = pd.concat([old[old["date"] < last], tail], ignore_index=True)
+
+    breadth_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = breadth_file.with_name(breadth_file.name + ".tmp")
+    series.to_csv(tmp_path, index=False, date_format="%Y-%m-%d")
+    os.replace(tmp_path, breadth_file)
+    return series
+
+
+def latest_complete(series: pd.DataFrame) -> tuple[pd.Series | None, int]:
+    """闸门用的一行：最近一个覆盖完整的交易日，返回 (该行, 跳过的最新不完整天数)
+
+    覆盖完整：total 不低于此前 COVERAGE_DAYS 个交易日 total 中位数的 MIN_COVERAGE（最早几天没有参照，视为完整）
+    """
+    if series.empty:
+        return None, 0
+    reference = series["total"].shift(1).rolling(COVERAGE_DAYS, min_periods=1).median()
+    complete = ~(series["total"] < MIN_COVERAGE * reference).to_numpy()
+    last = int(np.flatnonzero(complete)[-1])
+    return series.iloc[last], len(series) - 1 - last
+
+
+def breadth_on(series: pd.DataFrame, day) -> pd.Series | None:
+    """不晚于 day 的最近一行"""
+    rows = series[series["date"] <= pd.Timestamp(day)]
+    return None if rows.empty else rows.iloc[-1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地市场宽度")
+    parser.add_argument("--store-dir", type=Path, default=STORE_DIR)
+    parser.add_argument("--out", type=Path, default=BREADTH_FILE)
+    parser.add_argument("--rebuild", action="store_true", help="全历史重算")
+    parser.add_argument("--max-rss-mb", type=float, default=MAX_RSS_MB, help="常驻内存上限（MB，超过时批次减半）")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    series = update_breadth(args.store_dir, args.out, args.rebuild, args.max_rss_mb)
+
+    print(series.tail(5).to_string(index=False))
+    print(f"\n⏱ 耗时：{time.perf_counter() - started:.2f}s")
+    print(f"📁 输出文件：{args.out}（{len(series)} 天）")
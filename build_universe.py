@@ -5,45 +5,70 @@
 - 去重
 - 去 ST
 - 输出 final_universe.csv
+- --as-of D：改从时点成分股库取 D 日成分股（按当时名称去 ST），输出 final_universe_{D}.csv
 """
 
+import argparse
 from pathlib import Path
 import pandas as pd
-import akshare as ak
+
+from universe_history import HISTORY_FILE, load, universe_on
 
 UNIVERSE_DIR = Path("universe")
 OUTPUT_FILE = UNIVERSE_DIR / "final_universe.csv"
 
-# =========================
-# 1. 读取基础 universe
-# =========================
 
-hs300 = pd.read_csv(UNIVERSE_DIR / "hs300.csv", dtype=str)
-dividend = pd.read_csv(UNIVERSE_DIR / "dividend.csv", dtype=str)
+def build_universe(frames: list) -> pd.DataFrame:
+    """合并多个成分股表（列：code, name）→ 去重、去 ST、按代码排序"""
+    df = pd.concat(frames, ignore_index=True)
+
+    # 去重（以 code 为准）
+    df = df.drop_duplicates(subset=["code"]).reset_index(drop=True)
+
+    # 去 ST（用名称规则，简单有效）
+    df = df[~df["name"].str.contains("ST")]
+
+    return df.sort_values("code")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="合并 & 清洗 universe")
+    parser.add_argument("--as-of", help="取某日的时点成分股（universe/history.csv）")
+    parser.add_argument("--history", type=Path, default=HISTORY_FILE)
+    args = parser.parse_args()
 
-df = pd.concat([hs300, dividend], ignore_index=True)
+    if args.as_of:
+        df = universe_on(load(args.history), args.as_of)
+        out_file = UNIVERSE_DIR / f"final_universe_{args.as_of}.csv"
+        df.to_csv(out_file, index=False, encoding="utf-8-sig")
+        print(f"🕰 {args.as_of} 时点 universe：{len(df)} 只")
+        print(f"📁 文件：{out_file}")
+        exit(0)
 
-# 去重（以 code 为准）
-df = df.drop_duplicates(subset=["code"]).reset_index(drop=True)
+    # =========================
+    # 1. 读取基础 universe
+    # =========================
 
-print(f"📦 合并后股票数（未清洗）：{len(df)}")
+    hs300 = pd.read_csv(UNIVERSE_DIR / "hs300.csv", dtype=str)
+    dividend = pd.read_csv(UNIVERSE_DIR / "dividend.csv", dtype=str)
 
-# =========================
-# 2. 去 ST（用名称规则，简单有效）
-# =========================
+    merged = pd.concat([hs300, dividend], ignore_index=True).drop_duplicates(subset=["code"])
+    print(f"📦 合并后股票数（未清洗）：{len(merged)}")
 
-df = df[~df["name"].str.contains("ST")]
+    # =========================
+    # 2. 去重 & 去 ST & 排序
+    # =========================
 
-print(f"🧹 去 ST 后股票数：{len(df)}")
+    df = build_universe([hs300, dividend])
 
-# =========================
-# 3. 排序 & 输出
-# =========================
+    print(f"🧹 去 ST 后股票数：{len(df)}")
 
-df = df.sort_values("code")
+    # =========================
+    # 3. 输出
+    # =========================
 
-df.to_csv(OUTPUT_FILE, index=False, encoding="utf-8-sig")
+    df.to_csv(OUTPUT_FILE, index=False, encoding="utf-8-sig")
 
-print(f"\n✅ 最终 universe 生成完成")
-print(f"📁 文件：{OUTPUT_FILE}")
-print(f"🎯 最终股票数：{len(df)}")
+    print(f"\n✅ 最终 universe 生成完成")
+    print(f"📁 文件：{OUTPUT_FILE}")
+    print(f"🎯 最终股票数：{len(df)}")
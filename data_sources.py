@@ -0,0 +1,352 @@
+# data_sources.py
+"""
+数据源适配层：akshare / tushare / eastmoney-http / 手工 JSON → 统一日线批次
+
+统一批次（normalize 输出）：
+- 长表，列：code + bar_store.COLUMNS（date, open, high, low, close, volume, amount, ...）
+- code 为 6 位字符串；date 为 datetime64；数值 float64；缺失字段 NaN
+- 单位统一：成交量「手」，成交额「元」，振幅 / 涨跌幅 / 换手率为 %
+- 按 code → date 排序
+
+每个适配器实现（Source 为抽象基类，缺 fetch 的子类无法实例化）：
+- fetch(code, start_date)       单只，返回统一批次
+- fetch_batch(jobs)             多只 [(code, YYYYMMDD)]，逐只产出 (code, 批次, 错误)；基类默认逐只 fetch
+- fetch_trade_date(trade_date)  仅 TradeDateSource 子类（supports_trade_date）：一次拉某交易日全市场
+
+写入统一走 write_batch → bar_store.merge_bars。
+"""
+
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import instrument
+from bar_store import COLUMNS, STORE_DIR, merge_bars
+from kline_fetcher import (
+    BURST,
+    CONCURRENCY,
+    EASTMONEY_BASE_URL,
+    MAX_RETRIES,
+    RATE_PER_SEC,
+    fetch_kline,
+    fetch_many,
+    make_session,
+    market_code,
+)
+from kline_parser import klines_to_df
+from trade_calendar import expected_last_date, trade_dates_between
+
+BATCH_COLUMNS = ["code"] + list(COLUMNS)
+
+# akshare 东财系接口的中文表头
+AKSHARE_COLUMNS = {
+    "日期": "date",
+    "开盘": "open",
+    "收盘": "close",
+    "最高": "high",
+    "最低": "low",
+    "成交量": "volume",
+    "成交额": "amount",
+    "振幅": "amplitude",
+    "涨跌幅": "pct_chg",
+    "涨跌额": "change",
+    "换手率": "turnover",
+}
+
+TUSHARE_COLUMNS = {
+    "trade_date": "date",
+    "vol": "volume",
+}
+TUSHARE_AMOUNT_UNIT = 1000      # tushare 成交额单位为千元
+
+
+# =========================
+# 1. 统一批次
+# =========================
+
+@instrument.timed("normalize")
+def normalize(df: pd.DataFrame, code: str | None = None) -> pd.DataFrame:
+    """任意源的 DataFrame（已改成英文列名）→ 统一批次
+
+    code：单只数据没有 code 列时补上
+    """
+    if df is None or df.empty:
+        return empty_batch()
+
+    out = pd.DataFrame(index=df.index)
+    out["code"] = df["code"].astype(str).str[:6] if "code" in df.columns else code
+    out["date"] = pd.to_datetime(df["date"].astype(str))
+    for col in BATCH_COLUMNS[2:]:
+        if col in df.columns:
+            out[col] = pd.to_numeric(df[col], errors="coerce").astype(np.float64)
+        else:
+            out[col] = np.nan
+
+    return out.sort_values(["code", "date"], kind="stable").reset_index(drop=True)
+
+
+def empty_batch() -> pd.DataFrame:
+    out = pd.DataFrame({col: pd.Series(dtype=np.float64) for col in BATCH_COLUMNS})
+    out["code"] = out["code"].astype(object)
+    out["date"] = out["date"].astype("datetime64[ns]")
+    return out
+
+
+def split_batch(batch: pd.DataFrame):
+    """多只批次 → 逐只 (code, DataFrame)（保持 code 顺序）"""
+    for code, part in batch.groupby("code", sort=False):
+        yield code, part.drop(columns="code").reset_index(drop=True)
+
+
+def write_batch(batch: pd.DataFrame, store_dir: Path = STORE_DIR, source: str | None = None) -> Counter:
+    """统一批次按 code 合并进列式存储，返回各写入方式计数"""
+    modes = Counter()
+    for code, part in split_batch(batch):
+        _, mode = merge_bars(code, part, store_dir, source=source)
+        modes[mode] += 1
+    return modes
+
+
+# =========================
+# 2. 适配器
+# =========================
+
+class Source(ABC):
+    """数据源基类：子类至少实现 fetch"""
+
+    name = ""
+    supports_trade_date = False
+    sleep = 0.0     # 逐只拉取时两次请求之间的间隔（秒）
+
+    @abstractmethod
+    def fetch(self, code: str, start_date: str) -> pd.DataFrame:
+        """单只 start_date（YYYYMMDD）至今的统一批次"""
+
+    def fetch_batch(self, jobs):
+        """默认：逐只 fetch，间隔 sleep 秒；单只失败不影响其他"""
+        for i, (code, start_date) in enumerate(jobs):
+            if i and self.sleep:
+                with instrument.stage("sleep"):
+                    time.sleep(self.sleep)
+            try:
+                with instrument.stage("fetch"):
+                    batch = self.fetch(code, start_date)
+            except Exception as e:
+                yield code, None, e
+                continue
+            yield code, batch, None
+
+
+class TradeDateSource(Source):
+    """能按交易日一次拉全市场的数据源：另须实现 fetch_trade_date"""
+
+    supports_trade_date = True
+
+    @abstractmethod
+    def fetch_trade_date(self, trade_date: str) -> pd.DataFrame:
+        """某交易日（YYYYMMDD）全市场的统一批次"""
+
+
+class AkshareSource(Source):
+    """akshare 东财日线：asset="stock"（stock_zh_a_hist）/ "etf"（fund_etf_hist_em）"""
+
+    name = "akshare"
+
+    def __init__(self, asset: str = "stock", sleep: float = 5.0):
+        self.asset = asset
+        self.sleep = sleep
+        self._ak = None
+
+    @property
+    def ak(self):
+        if self._ak is None:
+            import akshare as ak    # 真正拉取时才导入（很慢）
+            self._ak = ak
+        return self._ak
+
+    def fetch(self, code: str, start_date: str) -> pd.DataFrame:
+        instrument.count("http_calls")
+        if self.asset == "etf":
+            df = self.ak.fund_etf_hist_em(symbol=code, period="daily", start_date=start_date, adjust="")
+        else:
+            df = self.ak.stock_zh_a_hist(symbol=code, period="daily", start_date=start_date, adjust="")
+
+        if df is None or df.empty:
+            return empty_batch()
+        return normalize(df.rename(columns=AKSHARE_COLUMNS), code)
+
+
+class TushareSource(TradeDateSource):
+    """tushare pro daily：单只按 ts_code，全市场按 trade_date"""
+
+    name = "tushare"
+
+    def __init__(self, token: str | None = None, sleep: float = 0.6):
+        self.token = token
+        self.sleep = sleep      # 免费档限频
+        self._pro = None
+
+    @property
+    def pro(self):
+        if self._pro is None:
+            import tushare as ts
+            if self.token:
+                ts.set_token(self.token)
+            self._pro = ts.pro_api()
+        return self._pro
+
+    @staticmethod
+    def ts_code(code: str) -> str:
+        return f"{code}.SH" if market_code(code) == 1 else f"{code}.SZ"
+
+    @staticmethod
+    def _normalize(df: pd.DataFrame, code: str | None = None) -> pd.DataFrame:
+        if df is None or df.empty:
+            return empty_batch()
+        df = df.rename(columns=TUSHARE_COLUMNS)
+        df["amount"] = pd.to_numeric(df["amount"], errors="coerce") * TUSHARE_AMOUNT_UNIT
+        if code is None:
+            df["code"] = df["ts_code"].str[:6]
+        return normalize(df, code)
+
+    def fetch(self, code: str, start_date: str) -> pd.DataFrame:
+        instrument.count("http_calls")
+        df = self.pro.daily(ts_code=self.ts_code(code), start_date=start_date)
+        return self._normalize(df, code)
+
+    def fetch_trade_date(self, trade_date: str) -> pd.DataFrame:
+        """某交易日全市场日线（一次请求）"""
+        instrument.count("http_calls")
+        return self._normalize(self.pro.daily(trade_date=trade_date))
+
+    def fetch_batch(self, jobs):
+        """按请求数最少拆分：起始日较近的一批按交易日拉全市场再分发，其余逐只
+
+        按交易日覆盖起始日 >= s 的 k 只需要「s 至今的交易日数」次请求，
+        剩下的逐只各 1 次；取总请求数最少的 s
+        """
+        jobs = sorted(jobs, key=lambda job: job[1], reverse=True)
+        if not jobs:
+            return
+
+        dates = trade_dates_between(min(s for _, s in jobs), expected_last_date())
+        starts = np.array([np.datetime64(pd.Timestamp(s).date(), "D") for _, s in jobs])
+        n_dates = len(dates) - np.searchsorted(dates, starts)         # 覆盖第 i 只需要的交易日数
+        cost = n_dates + (len(jobs) - 1 - np.arange(len(jobs)))       # 前 i + 1 只按日，其余逐只
+        k = int(np.argmin(cost)) + 1
+        if n_dates[k - 1] >= k:
+            yield from super().fetch_batch(jobs)
+            return
+
+        by_date, single = jobs[:k], jobs[k:]
+        frames = [empty_batch()]
+        try:
+            for i, day in enumerate(dates[len(dates) - n_dates[k - 1]:]):
+                if i and self.sleep:
+                    with instrument.stage("sleep"):
+                        time.sleep(self.sleep)
+                with instrument.stage("fetch"):
+                    frames.append(self.fetch_trade_date(str(day).replace("-", "")))
+        except Exception as e:
+            for code, _ in by_date:
+                yield code, None, e
+        else:
+            market = dict(split_batch(pd.concat(frames, ignore_index=True)))
+            for code, start_date in by_date:
+                part = market.get(code)
+                if part is None:
+                    yield code, empty_batch(), None
+                    continue
+                part = part[part["date"] >= pd.Timestamp(start_date)]
+                part.insert(0, "code", code)
+                yield code, part.reset_index(drop=True), None
+
+        yield from super().fetch_batch(single)
+
+
+class EastmoneySource(Source):
+    """Eastmoney K 线 HTTP 直连：并发 + 令牌桶限速 + 退避重试"""
+
+    name = "eastmoney"
+
+    def __init__(
+            self,
+            concurrency: int = CONCURRENCY,
+            rate: float = RATE_PER_SEC,
+            burst: int = BURST,
+            max_retries: int = MAX_RETRIES,
+            base_url: str = EASTMONEY_BASE_URL,
+    ):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.base_url = base_url
+
+    def fetch(self, code: str, start_date: str) -> pd.DataFrame:
+        with make_session(1) as session:
+            raw = fetch_kline(session, code, start_date, self.base_url)
+        return normalize(klines_to_df(raw), code)
+
+    def fetch_batch(self, jobs):
+        """并发拉取，按完成顺序产出"""
+        results = fetch_many(
+            jobs,
+            concurrency=self.concurrency,
+            rate=self.rate,
+            burst=self.burst,
+            base_url=self.base_url,
+            max_retries=self.max_retries,
+        )
+        for code, raw, error in results:
+            if error is not None:
+                yield code, None, error
+                continue
+            try:
+                yield code, normalize(klines_to_df(raw), code), None
+            except Exception as e:
+                yield code, None, e
+
+
+class ManualSource(Source):
+    """手工下载的 Eastmoney JSON（{manual_dir}/{code}.json）"""
+
+    name = "manual"
+
+    def __init__(self, manual_dir: Path = Path("data/manual/stocks")):
+        self.manual_dir = manual_dir
+
+    def codes(self) -> list:
+        return sorted(p.stem for p in self.manual_dir.glob("*.json"))
+
+    def fetch(self, code: str, start_date: str | None = None) -> pd.DataFrame:
+        with instrument.stage("read_json"):
+            with open(self.manual_dir / f"{code}.json", "r", encoding="utf-8") as f:
+                raw = json.load(f)
+
+        data = raw.get("data")
+        if not data or "klines" not in data:
+            raise ValueError("JSON 中无 klines 数据")
+
+        batch = normalize(klines_to_df(raw), code)
+        if start_date:
+            batch = batch[batch["date"] >= pd.Timestamp(start_date)].reset_index(drop=True)
+        return batch
+
+
+SOURCES = {
+    cls.name: cls
+    for cls in [AkshareSource, TushareSource, EastmoneySource, ManualSource]
+}
+
+
+def make_source(name: str, **kwargs) -> Source:
+    """按名称创建适配器"""
+    if name not in SOURCES:
+        raise ValueError(f"未知数据源: {name}（可选 {', '.join(SOURCES)}）")
+    return SOURCES[name](**kwargs)
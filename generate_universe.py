@@ -4,12 +4,15 @@
 - 沪深300
 - 中证红利
 （稳健适配 AkShare 中文列名）
+- 每次拉取同时记入时点成分股库（universe/history.csv），历史成分不会被覆盖掉
 """
 
 from pathlib import Path
 import akshare as ak
 import pandas as pd
 
+from universe_history import record_snapshot
+
 UNIVERSE_DIR = Path("universe")
 UNIVERSE_DIR.mkdir(exist_ok=True)
 
@@ -32,6 +35,14 @@ def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
         .astype(str)
     )
 
+
+def with_inclusion_date(raw: pd.DataFrame, df: pd.DataFrame) -> pd.DataFrame:
+    """接口带「纳入日期」时一并带上，作为时点库区间的起点"""
+    if "纳入日期" not in raw.columns:
+        return df
+    start = pd.to_datetime(raw["纳入日期"], errors="coerce").dt.strftime("%Y-%m-%d")
+    return df.assign(start=start.to_numpy())
+
 # =========================
 # 1. 沪深300
 # =========================
@@ -43,7 +54,9 @@ hs300_df = normalize_columns(hs300_raw)
 hs300_file = UNIVERSE_DIR / "hs300.csv"
 hs300_df.to_csv(hs300_file, index=False, encoding="utf-8-sig")
 
-print(f"✅ HS300 成分股：{len(hs300_df)} 只")
+changes = record_snapshot("hs300", with_inclusion_date(hs300_raw, hs300_df))
+
+print(f"✅ HS300 成分股：{len(hs300_df)} 只（较上次新进 {changes['added']}，调出 {changes['removed']}）")
 print(f"📁 输出：{hs300_file}")
 
 # =========================
@@ -57,7 +70,9 @@ div_df = normalize_columns(div_raw)
 div_file = UNIVERSE_DIR / "dividend.csv"
 div_df.to_csv(div_file, index=False, encoding="utf-8-sig")
 
-print(f"✅ 中证红利成分股：{len(div_df)} 只")
+changes = record_snapshot("dividend", with_inclusion_date(div_raw, div_df))
+
+print(f"✅ 中证红利成分股：{len(div_df)} 只（较上次新进 {changes['added']}，调出 {changes['removed']}）")
 print(f"📁 输出：{div_file}")
 
 print("\n🎯 Universe 生成完成")
@@ -0,0 +1,358 @@
+# indicator_state.py
+"""
+均线指标增量状态（data/bars/indicator_state.sqlite）
+
+每只股票 × 周期（日 / 周）× 均线窗口 一行状态：
+- 已消化的行数、代数（gen）、首末日期、末根收盘 / 成交量
+- 最近 window + 1 个周期的收盘（按最小报价单位存整数，均线精确）
+- 当前未走完的一周直接作为最后一个周期，随新日线原地更新
+- 最近 N 根成交量（停牌判断）
+
+同步规则（只看 meta + 列文件尾部，不载入整段历史）：
+- 追加新日线           → 逐根推入，O(新增根数)
+- 修订末根（同日期）   → 原地替换最后一个周期，O(1)
+- 代数变化 / 行数回退 / 末根日期对不上（历史被重写）→ 从尾部重建
+- adjust=True 时收盘按后复权（adj_factor.py）：新除权事件只影响之后的价格，
+  状态记下末根的后复权因子，补到了更早的事件（因子对不上）→ 重建
+
+均线由窗口内整数收盘求和得到；与 pandas rolling 只在「收盘价恰好等于均线」时可能不同。
+"""
+
+import json
+import sqlite3
+from collections import Counter
+from contextlib import closing
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+import adj_factor
+from bar_store import PRICE_DECIMALS, STORE_DIR, read_columns, read_meta, restore_prices
+
+STATE_NAME = "indicator_state.sqlite"
+
+PRICE_SCALE = 10 ** PRICE_DECIMALS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS states (
+    code       TEXT NOT NULL,
+    freq       TEXT NOT NULL,
+    ma_window  INTEGER NOT NULL,
+    payload    TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (code, freq, ma_window)
+)
+"""
+
+
+@dataclass
+class MaState:
+    """单只股票、单一周期（"D" 日 / "W" 周）的均线增量状态"""
+    freq: str
+    window: int
+    volume_days: int
+    gen: int = 0
+    rows: int = 0               # 已消化的日线根数
+    first_day: int = 0          # 首根日线（距 1970-01-01 天数）
+    last_day: int = 0           # 末根日线
+    last_close: float = np.nan  # 末根收盘（识别末根修订）
+    last_volume: float = np.nan
+    adj_factor: float = 1.0     # 末根的后复权因子（不复权恒为 1）
+    periods: list = field(default_factory=list)   # 最近 window + 1 个周期：[周期标签, 收盘整数 | None]
+    volumes: list = field(default_factory=list)   # 最近 volume_days 根成交量
+
+
+# =========================
+# 1. 推进 / 修订（O(1)）
+# =========================
+
+def week_end(day: int) -> int:
+    """日期（天数）所在周的周日（与 resample("W") 标签一致）"""
+    # 1970-01-01 是周四：(day + 3) % 7 即周一为 0 的星期
+    return day + 6 - (day + 3) % 7
+
+
+def _ticks(close: float):
+    return None if np.isnan(close) else int(round(close * PRICE_SCALE))
+
+
+def push(state: MaState, day: int, close: float, volume: float) -> None:
+    """推入一根新日线（日期必须晚于 last_day）"""
+    ticks = _ticks(close)
+
+    if state.freq == "D":
+        state.periods.append([day, ticks])
+    else:
+        week = week_end(day)
+        last = state.periods[-1] if state.periods else None
+        if last is not None and last[0] == week:
+            # 同一周：周收盘 = 本周最后一个非空收盘
+            if ticks is not None:
+                last[1] = ticks
+        else:
+            # 跨周：中间整周无数据的周记为空（与 resample 一致）
+            if last is not None:
+                gap = min((week - last[0]) // 7 - 1, state.window + 1)
+                for k in range(gap, 0, -1):
+                    state.periods.append([week - 7 * k, None])
+            state.periods.append([week, ticks])
+
+    del state.periods[:-(state.window + 1)]
+
+    state.volumes.append(float(volume))
+    del state.volumes[:-state.volume_days]
+
+    if state.rows == 0:
+        state.first_day = day
+    state.rows += 1
+    state.last_day = day
+    state.last_close = float(close)
+    state.last_volume = float(volume)
+
+
+def revise_last(state: MaState, close: float, volume: float) -> bool:
+    """原地修订末根；无法原地修订时返回 False（需要重建）"""
+    ticks = _ticks(close)
+    if ticks is None and state.freq == "W":
+        # 周收盘要退回本周更早的一根，状态里没有
+        return False
+
+    state.periods[-1][1] = ticks
+    state.volumes[-1] = float(volume)
+    state.last_close = float(close)
+    state.last_volume = float(volume)
+    return True
+
+
+# =========================
+# 2. 读数
+# =========================
+
+def _mean(window: list) -> float:
+    if not window or any(t is None for t in window):
+        return np.nan
+    return sum(window) / (PRICE_SCALE * len(window))
+
+
+def ma_pair(state: MaState) -> tuple[float, float, float, float]:
+    """(本周期收盘, 本周期均线, 上周期收盘, 上周期均线)，不足时为 NaN"""
+    periods = [t for _, t in state.periods]
+    n = state.window
+
+    def close_at(i):
+        if len(periods) < -i or periods[i] is None:
+            return np.nan
+        return periods[i] / PRICE_SCALE
+
+    this_ma = _mean(periods[-n:]) if len(periods) >= n else np.nan
+    last_ma = _mean(periods[-n - 1:-1]) if len(periods) >= n + 1 else np.nan
+    return close_at(-1), this_ma, close_at(-2), last_ma
+
+
+def cross(state: MaState) -> str:
+    """收盘 / 均线交叉状态：BUY（上穿）/ SELL（下穿）/ HOLD"""
+    this_close, this_ma, last_close, last_ma = ma_pair(state)
+    if this_close > this_ma and last_close <= last_ma:
+        return "BUY"
+    if this_close < this_ma and last_close >= last_ma:
+        return "SELL"
+    return "HOLD"
+
+
+def span_weeks(state: MaState) -> int:
+    """首根到末根跨越的自然周数（含首尾周）"""
+    return (week_end(state.last_day) - week_end(state.first_day)) // 7 + 1
+
+
+def recent_volume(state: MaState) -> float:
+    return float(np.nansum(state.volumes))
+
+
+# =========================
+# 3. 与存储同步
+# =========================
+
+def _closes(arrays: dict, start: int, events) -> list:
+    """第 start 根起的收盘（有除权事件时为后复权价）"""
+    closes = restore_prices(arrays["close"][start:])
+    if events is not None:
+        closes = closes * adj_factor.factors(arrays["date"][start:], events, "hfq")
+    return closes.tolist()
+
+
+def build_state(
+        arrays: dict,
+        freq: str,
+        window: int,
+        volume_days: int,
+        gen: int,
+        events=None,
+) -> MaState:
+    """从已提交的列数组尾部重建（只推入最近 window + 1 个周期涉及的日线）"""
+    days = arrays["date"]
+    n = len(days)
+    state = MaState(freq=freq, window=window, volume_days=volume_days, gen=gen)
+    if n == 0:
+        return state
+
+    if freq == "D":
+        start = n - (window + 1)
+    else:
+        first_week = week_end(int(days[-1])) - 7 * window
+        start = int(np.searchsorted(days, first_week - 6))
+    start = max(min(start, n - volume_days), 0)
+
+    state.rows = start
+    state.first_day = int(days[0])
+
+    closes = _closes(arrays, start, events)
+    volumes = np.asarray(arrays["volume"][start:], dtype=np.float64)
+    for day, close, volume in zip(days[start:].tolist(), closes, volumes.tolist()):
+        push(state, day, close, volume)
+    state.adj_factor = adj_factor.hfq_factor_at(state.last_day, events)
+    return state
+
+
+def sync_state(
+        code: str,
+        state: MaState | None,
+        freq: str,
+        window: int,
+        volume_days: int,
+        store_dir: Path = STORE_DIR,
+        events=None,
+) -> tuple[MaState | None, str]:
+    """把状态推进到存储最新提交，返回 (状态, 方式)
+
+    方式：noop / append / revise / rebuild / missing
+    events：该股票的除权事件（adj_factor.load_events），None = 不复权
+    """
+    meta = read_meta(code, store_dir)
+    if meta is None or meta["rows"] == 0:
+        return None, "missing"
+
+    gen = meta.get("gen", 0)
+    rows = meta["rows"]
+    arrays = read_columns(code, ["date", "close", "volume"], store_dir)
+
+    valid = (
+        state is not None
+        and state.gen == gen
+        and state.volume_days == volume_days
+        and 0 < state.rows <= rows
+        and int(arrays["date"][state.rows - 1]) == state.last_day
+        and state.adj_factor == adj_factor.hfq_factor_at(state.last_day, events)
+    )
+    if not valid:
+        return build_state(arrays, freq, window, volume_days, gen, events), "rebuild"
+
+    mode = "noop"
+    i = state.rows - 1
+    close = _closes(arrays, i, events)[0]
+    volume = float(arrays["volume"][i])
+    if not _same(close, state.last_close) or not _same(volume, state.last_volume):
+        if not revise_last(state, close, volume):
+            return build_state(arrays, freq, window, volume_days, gen, events), "rebuild"
+        mode = "revise"
+
+    if rows > state.rows:
+        days = arrays["date"][state.rows:].tolist()
+        closes = _closes(arrays, state.rows, events)
+        volumes = np.asarray(arrays["volume"][state.rows:], dtype=np.float64).tolist()
+        for day, c, v in zip(days, closes, volumes):
+            push(state, day, c, v)
+        state.adj_factor = adj_factor.hfq_factor_at(state.last_day, events)
+        mode = "append"
+
+    return state, mode
+
+
+def _same(a: float, b: float) -> bool:
+    return a == b or (np.isnan(a) and np.isnan(b))
+
+
+# =========================
+# 4. 持久化
+# =========================
+
+def state_path(store_dir: Path) -> Path:
+    return store_dir / STATE_NAME
+
+
+def _connect(store_dir: Path) -> sqlite3.Connection:
+    store_dir.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(state_path(store_dir), timeout=30)
+    conn.execute(SCHEMA)
+    return conn
+
+
+def load_states(codes, freq: str, window: int, store_dir: Path = STORE_DIR) -> dict:
+    """{code: MaState}；没有状态的代码不出现"""
+    if not state_path(store_dir).exists():
+        return {}
+
+    wanted = set(codes)
+    with closing(_connect(store_dir)) as conn:
+        rows = conn.execute(
+            "SELECT code, payload FROM states WHERE freq = ? AND ma_window = ?",
+            (freq, window),
+        ).fetchall()
+
+    return {code: MaState(**json.loads(payload)) for code, payload in rows if code in wanted}
+
+
+def save_states(states: dict, store_dir: Path = STORE_DIR) -> None:
+    """批量写回（单个事务）"""
+    if not states:
+        return
+
+    now = datetime.now().isoformat(timespec="seconds")
+    records = [
+        (code, s.freq, s.window, json.dumps(asdict(s)), now)
+        for code, s in states.items()
+    ]
+    with closing(_connect(store_dir)) as conn, conn:
+        conn.executemany(
+            """
+            INSERT INTO states (code, freq, ma_window, payload, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(code, freq, ma_window) DO UPDATE SET
+                payload    = excluded.payload,
+                updated_at = excluded.updated_at
+            """,
+            records,
+        )
+
+
+def sync_many(
+        codes,
+        freq: str,
+        window: int,
+        volume_days: int,
+        store_dir: Path = STORE_DIR,
+        adjust: bool = False,
+) -> tuple[dict, Counter]:
+    """载入 → 同步 → 写回变化的状态，返回 ({code: MaState}, 各方式计数)
+
+    adjust：收盘按后复权（均线交叉与前复权相同，且新事件不改历史）
+    """
+    codes = list(dict.fromkeys(codes))
+    states = load_states(codes, freq, window, store_dir)
+    events = adj_factor.load_events(codes, store_dir) if adjust else {}
+
+    synced = {}
+    changed = {}
+    modes = Counter()
+    for code in codes:
+        state, mode = sync_state(code, states.get(code), freq, window, volume_days, store_dir, events.get(code))
+        modes[mode] += 1
+        if state is None:
+            continue
+        synced[code] = state
+        if mode != "noop":
+            changed[code] = state
+
+    save_states(changed, store_dir)
+    return synced, modes
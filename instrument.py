@@ -0,0 +1,226 @@
+# instrument.py
+"""
+轻量运行埋点：阶段计时 + 计数器 + 可选 cProfile / tracemalloc，退出时输出报告
+
+- stage(name)      上下文管理器：累计耗时、调用次数、阶段结束时的 RSS
+- timed(name)      同上，装饰器形式
+- count(name, n)   计数器（读入行数、写入字节、HTTP 请求 / 重试 ...）
+- install(script)  脚本入口调用：按参数开启 cProfile / tracemalloc，退出时打印报告（可另存 JSON）
+
+约定：
+- 全部线程安全；多线程里的同名阶段耗时相加（= 线程耗时之和，可能超过墙钟）
+- 阶段可以嵌套（如 merge 内部的 write），各自独立累计，不做扣减
+- 只统计当前进程；多进程扫描的子进程埋点不回传
+- RSS 读 /proc/self/statm 或 resource（Windows 上都没有），读不到时为 None，报告里显示为 -
+- 未调用 install 时埋点照常累计，只是不输出（开销约 1µs / 次）
+
+用法：
+    python update_data_direct_http.py --report logs/http.json
+    python run_market_scan.py --profile scan.prof --trace-memory
+"""
+
+import atexit
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+PROFILE_TOP = 15        # cProfile 报告显示的函数数
+MEMORY_TOP = 10         # tracemalloc 报告显示的分配位置数
+
+_lock = threading.Lock()
+_stages = {}            # name → {"calls", "seconds", "rss_mb"}
+_counters = Counter()
+_started = time.perf_counter()
+_started_at = datetime.now()
+
+
+# =========================
+# 1. 埋点
+# =========================
+
+def rss_mb() -> float | None:
+    """当前常驻内存（MB）；读不到 /proc 时退回峰值 RSS，都读不到返回 None"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):     # AttributeError：没有 os.sysconf（Windows）
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float | None:
+    """进程峰值常驻内存（MB）；没有 resource 模块（Windows）时返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10    # macOS 单位为字节
+
+
+def round_mb(value: float | None) -> float | None:
+    """MB 数保留一位小数（JSON 用）；读不到为 None"""
+    return None if value is None else round(value, 1)
+
+
+def format_mb(value: float | None) -> str:
+    """MB 数取整显示；读不到为 -"""
+    return "-" if value is None else f"{value:.0f}"
+
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        rss = rss_mb()
+        with _lock:
+            entry = _stages.setdefault(name, {"calls": 0, "seconds": 0.0, "rss_mb": None})
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            if rss is not None:
+                entry["rss_mb"] = rss if entry["rss_mb"] is None else max(entry["rss_mb"], rss)
+
+
+def timed(name: str | None = None):
+    """装饰器：整个函数算一个阶段（默认用函数名）"""
+    def decorator(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name: str, n: int = 1) -> None:
+    with _lock:
+        _counters[name] += n
+
+
+def reset() -> None:
+    """清空已累计的阶段 & 计数（同一进程多次运行时用）"""
+    global _started, _started_at
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+        _started = time.perf_counter()
+        _started_at = datetime.now()
+
+
+# =========================
+# 2. 报告
+# =========================
+
+def report(script: str = "") -> dict:
+    """当前累计结果（可直接 json.dump）"""
+    with _lock:
+        stages = {
+            name: {"calls": e["calls"], "seconds": round(e["seconds"], 4), "rss_mb": round_mb(e["rss_mb"])}
+            for name, e in _stages.items()
+        }
+        counters = dict(_counters)
+
+    out = {
+        "script": script,
+        "started": _started_at.isoformat(timespec="seconds"),
+        "wall_seconds": round(time.perf_counter() - _started, 4),
+        "peak_rss_mb": round_mb(peak_rss_mb()),
+        "stages": stages,
+        "counters": counters,
+    }
+    if tracemalloc.is_tracing():
+        out["traced_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+    return out
+
+
+def print_report(data: dict) -> None:
+    print(f"\n📊 运行报告：{data['script']}")
+    if data["stages"]:
+        print(f"   {'stage':<16}{'calls':>8}{'seconds':>11}{'rss_mb':>9}")
+        for name, e in sorted(data["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            print(f"   {name:<16}{e['calls']:>8}{e['seconds']:>11.3f}{format_mb(e['rss_mb']):>9}")
+    if data["counters"]:
+        print("   " + "，".join(f"{name}={value:,}" for name, value in sorted(data["counters"].items())))
+
+    memory = f"峰值 RSS {format_mb(data['peak_rss_mb'])} MB"
+    if "traced_peak_mb" in data:
+        memory += f"，Python 分配峰值 {data['traced_peak_mb']:.0f} MB"
+    print(f"⏱ 总耗时：{data['wall_seconds']:.2f}s，{memory}")
+
+
+def _print_top_allocations(snapshot: tracemalloc.Snapshot) -> None:
+    print(f"\n🧠 内存分配 Top {MEMORY_TOP}：")
+    for stat in snapshot.statistics("lineno")[:MEMORY_TOP]:
+        frame = stat.traceback[0]
+        print(f"   {stat.size / 2 ** 20:>8.1f} MB  {frame.filename}:{frame.lineno}")
+
+
+# =========================
+# 3. 脚本入口
+# =========================
+
+def add_arguments(parser) -> None:
+    """给脚本的 argparse 加上埋点相关参数"""
+    group = parser.add_argument_group("埋点")
+    group.add_argument("--report", type=Path, help="退出时把运行报告另存为 JSON")
+    group.add_argument("--profile", type=Path, help="开启 cProfile，退出时写 .prof 并打印热点")
+    group.add_argument("--trace-memory", action="store_true", help="开启 tracemalloc（明显变慢）")
+
+
+def install(
+        script: str,
+        report_file: Path | None = None,
+        profile_file: Path | None = None,
+        trace_memory: bool = False,
+) -> None:
+    """开启可选分析器，注册退出时的报告（exit() / 异常退出同样输出）"""
+    profiler = None
+    if profile_file is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    if trace_memory:
+        tracemalloc.start()
+
+    def finish():
+        # 先拍内存快照，免得把下面打印报告的分配也算进去
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        if profiler is not None:
+            profiler.disable()
+            profile_file.parent.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(profile_file)
+            print(f"\n🔬 cProfile 热点（累计耗时 Top {PROFILE_TOP}），完整结果：{profile_file}")
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(PROFILE_TOP)
+
+        data = report(script)
+        print_report(data)
+        if snapshot is not None:
+            _print_top_allocations(snapshot)
+            tracemalloc.stop()
+
+        if report_file is not None:
+            report_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(report_file, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            print(f"📁 报告：{report_file}")
+
+    atexit.register(finish)
+
+
+def install_from_args(script: str, args) -> None:
+    """配合 add_arguments 使用"""
+    install(script, args.report, args.profile, args.trace_memory)
@@ -0,0 +1,185 @@
+# kline_fetcher.py
+"""
+Eastmoney K 线并发拉取管线
+
+- 线程池 + 连接池复用（keep-alive），不再每次新建连接
+- 令牌桶限速，取代固定 sleep
+- 失败按指数退避 + 随机抖动重试
+- base_url 可替换，便于对接本地 mock（mock_eastmoney_server.py）
+- klt 可选：日线 101，分钟线 1 / 5 / 15 / 30 / 60（落盘见 minute_store.py）
+- fqt 可选：默认 0 不复权（落盘的原始价）；2 后复权只给 adj_factor.py 推导复权因子
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import instrument
+
+EASTMONEY_BASE_URL = "https://push2his.eastmoney.com"
+KLINE_PATH = "/api/qt/stock/kline/get"
+
+CONCURRENCY = 4         # 同时在途请求数
+RATE_PER_SEC = 2.0      # 令牌桶：平均每秒请求数
+BURST = 4               # 令牌桶容量（允许的瞬时突发）
+MAX_RETRIES = 3         # 单只最多重试次数
+BACKOFF_BASE = 1.0      # 退避基数（秒）
+BACKOFF_MAX = 30.0      # 单次退避上限（秒）
+TIMEOUT = 10
+
+DAILY_KLT = 101
+MINUTE_KLTS = (1, 5, 15, 30, 60)
+
+FQT_NONE = 0            # 不复权
+FQT_HFQ = 2             # 后复权
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """线程安全令牌桶：acquire() 阻塞到拿到令牌为止"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            with instrument.stage("rate_limit"):
+                time.sleep(wait)
+
+
+def make_session(pool_size: int = CONCURRENCY) -> requests.Session:
+    """带连接池的 Session（重试由本模块自己控制）"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def market_code(symbol: str) -> int:
+    """Eastmoney secid 市场前缀：沪市 1（6 开头股票、5 开头基金 / ETF），深市 / 北交所 0"""
+    return 1 if symbol.startswith(("5", "6")) else 0
+
+
+def kline_params(symbol: str, start_date: str, klt: int = DAILY_KLT, fqt: int = FQT_NONE) -> dict:
+    return {
+        "fields1": "f1,f2,f3,f4,f5,f6",
+        "fields2": "f51,f52,f53,f54,f55,f56,f57,f58,f59,f60,f61,f116",
+        "ut": "7eea3edcaed734bea9cbfc24409ed989",
+        "klt": str(klt),
+        "fqt": str(fqt),
+        "secid": f"{market_code(symbol)}.{symbol}",
+        "beg": start_date,
+        "end": "20500101",
+    }
+
+
+def fetch_kline(
+        session: requests.Session,
+        symbol: str,
+        start_date: str,
+        base_url: str = EASTMONEY_BASE_URL,
+        klt: int = DAILY_KLT,
+        fqt: int = FQT_NONE,
+) -> dict:
+    """单次请求 Eastmoney K 线 API，返回 JSON"""
+    instrument.count("http_calls")
+    with instrument.stage("http"):
+        resp = session.get(
+            base_url + KLINE_PATH,
+            params=kline_params(symbol, start_date, klt, fqt),
+            timeout=TIMEOUT,
+        )
+    instrument.count("bytes_read", len(resp.content))
+    resp.raise_for_status()
+    return resp.json()
+
+
+def backoff_delay(attempt: int) -> float:
+    """指数退避 + 全抖动：[0, min(上限, 基数 * 2^attempt)]"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, requests.HTTPError):
+        return exc.response is not None and exc.response.status_code in RETRY_STATUS
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout, ValueError))
+
+
+def fetch_with_retry(
+        session: requests.Session,
+        bucket: TokenBucket,
+        symbol: str,
+        start_date: str,
+        base_url: str = EASTMONEY_BASE_URL,
+        max_retries: int = MAX_RETRIES,
+        klt: int = DAILY_KLT,
+        fqt: int = FQT_NONE,
+) -> dict:
+    """限速 + 重试包装；重试耗尽后抛出最后一次异常"""
+    attempt = 0
+    while True:
+        bucket.acquire()
+        try:
+            return fetch_kline(session, symbol, start_date, base_url, klt, fqt)
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            instrument.count("http_retries")
+            with instrument.stage("backoff"):
+                time.sleep(backoff_delay(attempt))
+            attempt += 1
+
+
+def fetch_many(
+        jobs,
+        concurrency: int = CONCURRENCY,
+        rate: float = RATE_PER_SEC,
+        burst: int = BURST,
+        base_url: str = EASTMONEY_BASE_URL,
+        max_retries: int = MAX_RETRIES,
+        klt: int = DAILY_KLT,
+        fqt: int = FQT_NONE,
+):
+    """并发拉取多只
+
+    jobs: [(symbol, start_date), ...]
+    逐个产出 (symbol, raw_json, error)，按完成顺序；调用方在主线程落盘
+    """
+    session = make_session(concurrency)
+    bucket = TokenBucket(rate, burst)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {
+            pool.submit(fetch_with_retry, session, bucket, symbol, start_date, base_url, max_retries, klt, fqt): symbol
+            for symbol, start_date in jobs
+        }
+
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                yield symbol, future.result(), None
+            except Exception as e:
+                yield symbol, None, e
+
+    session.close()
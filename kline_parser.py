@@ -0,0 +1,94 @@
+# kline_parser.py
+"""
+Eastmoney klines 批量解析（不经 pandas）
+
+klines 每行 11 个字段：
+    日期,开盘,收盘,最高,最低,成交量,成交额,振幅,涨跌幅,涨跌额,换手率
+
+- 整批交给 np.loadtxt（C 实现）一次解析成带类型的列数组
+- 保留全部 11 个字段
+- 个别行字段缺失 / 含 "-" 时退回逐行容错解析
+"""
+
+import numpy as np
+import pandas as pd
+
+KLINE_FIELDS = [
+    "date",
+    "open",
+    "close",
+    "high",
+    "low",
+    "volume",
+    "amount",
+    "amplitude",
+    "pct_chg",
+    "change",
+    "turnover",
+]
+
+MIN_FIELDS = 6      # 日期 + OHLCV，少于此的行丢弃
+
+
+def _dtype(date_unit: str) -> np.dtype:
+    return np.dtype([("date", f"datetime64[{date_unit}]")] + [(f, "f8") for f in KLINE_FIELDS[1:]])
+
+
+def _empty(date_unit: str) -> dict:
+    return {f: np.empty(0, dtype=_dtype(date_unit)[f]) for f in KLINE_FIELDS}
+
+
+def _parse_slow(klines: list, date_unit: str) -> dict:
+    """逐行容错解析：字段不足补 NaN，非数字记 NaN"""
+    dates = []
+    values = []
+
+    for line in klines:
+        parts = line.split(",")
+        if len(parts) < MIN_FIELDS:
+            continue
+
+        row = []
+        for part in parts[1:len(KLINE_FIELDS)]:
+            try:
+                row.append(float(part))
+            except ValueError:
+                row.append(np.nan)
+        row += [np.nan] * (len(KLINE_FIELDS) - 1 - len(row))
+
+        dates.append(parts[0])
+        values.append(row)
+
+    if not dates:
+        return _empty(date_unit)
+
+    matrix = np.array(values, dtype=np.float64)
+    out = {"date": np.array(dates, dtype=f"datetime64[{date_unit}]")}
+    for i, field in enumerate(KLINE_FIELDS[1:]):
+        out[field] = matrix[:, i]
+    return out
+
+
+def parse_klines(klines: list, date_unit: str = "D") -> dict:
+    """klines 字符串列表 → {字段: np.ndarray}
+
+    date_unit：日线 "D"，分钟线 "m"
+    """
+    if not klines:
+        return _empty(date_unit)
+
+    try:
+        table = np.loadtxt(klines, delimiter=",", dtype=_dtype(date_unit), ndmin=1)
+    except ValueError:
+        return _parse_slow(klines, date_unit)
+
+    return {field: table[field] for field in KLINE_FIELDS}
+
+
+def klines_to_df(raw: dict, date_unit: str = "D") -> pd.DataFrame:
+    """Eastmoney 原始 JSON → 标准 DataFrame（全部 11 列）；无 klines 返回空表"""
+    data = raw.get("data")
+    if not data or "klines" not in data:
+        return pd.DataFrame()
+
+    return pd.DataFrame(parse_klines(data["klines"], date_unit))
@@ -0,0 +1,116 @@
+# manifest.py
+"""
+行情新鲜度清单（data/bars/manifest.sqlite）
+
+每只股票一行：最后日期、行数、数据来源、校验和、写入时间
+- 由 bar_store 每次提交写入时顺带更新
+- 更新脚本只查清单就能挑出需要更新的股票，无需打开任何行情文件
+"""
+
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from trade_calendar import expected_last_date
+
+MANIFEST_NAME = "manifest.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS symbols (
+    code       TEXT PRIMARY KEY,
+    last_date  TEXT,
+    rows       INTEGER NOT NULL,
+    source     TEXT,
+    checksum   INTEGER,
+    updated_at TEXT NOT NULL
+)
+"""
+
+
+def manifest_path(store_dir: Path) -> Path:
+    return store_dir / MANIFEST_NAME
+
+
+def _connect(store_dir: Path) -> sqlite3.Connection:
+    store_dir.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(manifest_path(store_dir), timeout=30)
+    conn.execute(SCHEMA)
+    return conn
+
+
+def record(
+        store_dir: Path,
+        code: str,
+        rows: int,
+        last_date: str | None,
+        checksum: int,
+        source: str | None = None,
+) -> None:
+    """记录一次写入；source 为空时保留原来源"""
+    record_many(store_dir, [(code, rows, last_date, checksum, source)])
+
+
+def record_many(store_dir: Path, records: list) -> None:
+    """批量记录（单个事务）：records 为 [(code, rows, last_date, checksum, source), ...]"""
+    if not records:
+        return
+
+    now = datetime.now().isoformat(timespec="seconds")
+    with closing(_connect(store_dir)) as conn, conn:
+        conn.executemany(
+            """
+            INSERT INTO symbols (code, last_date, rows, source, checksum, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(code) DO UPDATE SET
+                last_date  = excluded.last_date,
+                rows       = excluded.rows,
+                source     = COALESCE(excluded.source, symbols.source),
+                checksum   = excluded.checksum,
+                updated_at = excluded.updated_at
+            """,
+            [
+                (code, last_date, rows, source, checksum, now)
+                for code, rows, last_date, checksum, source in records
+            ],
+        )
+
+
+def load(store_dir: Path) -> pd.DataFrame:
+    """整张清单（以 code 为索引）；清单不存在返回空表"""
+    columns = ["code", "last_date", "rows", "source", "checksum", "updated_at"]
+    if not manifest_path(store_dir).exists():
+        return pd.DataFrame(columns=columns).set_index("code")
+
+    with closing(_connect(store_dir)) as conn:
+        rows = conn.execute(f"SELECT {', '.join(columns)} FROM symbols").fetchall()
+
+    return pd.DataFrame(rows, columns=columns).set_index("code")
+
+
+def stale_symbols(
+        codes,
+        store_dir: Path,
+        start_date: str,
+        now: datetime | None = None,
+) -> list:
+    """只查清单，挑出需要更新的股票
+
+    返回 [(code, 拉取起始日 YYYYMMDD), ...]，保持 codes 顺序：
+    - 清单里没有 → 从 start_date 全量拉
+    - 最后日期早于「应有的最新交易日」→ 从最后日期起拉（末根顺带校正）
+    """
+    expected = expected_last_date(now)
+    last_dates = load(store_dir)["last_date"]
+
+    jobs = []
+    for code in dict.fromkeys(codes):
+        last = last_dates.get(code)
+        if last is None or pd.isna(last):
+            jobs.append((code, start_date))
+        elif last < expected:
+            jobs.append((code, last.replace("-", "")))
+
+    return jobs
@@ -0,0 +1,60 @@
+# migrate_csv_to_store.py
+"""
+一次性迁移：data/stocks/{code}.csv → data/bars/{code}/
+
+- 兼容 tushare 版文件名（000001.SZ.csv → 000001）
+- 幂等（可反复跑，全量覆盖）
+- 单只失败不影响整体
+- 输出迁移前后磁盘占用（只算本次迁移成功的股票）
+- 写入时同步生成 manifest.sqlite；--manifest-only 只按现有存储重建清单
+"""
+
+import argparse
+from pathlib import Path
+
+import pandas as pd
+
+from bar_store import STORE_DIR, rebuild_manifest, write_bars
+
+CSV_DIR = Path("data/stocks")
+
+
+def dir_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="迁移 CSV 日线到列式存储")
+    parser.add_argument("--csv-dir", type=Path, default=CSV_DIR)
+    parser.add_argument("--store-dir", type=Path, default=STORE_DIR)
+    parser.add_argument("--manifest-only", action="store_true", help="只重建清单")
+    args = parser.parse_args()
+
+    if args.manifest_only:
+        count = rebuild_manifest(args.store_dir)
+        print(f"🗂 清单重建完成：{count} 只")
+        raise SystemExit(0)
+
+    csv_files = sorted(args.csv_dir.glob("*.csv"))
+    print(f"📂 发现 CSV 文件：{len(csv_files)}")
+
+    migrated = []
+    for csv_path in csv_files:
+        code = csv_path.stem.split(".")[0]
+
+        try:
+            df = pd.read_csv(csv_path)
+            rows = write_bars(code, df, args.store_dir, source="csv")
+        except Exception as e:
+            print(f"❌ {csv_path.name} 迁移失败: {e}")
+            continue
+
+        migrated.append((csv_path, code))
+        print(f"✅ {code}: {rows} 行")
+
+    if migrated:
+        csv_size = sum(csv_path.stat().st_size for csv_path, _ in migrated)
+        store_size = sum(dir_size(args.store_dir / code) for _, code in migrated)
+        print(f"\n💾 CSV：{csv_size / 1024:.0f} KB → 列式存储：{store_size / 1024:.0f} KB")
+
+    print(f"\n🎯 迁移完成：{len(migrated)} 只")
@@ -0,0 +1,280 @@
+# minute_store.py
+"""
+分钟线列式存储（klt = 1 / 5 / 15 / 30 / 60）
+
+布局：
+    data/minute/{klt}m/{code}/{YYYYMM}.npz   每只股票每月一个分区（压缩 npz，每列一个数组）
+
+- time 为 int64（距 1970-01-01 00:00 的分钟数，K 线结束时刻，与接口一致）
+- 其余列类型与 bar_store.COLUMNS 相同（价格 float32，成交量 / 成交额 float64）
+- 分钟线约为日线的 240 倍：按月分区，1 分钟线约 5000 行 / 分区，压缩后几十 KB
+- 写入只重写新数据落到的月份（读出 → 合并去重 → 临时文件 + rename 原子替换）
+- 区间读取只打开与 [start, end] 相交的分区
+- resample 由分钟线生成日线 / 周线视图（日线列与 bar_store 一致，可直接 merge_bars）
+
+用法：
+    python minute_store.py 600000 --klt 5 --start 2026-01-05 --end 2026-01-09 --resample D
+"""
+
+import argparse
+import io
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import instrument
+from bar_store import COLUMNS, restore_prices
+
+MINUTE_DIR = Path("data/minute")
+
+VALUE_COLUMNS = {col: dtype for col, dtype in COLUMNS.items() if col != "date"}
+SUM_COLUMNS = ["volume", "amount", "turnover"]      # 重采样时相加的列
+
+
+# =========================
+# 时间 & 分区
+# =========================
+
+def to_minutes(values) -> np.ndarray:
+    """任意时间序列（字符串 / datetime）→ int64 分钟数"""
+    stamps = pd.to_datetime(pd.Series(values)).to_numpy().astype("datetime64[m]")
+    return stamps.astype(np.int64)
+
+
+def from_minutes(minutes: np.ndarray) -> np.ndarray:
+    return np.asarray(minutes).astype("datetime64[m]")
+
+
+def _month_keys(minutes: np.ndarray) -> np.ndarray:
+    """分钟数 → 分区键 YYYYMM（int）"""
+    months = from_minutes(minutes).astype("datetime64[M]").astype(np.int64)
+    return (1970 + months // 12) * 100 + months % 12 + 1
+
+
+def _symbol_dir(code: str, klt: int, store_dir: Path) -> Path:
+    return store_dir / f"{klt}m" / code
+
+
+def partitions(code: str, klt: int, store_dir: Path = MINUTE_DIR) -> list:
+    """已有分区键（YYYYMM，升序）"""
+    symbol_dir = _symbol_dir(code, klt, store_dir)
+    if not symbol_dir.exists():
+        return []
+    return sorted(int(p.stem) for p in symbol_dir.glob("*.npz"))
+
+
+def _read_partition(path: Path, columns: list) -> dict:
+    with np.load(path) as data:
+        rows = len(data["time"])
+        out = {"time": data["time"]}
+        for col in columns:
+            # 旧分区没有的列记 NaN
+            out[col] = data[col] if col in data.files else np.full(rows, np.nan, dtype=VALUE_COLUMNS[col])
+    instrument.count("rows_read", rows)
+    instrument.count("partitions_read")
+    return out
+
+
+def _write_partition(path: Path, arrays: dict) -> None:
+    """压缩写入临时文件，fsync 后 rename 原子替换"""
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    data = buffer.getvalue()
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    instrument.count("bytes_written", len(data))
+
+
+# =========================
+# 写入
+# =========================
+
+def _normalize(df: pd.DataFrame) -> dict:
+    """统一列 & 类型（time 列名也可以是 date），按时间排序去重（同一时刻保留最后一条）"""
+    time_col = "time" if "time" in df.columns else "date"
+    if time_col not in df.columns or "close" not in df.columns:
+        raise ValueError("缺少列: time / close")
+
+    arrays = {"time": to_minutes(df[time_col])}
+    for col, dtype in VALUE_COLUMNS.items():
+        if col in df.columns:
+            arrays[col] = pd.to_numeric(df[col], errors="coerce").to_numpy().astype(dtype)
+        else:
+            arrays[col] = np.full(len(df), np.nan, dtype=dtype)
+    return _dedupe(arrays)
+
+
+def _dedupe(arrays: dict) -> dict:
+    """按 time 稳定排序，同一时刻保留最后出现的一条"""
+    order = np.argsort(arrays["time"], kind="stable")
+    time = arrays["time"][order]
+    keep = order[np.append(time[1:] != time[:-1], True)]
+    return {col: values[keep] for col, values in arrays.items()}
+
+
+@instrument.timed("minute_write")
+def merge_minutes(code: str, df: pd.DataFrame, klt: int, store_dir: Path = MINUTE_DIR) -> tuple[int, int]:
+    """把一批分钟线合并进存储，只重写涉及的月份分区
+
+    返回 (合并后涉及分区的总行数, 重写的分区数)
+    """
+    if df.empty:
+        return 0, 0
+    new = _normalize(df)
+    symbol_dir = _symbol_dir(code, klt, store_dir)
+    symbol_dir.mkdir(parents=True, exist_ok=True)
+
+    keys = _month_keys(new["time"])
+    bounds = np.flatnonzero(np.diff(keys)) + 1
+    rows = 0
+    for part in np.split(np.arange(len(keys)), bounds):
+        key = int(keys[part[0]])
+        path = symbol_dir / f"{key}.npz"
+        chunk = {col: values[part] for col, values in new.items()}
+        if path.exists():
+            old = _read_partition(path, list(VALUE_COLUMNS))
+            chunk = _dedupe({col: np.concatenate([old[col], chunk[col]]) for col in chunk})
+        _write_partition(path, chunk)
+        rows += len(chunk["time"])
+
+    return rows, len(bounds) + 1
+
+
+# =========================
+# 读取
+# =========================
+
+def _range_bound(value, end: bool) -> int | None:
+    """区间端点 → 分钟数；只给日期的终点取到当天最后一分钟"""
+    if value is None:
+        return None
+    stamp = pd.Timestamp(value)
+    if end and stamp == stamp.normalize() and len(str(value)) <= 10:
+        stamp = stamp + pd.Timedelta(days=1) - pd.Timedelta(minutes=1)
+    return int(np.datetime64(stamp, "m").astype(np.int64))
+
+
+def read_minutes(
+        code: str,
+        klt: int,
+        start=None,
+        end=None,
+        columns=None,
+        store_dir: Path = MINUTE_DIR,
+) -> pd.DataFrame:
+    """读取 [start, end] 内的分钟线（含两端），只打开相交的月份分区
+
+    返回 DataFrame：time（datetime64）+ columns（价格还原为 float64）；无数据返回空表
+    """
+    columns = list(columns or VALUE_COLUMNS)
+    lo, hi = _range_bound(start, end=False), _range_bound(end, end=True)
+    lo_key = _month_keys(np.array([lo]))[0] if lo is not None else 0
+    hi_key = _month_keys(np.array([hi]))[0] if hi is not None else 999999
+
+    symbol_dir = _symbol_dir(code, klt, store_dir)
+    parts = [
+        _read_partition(symbol_dir / f"{key}.npz", columns)
+        for key in partitions(code, klt, store_dir)
+        if lo_key <= key <= hi_key
+    ]
+    if not parts:
+        return pd.DataFrame(columns=["time"] + columns)
+
+    time = np.concatenate([p["time"] for p in parts])
+    mask = np.ones(len(time), dtype=bool)
+    if lo is not None:
+        mask &= time >= lo
+    if hi is not None:
+        mask &= time <= hi
+
+    df = pd.DataFrame({"time": pd.to_datetime(from_minutes(time[mask]))})
+    for col in columns:
+        values = np.concatenate([p[col] for p in parts])[mask]
+        df[col] = restore_prices(values) if values.dtype == np.float32 else values
+    return df
+
+
+def last_time(code: str, klt: int, store_dir: Path = MINUTE_DIR) -> pd.Timestamp | None:
+    """最后一根分钟线的时刻（只读最后一个分区），无数据返回 None"""
+    keys = partitions(code, klt, store_dir)
+    if not keys:
+        return None
+    with np.load(_symbol_dir(code, klt, store_dir) / f"{keys[-1]}.npz") as data:
+        time = data["time"]
+        return pd.Timestamp(np.datetime64(int(time[-1]), "m")) if len(time) else None
+
+
+# =========================
+# 重采样：分钟 → 日线 / 周线
+# =========================
+
+def resample(minutes: pd.DataFrame, freq: str = "D") -> pd.DataFrame:
+    """分钟线 → 日线（freq="D"）/ 周线（freq="W"，周日为标签，与 scan_engine.weekly_close 一致）
+
+    开 = 首根开，高 / 低 = 区间极值，收 = 末根收，量 / 额 / 换手相加；
+    涨跌额 / 涨跌幅 / 振幅 相对上一根重采样 K 线的收盘（首根为 NaN）
+    """
+    if freq not in ("D", "W"):
+        raise ValueError(f"freq 只支持 D / W: {freq}")
+    out_columns = ["date"] + list(VALUE_COLUMNS)
+    if minutes.empty:
+        return pd.DataFrame(columns=out_columns)
+
+    # 分钟 K 线时刻 → 所在交易日（天数）→ 分组键
+    days = minutes["time"].to_numpy().astype("datetime64[D]").astype(np.int64)
+    keys = days if freq == "D" else days + 6 - (days + 3) % 7
+    starts = np.flatnonzero(np.append(True, keys[1:] != keys[:-1]))
+    ends = np.append(starts[1:], len(keys)) - 1
+
+    def col(name: str) -> np.ndarray:
+        if name in minutes.columns:
+            return minutes[name].to_numpy(dtype=np.float64)
+        return np.full(len(minutes), np.nan)
+
+    close = col("close")[ends]
+    high = np.fmax.reduceat(col("high"), starts)
+    low = np.fmin.reduceat(col("low"), starts)
+    prev_close = np.concatenate([[np.nan], close[:-1]])
+
+    out = pd.DataFrame({
+        "date": pd.to_datetime(keys[starts].astype("datetime64[D]")),
+        "open": col("open")[starts],
+        "high": high,
+        "low": low,
+        "close": close,
+    })
+    for name in SUM_COLUMNS:
+        values = col(name)
+        total = np.add.reduceat(np.nan_to_num(values), starts)
+        out[name] = np.where(np.logical_or.reduceat(~np.isnan(values), starts), total, np.nan)
+    out["change"] = close - prev_close
+    out["pct_chg"] = out["change"] / prev_close * 100
+    out["amplitude"] = (high - low) / prev_close * 100
+    return out[out_columns]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="分钟线存储：区间读取 / 重采样")
+    parser.add_argument("code")
+    parser.add_argument("--klt", type=int, default=5)
+    parser.add_argument("--start", help="起点（YYYY-MM-DD [HH:MM]）")
+    parser.add_argument("--end", help="终点（只给日期时含当天全部）")
+    parser.add_argument("--resample", choices=["D", "W"], help="重采样为日线 / 周线")
+    parser.add_argument("--store-dir", type=Path, default=MINUTE_DIR)
+    args = parser.parse_args()
+
+    keys = partitions(args.code, args.klt, args.store_dir)
+    print(f"📦 {args.code} {args.klt}m：{len(keys)} 个分区" + (f"（{keys[0]} ~ {keys[-1]}）" if keys else ""))
+
+    df = read_minutes(args.code, args.klt, args.start, args.end, store_dir=args.store_dir)
+    print(f"📖 读取 {len(df)} 行（打开 {instrument.report()['counters'].get('partitions_read', 0)} 个分区）")
+    if args.resample:
+        df = resample(df, args.resample)
+    print(df.to_string(index=False, max_rows=20))
@@ -0,0 +1,110 @@
+# mock_eastmoney_server.py
+"""
+本地 Eastmoney K 线 mock 服务
+
+- 用 data/manual/stocks/{code}.json 里录制好的真实返回（不复权）；
+  fqt=2（后复权）请求用 data/manual/stocks/hfq/{code}.json，没录制的返回空 data
+- 支持 secid / beg 参数（按起始日期截取 klines）
+- 可注入延迟 & 随机 503，用来压测并发 / 限速 / 重试
+
+用法：
+    python mock_eastmoney_server.py --port 8765 --fail-rate 0.2
+    python update_data_direct_http.py --base-url http://127.0.0.1:8765
+    python adj_factor.py --base-url http://127.0.0.1:8765
+"""
+
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from kline_fetcher import FQT_HFQ, FQT_NONE, KLINE_PATH
+
+MANUAL_DIR = Path("data/manual/stocks")
+HFQ_SUBDIR = "hfq"      # 后复权录制：{manual_dir}/hfq/{code}.json
+
+
+def load_recorded(manual_dir: Path) -> dict:
+    """读取全部录制 JSON：{code: raw}"""
+    recorded = {}
+    for json_path in sorted(manual_dir.glob("*.json")):
+        with open(json_path, "r", encoding="utf-8") as f:
+            recorded[json_path.stem] = json.load(f)
+    return recorded
+
+
+def make_handler(recorded: dict, latency: float, fail_rate: float, recorded_hfq: dict | None = None):
+    class KlineHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"    # keep-alive
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != KLINE_PATH:
+                self.reply(404, {"rc": 404})
+                return
+
+            if latency:
+                time.sleep(latency)
+
+            if random.random() < fail_rate:
+                self.reply(503, {"rc": 503})
+                return
+
+            query = parse_qs(url.query)
+            code = query.get("secid", [""])[0].split(".")[-1]
+            beg = query.get("beg", ["0"])[0]
+            fqt = int(query.get("fqt", ["0"])[0])
+
+            raw = {FQT_NONE: recorded, FQT_HFQ: recorded_hfq or {}}.get(fqt, {}).get(code)
+            if raw is None or not raw.get("data"):
+                self.reply(200, {"rc": 0, "data": None})
+                return
+
+            # beg 形如 20180101，klines 日期形如 2018-01-02
+            data = dict(raw["data"])
+            data["klines"] = [
+                line for line in data["klines"]
+                if line[:10].replace("-", "") >= beg
+            ]
+            self.reply(200, {**raw, "data": data})
+
+        def reply(self, status: int, body: dict):
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return KlineHandler
+
+
+def serve(
+        port: int = 0,
+        manual_dir: Path = MANUAL_DIR,
+        latency: float = 0.0,
+        fail_rate: float = 0.0,
+) -> ThreadingHTTPServer:
+    """创建（未启动的）mock 服务；port=0 时由系统分配端口"""
+    handler = make_handler(load_recorded(manual_dir), latency, fail_rate, load_recorded(manual_dir / HFQ_SUBDIR))
+    return ThreadingHTTPServer(("127.0.0.1", port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 Eastmoney K 线 mock")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--manual-dir", type=Path, default=MANUAL_DIR)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求额外延迟（秒）")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="随机返回 503 的比例")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.manual_dir, args.latency, args.fail_rate)
+    print(f"🧪 mock 服务：http://127.0.0.1:{server.server_address[1]}{KLINE_PATH}")
+    print(f"📂 录制数据：{len(load_recorded(args.manual_dir))} 只（后复权 {len(load_recorded(args.manual_dir / HFQ_SUBDIR))} 只）")
+    server.serve_forever()
@@ -1,68 +1,50 @@
 # parse_manual_data.py
 """
 解析 data/manual/stocks 下的 Eastmoney JSON
-并合并更新到 data/stocks/{code}.csv
+并合并更新到 data/bars/{code}/（列式存储）
 
 - 自动检测所有 json
 - 自动断点
 - 幂等（可反复跑）
 - 单股票失败不影响整体
+- 退出时输出各阶段耗时 / 内存报告（--report / --profile / --trace-memory）
 """
 
-import json
+import argparse
 from pathlib import Path
 
 import pandas as pd
 
+import instrument
+from bar_store import STORE_DIR, merge_bars
+from data_sources import ManualSource
+
 MANUAL_DIR = Path("data/manual/stocks")
-DATA_DIR = Path("data/stocks")
 
 MANUAL_DIR.mkdir(parents=True, exist_ok=True)
-DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 
 def parse_eastmoney_json(json_path: Path) -> pd.DataFrame:
-    """解析单个 Eastmoney kline JSON"""
-    with open(json_path, "r", encoding="utf-8") as f:
-        raw = json.load(f)
-
-    data = raw.get("data")
-    if not data or "klines" not in data:
-        raise ValueError("JSON 中无 klines 数据")
-
-    records = []
-    for line in data["klines"]:
-        parts = line.split(",")
-        if len(parts) < 6:
-            continue
-
-        records.append({
-            "date": parts[0],
-            "open": float(parts[1]),
-            "close": float(parts[2]),
-            "high": float(parts[3]),
-            "low": float(parts[4]),
-            "volume": float(parts[5]),
-        })
-
-    return pd.DataFrame(records)
+    """解析单个 Eastmoney kline JSON（统一批次，全部 11 列）"""
+    return ManualSource(json_path.parent).fetch(json_path.stem)
 
 
 if __name__ == "__main__":
-    json_files = sorted(MANUAL_DIR.glob("*.json"))
+    parser = argparse.ArgumentParser(description="解析手工 Eastmoney JSON")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.install_from_args("parse_manual_data", args)
 
-    print(f"📂 发现手工数据文件：{len(json_files)}")
+    source = ManualSource(MANUAL_DIR)
+    codes = source.codes()
 
-    for json_path in json_files:
-        code = json_path.stem
-        csv_path = DATA_DIR / f"{code}.csv"
+    print(f"📂 发现手工数据文件：{len(codes)}")
 
+    for code, df_new, error in source.fetch_batch([(code, None) for code in codes]):
         print(f"\n🔄 处理 {code}")
 
-        try:
-            df_new = parse_eastmoney_json(json_path)
-        except Exception as e:
-            print(f"❌ JSON 解析失败: {e}")
+        if error is not None:
+            print(f"❌ JSON 解析失败: {error}")
             continue
 
         if df_new.empty:
@@ -72,21 +54,12 @@ if __name__ == "__main__":
         # -------------------------
         # 合并已有数据
         # -------------------------
-        if csv_path.exists():
-            try:
-                df_old = pd.read_csv(csv_path)
-                combined = (
-                    pd.concat([df_old, df_new])
-                    .drop_duplicates(subset=["date"])
-                    .sort_values("date")
-                )
-            except Exception as e:
-                print(f"⚠️ 旧 CSV 读取失败，直接覆盖: {e}")
-                combined = df_new.sort_values("date")
-        else:
-            combined = df_new.sort_values("date")
-
-        combined.to_csv(csv_path, index=False)
-        print(f"✅ 更新完成，共 {len(combined)} 行")
+        try:
+            rows, mode = merge_bars(code, df_new, STORE_DIR, source=source.name)
+        except Exception as e:
+            print(f"❌ 写入失败: {e}")
+            continue
+
+        print(f"✅ 更新完成（{mode}），共 {rows} 行")
 
     print("\n🎯 手工数据解析完成")
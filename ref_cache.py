@@ -0,0 +1,87 @@
+# ref_cache.py
+"""
+参考数据本地缓存（data/ref/）
+
+- stock_list.csv     A 股代码 & 名称（ak.stock_info_a_code_name）
+  （市场宽度已改为本地计算，见 breadth.py）
+
+规则：
+- 缓存未过期（按文件修改时间 + TTL）直接读本地，不导入 akshare
+- 过期 / 缺失才懒导入 akshare 拉一次并原子落盘
+- 拉取失败时退回旧缓存（过期也用，打印提示）
+- offline=True 完全不联网：有缓存就用（不看 TTL），否则退化为本地数据
+"""
+
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+
+import pandas as pd
+
+from bar_store import STORE_DIR, is_etf, list_codes
+
+REF_DIR = Path("data/ref")
+STOCK_LIST_FILE = "stock_list.csv"
+
+STOCK_LIST_TTL = timedelta(days=7)     # 代码表变化很慢（新股 / 退市）
+
+
+def _age(path: Path) -> timedelta | None:
+    if not path.exists():
+        return None
+    return timedelta(seconds=time.time() - path.stat().st_mtime)
+
+
+def _is_fresh(path: Path, ttl: timedelta) -> bool:
+    age = _age(path)
+    return age is not None and age < ttl
+
+
+def _atomic_write(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+# =========================
+# 1. 股票列表
+# =========================
+
+def _read_stock_list(path: Path) -> pd.DataFrame:
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+def stock_list(
+        offline: bool = False,
+        ttl: timedelta = STOCK_LIST_TTL,
+        ref_dir: Path = REF_DIR,
+        store_dir: Path = STORE_DIR,
+) -> pd.DataFrame:
+    """A 股代码 & 名称（列：code, name）
+
+    offline 且无缓存时退化为本地存储里的股票代码（名称留空，不含 ETF）
+    """
+    path = ref_dir / STOCK_LIST_FILE
+
+    if _is_fresh(path, ttl) or (offline and path.exists()):
+        return _read_stock_list(path)
+
+    if offline:
+        print("⚠️ 离线模式且无股票列表缓存，改用本地存储中的代码")
+        return pd.DataFrame({"code": [c for c in list_codes(store_dir) if not is_etf(c)], "name": ""})
+
+    try:
+        import akshare as ak    # 缓存失效才导入（很慢）
+
+        print("📡 Fetching stock list...")
+        df = ak.stock_info_a_code_name()[["code", "name"]].astype(str)
+        _atomic_write(path, df.to_csv(index=False))
+        return df
+    except Exception as e:
+        if path.exists():
+            print(f"⚠️ 股票列表获取失败，使用旧缓存：{e}")
+            return _read_stock_list(path)
+        raise
@@ -7,131 +7,185 @@
 - 偏中长线（周线级别）
 - 低频、稳健、可长期运行
 - 只做「过滤」，不做「预测」
+
+用法：
+    python run_market_scan.py              # 单进程
+    python run_market_scan.py --workers 8  # 按分片多进程并行
+    python run_market_scan.py --incremental  # 增量状态，只消化新增日线
+    python run_market_scan.py --offline    # 完全不联网（股票列表只用 data/ref 缓存）
+    python run_market_scan.py --signals WEEKLY_TREND_UP NEW_HIGH  # 只跑指定信号（默认全部已注册）
+    python run_market_scan.py --max-rss-mb 512  # 小内存机器（批次自动减半）
+    python validate_bars.py && python run_market_scan.py  # 先校验，扫描跳过停牌 / 坏数据
+    python adj_factor.py && python run_market_scan.py  # 先同步复权因子，默认前复权（除权缺口不再触发假信号）
+    python run_market_scan.py --adjust none  # 不复权（没有因子的股票本来就按不复权，adjust 列标 none）
+    python run_market_scan.py --profile scan.prof  # 退出报告 + cProfile 热点
 """
 
+import argparse
+from collections import Counter
 from pathlib import Path
 from datetime import date
-import pandas as pd
-import akshare as ak
+
+import instrument
+import adj_factor
+import validate_bars
+from breadth import BREADTH_FILE, COVERAGE_DAYS, MIN_COVERAGE, latest_complete, update_breadth
+from ref_cache import stock_list
+from scan_engine import MAX_RSS_MB, SHARD_SIZE, scan_universe
+from signals import SIGNALS, SignalParams, head_per_signal, output_columns, resolve, scan_signals
 
 # =========================
 # 1. 全局参数（刻意很少）
 # =========================
 
-DATA_DIR = Path("data/stocks")     # update_stock_data.py 生成的缓存
+STORE_DIR = Path("data/bars")      # update_data_*.py 生成的列式缓存
 OUTPUT_DIR = Path("market")
-OUTPUT_DIR.mkdir(exist_ok=True)
 
 MA_WINDOW = 20          # 周线 MA20 ≈ 5 个月
 MIN_LIST_DAYS = 250     # 至少 1 年日线数据
-MAX_OUTPUT = 50         # 最多输出 50 只
-MIN_UP_COUNT = 1000     # 市场情绪闸门（上涨家数）
+MAX_OUTPUT = 50         # 每个信号最多输出 50 只
+MIN_UP_RATIO = 0.2      # 市场情绪闸门（本地上涨家数占比，≈ 全市场 1000 / 5000）
 
 today_str = str(date.today())
 
-# =========================
-# 2. 市场环境闸门
-# =========================
-
-print("🌡 Checking market environment...")
-
-try:
-    breadth = ak.stock_market_activity_legu()
-    up_row = breadth[breadth["item"] == "上涨"]
-    up_cnt = int(up_row["value"].iloc[0]) if not up_row.empty else None
-except Exception as e:
-    print(f"⚠️ 市场宽度获取失败：{e}")
-    up_cnt = None
-
-if up_cnt is not None:
-    print(f"📈 上涨家数：{up_cnt}")
-    if up_cnt < MIN_UP_COUNT:
-        print(f"🚫 市场环境不佳（<{MIN_UP_COUNT}），本次不扫描")
-        exit(0)
-else:
-    print("⚠️ 无法判断市场环境，谨慎放行")
-
-print("✅ 市场环境允许，开始扫描")
-
-# =========================
-# 3. 股票列表（只拿代码 & 名称）
-# =========================
-
-print("📊 Fetching stock list...")
-stock_list = ak.stock_info_a_code_name()
-
-results = []
-
-# =========================
-# 4. 个股扫描（完全本地）
-# =========================
-
-total = len(stock_list)
-
-for idx, (_, row) in enumerate(stock_list.iterrows(), 1):
-    code = row["code"]
-    name = row["name"]
-
-    if idx % 100 == 0:
-        print(f"⏳ Progress: {idx}/{total}")
-
-    file_path = DATA_DIR / f"{code}.csv"
-    if not file_path.exists():
-        continue
-
-    try:
-        df = pd.read_csv(file_path)
-    except Exception:
-        continue
-
-    if len(df) < MIN_LIST_DAYS:
-        continue
-
-    # -------------------------
-    # 基础清洗
-    # -------------------------
-    df["date"] = pd.to_datetime(df["date"])
-    df = df.sort_values("date")
-
-    # 最近 10 个交易日必须有成交量（防停牌/ST）
-    if df.tail(10)["volume"].sum() == 0:
-        continue
-
-    # -------------------------
-    # 周线 & MA
-    # -------------------------
-    weekly = df.resample("W", on="date").last()
-
-    if len(weekly) < MA_WINDOW + 1:
-        continue
-
-    weekly["ma"] = weekly["close"].rolling(MA_WINDOW).mean()
-
-    this = weekly.iloc[-1]
-    last = weekly.iloc[-2]
-
-    # -------------------------
-    # 中长线趋势条件（唯一核心）
-    # -------------------------
-    if this["close"] > this["ma"] and last["close"] <= last["ma"]:
-        results.append({
-            "code": code,
-            "name": name,
-            "close": round(this["close"], 2),
-            "ma20": round(this["ma"], 2),
-            "signal": "WEEKLY_TREND_UP"
-        })
-
-    if len(results) >= MAX_OUTPUT:
-        break
-
-# =========================
-# 5. 输出结果
-# =========================
-
-out_df = pd.DataFrame(results)
-out_file = OUTPUT_DIR / f"watchlist_{today_str}.csv"
-out_df.to_csv(out_file, index=False, encoding="utf-8-sig")
-
-print(f"\n✅ 扫描完成，候选股票：{len(out_df)} 只")
-print(f"📁 输出文件：{out_file}")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="中长线 A 股市场扫描")
+    parser.add_argument("--workers", type=int, default=1, help="并行进程数")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="每个分片的股票数")
+    parser.add_argument("--incremental", action="store_true", help="使用持久化的周线增量状态（仅 WEEKLY_TREND_UP）")
+    parser.add_argument("--offline", action="store_true", help="不联网，股票列表只用本地缓存")
+    parser.add_argument("--signals", nargs="+", choices=list(SIGNALS), help="要判定的信号（默认全部已注册）")
+    parser.add_argument("--max-rss-mb", type=float, default=MAX_RSS_MB, help="扫描常驻内存上限（MB）")
+    parser.add_argument("--adjust", choices=["qfq", "hfq", "none"], default="qfq", help="复权方式（输出价格口径）")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.install_from_args("run_market_scan", args)
+
+    OUTPUT_DIR.mkdir(exist_ok=True)
+
+    # =========================
+    # 2. 市场环境闸门
+    # =========================
+
+    print("🌡 Checking market environment...")
+
+    # 本地日线面板算宽度（data/breadth/breadth.csv，只补算新交易日）
+    with instrument.stage("breadth"):
+        breadth = update_breadth(STORE_DIR, BREADTH_FILE, max_rss_mb=args.max_rss_mb)
+
+    if not breadth.empty:
+        latest, partial = latest_complete(breadth)
+        if partial:
+            newest = breadth.iloc[-1]
+            print(f"⚠️ {newest['date'].date()} 只有 {newest['total']} 只有收盘（不到近 {COVERAGE_DAYS} 日中位数的"
+                  f" {MIN_COVERAGE:.0%}），闸门按最近完整交易日 {latest['date'].date()} 判断")
+        print(
+            f"📈 {latest['date'].date()} 上涨 {latest['advances']} / {latest['total']}"
+            f"（{latest['up_ratio']:.1%}），周线 MA20 之上 {latest['above_ma_pct']:.1%}，"
+            f"新高 {latest['new_highs']} / 新低 {latest['new_lows']}"
+        )
+        if latest["up_ratio"] < MIN_UP_RATIO:
+            print(f"🚫 市场环境不佳（上涨占比 <{MIN_UP_RATIO:.0%}），本次不扫描")
+            exit(0)
+    else:
+        print("⚠️ 本地无行情数据，无法判断市场环境，谨慎放行")
+
+    print("✅ 市场环境允许，开始扫描")
+
+    # =========================
+    # 3. 股票列表（只拿代码 & 名称）
+    # =========================
+
+    print("📊 Loading stock list...")
+    with instrument.stage("stock_list"):
+        stocks = stock_list(offline=args.offline, store_dir=STORE_DIR)
+
+    # =========================
+    # 4. 个股扫描（完全本地，每只只读一次尾部，全部信号同一遍，可多进程）
+    # =========================
+
+    codes = stocks["code"].tolist()
+    adjust = None if args.adjust == "none" else args.adjust
+
+    # 异常 / 停牌索引（validate_bars.py 生成）：排除停牌中 & 近期数据有误的股票
+    with instrument.stage("quality"):
+        skipped = validate_bars.excluded(codes, STORE_DIR, lookback_days=7 * (MA_WINDOW + 1))
+    if skipped is None:
+        print("⚠️ 无数据校验索引（先运行 validate_bars.py），只按近期成交量过滤停牌")
+    else:
+        codes = [code for code in codes if code not in skipped]
+        print(f"🩺 数据校验排除 {len(skipped)} 只：{dict(Counter(skipped.values()))}")
+        lagging = validate_bars.stale(codes, STORE_DIR)
+        if lagging:
+            print(f"⚠️ {len(lagging)} 只数据落后最新交易日（未排除，先更新数据），落后交易日数分布：{dict(Counter(lagging.values()))}")
+
+    adjusted = set()
+    if adjust is not None:
+        # 因子表由 adj_factor.py 同步（扫描不联网）；没同步过的股票按不复权判定并在输出里标明
+        with instrument.stage("adj_factor"):
+            adjusted = adj_factor.covered(codes, STORE_DIR)
+        if len(adjusted) < len(codes):
+            print(f"⚠️ {len(codes) - len(adjusted)} 只没有复权因子（先运行 adj_factor.py），按不复权判定")
+
+    params = SignalParams(ma_window=MA_WINDOW, min_list_days=MIN_LIST_DAYS)
+    signals = resolve(args.signals)
+    if args.incremental:
+        # 增量状态只维护周线 MA，其它信号不参与
+        signals = resolve(["WEEKLY_TREND_UP"])
+    signal_names = [signal.name for signal in signals]
+
+    print(f"⏳ Scanning {len(codes)} codes，workers={args.workers}，adjust={args.adjust}，signals={signal_names}")
+
+    with instrument.stage("scan"):
+        if args.incremental:
+            hits = scan_universe(
+                codes,
+                STORE_DIR,
+                MA_WINDOW,
+                MIN_LIST_DAYS,
+                workers=args.workers,
+                shard_size=args.shard_size,
+                incremental=True,
+                adjust=adjust,
+            )
+            hits = hits.rename(columns={"ma": f"ma{MA_WINDOW}"}).assign(WEEKLY_TREND_UP=1)
+            hits = hits.reindex(columns=output_columns(signals, params))
+        else:
+            hits = scan_signals(
+                codes,
+                STORE_DIR,
+                signal_names,
+                params,
+                adjust=adjust,
+                workers=args.workers,
+                batch_size=args.shard_size,
+                max_rss_mb=args.max_rss_mb,
+            )
+        hits = head_per_signal(hits, signal_names, MAX_OUTPUT)
+
+    print(f"🧠 峰值 RSS：{instrument.format_mb(instrument.peak_rss_mb())} MB（上限 {args.max_rss_mb:.0f} MB）")
+
+    # =========================
+    # 5. 输出结果（每只一行，每个信号一列 0 / 1，signal 为命中信号名，adjust 为实际复权口径）
+    # =========================
+
+    names = stocks.drop_duplicates(subset=["code"]).set_index("code")["name"]
+    value_columns = [c for c in hits.columns if c not in ["code", *signal_names]]
+
+    out_df = hits[value_columns].astype(float).round(2)
+    out_df.insert(0, "code", hits["code"])
+    out_df.insert(1, "name", hits["code"].map(names))
+    for name in signal_names:
+        out_df[name] = hits[name].astype(int)
+    out_df["signal"] = [
+        "|".join(name for name in signal_names if row[name]) for _, row in hits.iterrows()
+    ]
+    out_df["adjust"] = [args.adjust if code in adjusted else "none" for code in out_df["code"]]
+
+    out_file = OUTPUT_DIR / f"watchlist_{today_str}.csv"
+    out_df.to_csv(out_file, index=False, encoding="utf-8-sig")
+
+    print(f"\n✅ 扫描完成，候选股票：{len(out_df)} 只")
+    for name in signal_names:
+        print(f"   {name}: {int(out_df[name].sum())}")
+    print(f"📁 输出文件：{out_file}")
@@ -0,0 +1,431 @@
+# scan_daemon.py
+"""
+常驻扫描服务：尾部行情 & 中间量常驻内存，只重载变化的文件，本地 HTTP 毫秒级应答
+
+run_market_scan.py 每次都是冷启动（导入 pandas / 读股票列表 / 逐只读尾部）；
+盘中反复手工补数据再扫描时，改用本服务：
+
+- 启动时按全部已注册信号的最大需求，读一遍每只股票的尾部（后复权收盘 + 成交量）放进内存；
+  ETF 与股票共用存储但不参与扫描（与 run_market_scan 的股票列表一致）
+- 市场环境闸门与 run_market_scan 相同：本地宽度（breadth.py）最近覆盖完整一日的上涨占比 < MIN_UP_RATIO 时不输出命中，
+  宽度在启动时和每次存储变化后增量补算，扫描结果里带 gate 字段
+- 后台线程每 --interval 秒比较文件 mtime：
+    data/manual/stocks/*.json  新放入 / 覆盖的手工 JSON → merge_bars 并入存储
+    data/stocks/*.csv          旧版 CSV 被改写 → merge_bars 并入存储
+    data/bars/*/meta.json      存储被任何脚本更新（meta 为提交点）→ 只重读这几只的尾部
+    data/bars/adj_factor.sqlite  复权因子表被 adj_factor.py 更新 → 全部重读（因子不在这里拉取）
+- 扫描请求直接在内存里的尾部上判定；拼好的长表和 Intermediates 缓存到下次有变化为止，
+  同一版本数据上的重复扫描只剩信号判定本身
+- 数据校验索引（quality.sqlite）或常驻数据变化时重新读取排除名单（校验后又更新过的股票不再排除）
+
+接口（只监听 127.0.0.1）：
+    GET  /scan?signals=WEEKLY_TREND_UP,NEW_HIGH&limit=50   命中列表（JSON，列同 watchlist；每个信号最多 limit 只）+ 闸门状态
+    GET  /status                                           常驻只数 / 数据版本 / 最近一次重载 / 闸门状态
+    POST /reload                                           立即检查一次文件变化
+
+用法：
+    python scan_daemon.py --port 8766
+    curl 'http://127.0.0.1:8766/scan?signals=NEW_HIGH'
+"""
+
+import argparse
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+import adj_factor
+import instrument
+import validate_bars
+from bar_store import STORE_DIR, is_etf, merge_bars
+from breadth import BREADTH_FILE, latest_complete, update_breadth
+from data_sources import ManualSource
+from ref_cache import stock_list
+from scan_engine import SUSPEND_CHECK_DAYS, Intermediates, assemble_batch, read_tail
+from signals import SignalParams, evaluate_batch, head_per_signal, output_columns, resolve
+
+MANUAL_DIR = Path("data/manual/stocks")
+CSV_DIR = Path("data/stocks")
+
+PORT = 8766
+POLL_SEC = 2.0          # 文件变化检查间隔
+MA_WINDOW = 20
+MIN_LIST_DAYS = 250
+MAX_OUTPUT = 50         # 每个信号最多输出（与 run_market_scan 一致）
+MIN_UP_RATIO = 0.2      # 市场情绪闸门（与 run_market_scan 一致）
+
+
+def _mtimes(paths) -> dict:
+    """{路径: mtime_ns}（检查期间被删掉的文件跳过）"""
+    out = {}
+    for path in paths:
+        try:
+            out[path] = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            continue
+    return out
+
+
+def _changed(old: dict, new: dict) -> list:
+    return [path for path, mtime in new.items() if old.get(path) != mtime]
+
+
+class ScanService:
+    """常驻内存的尾部行情 + 变化检测 + 扫描"""
+
+    def __init__(
+            self,
+            store_dir: Path = STORE_DIR,
+            manual_dir: Path = MANUAL_DIR,
+            csv_dir: Path = CSV_DIR,
+            params: SignalParams | None = None,
+            adjust: str | None = "qfq",
+            breadth_file: Path = BREADTH_FILE,
+    ):
+        params = SignalParams() if params is None else params
+        self.store_dir = store_dir
+        self.manual_dir = manual_dir
+        self.csv_dir = csv_dir
+        self.params = params
+        self.adjust = adjust
+        self.breadth_file = breadth_file
+
+        # 按全部已注册信号的最大需求读尾部，之后任何信号组合都不用再读盘
+        needs = [signal.needs(params) for signal in resolve()]
+        self.weeks = max([w for w, _ in needs] + [1])
+        self.days = max([d for _, d in needs] + [SUSPEND_CHECK_DAYS])
+
+        self.lock = threading.Lock()
+        self.poll_lock = threading.Lock()     # 后台检查与 /reload 不并发入库
+        self.tails = {}             # code → read_tail 结果
+        self.latest = {}            # code → 最新后复权因子（qfq 输出换算）
+        self.adjusted = set()       # 有复权因子的代码（其余按不复权判定，adjust 列标 none）
+        self.version = 0            # 每次有股票重载 +1
+        self.reloaded_at = None
+        self.last_changes = {}
+        self._ctx = None            # (version, codes, Intermediates)
+        self._skipped = (None, None)    # ((quality.sqlite mtime, 数据版本), 排除名单)
+
+        self.names = {}
+        self.order = []             # 输出顺序（股票列表顺序，列表外的代码排在后面）
+        self.meta_mtimes = {}
+        self.json_mtimes = {}
+        self.csv_mtimes = {}
+        self.adj_mtime = None
+        self.gate = {"date": None, "up_ratio": None, "min_up_ratio": MIN_UP_RATIO, "open": True}
+
+    # -------------------------
+    # 载入 & 变化检测
+    # -------------------------
+
+    def _meta_paths(self) -> list:
+        return list(self.store_dir.glob("*/meta.json"))
+
+    def start(self) -> int:
+        """首次全量载入；当前的 JSON / CSV 视为已入库（只处理之后的变化）"""
+        stocks = stock_list(offline=True, store_dir=self.store_dir).drop_duplicates(subset=["code"])
+        self.names = dict(zip(stocks["code"], stocks["name"]))
+        self.order = stocks["code"].tolist()
+
+        self.json_mtimes = _mtimes(self.manual_dir.glob("*.json"))
+        self.csv_mtimes = _mtimes(self.csv_dir.glob("*.csv"))
+        meta = _mtimes(self._meta_paths())
+        self.adj_mtime = self._adj_mtime()
+        self._reload([path.parent.name for path in meta])
+        self.meta_mtimes = meta
+        self._update_gate()
+        return len(self.tails)
+
+    def _update_gate(self) -> None:
+        """增量补算本地宽度，按最近覆盖完整的一日上涨占比更新闸门（无数据时放行，与 run_market_scan 相同）"""
+        with instrument.stage("breadth"):
+            series = update_breadth(self.store_dir, self.breadth_file)
+        if series.empty:
+            self.gate = {"date": None, "up_ratio": None, "min_up_ratio": MIN_UP_RATIO, "open": True}
+            return
+        latest, _ = latest_complete(series)
+        self.gate = {
+            "date": str(latest["date"].date()),
+            "up_ratio": float(latest["up_ratio"]),
+            "min_up_ratio": MIN_UP_RATIO,
+            "open": bool(latest["up_ratio"] >= MIN_UP_RATIO),
+        }
+
+    def _adj_mtime(self) -> int | None:
+        path = adj_factor.adj_path(self.store_dir)
+        return path.stat().st_mtime_ns if path.exists() else None
+
+    def _ingest(self, code: str, df: pd.DataFrame, source: str) -> str:
+        if df.empty:
+            return "noop"
+        _, mode = merge_bars(code, df, self.store_dir, source=source)
+        return mode
+
+    def poll(self) -> dict:
+        """检查一次文件变化：新 JSON / CSV 先并入存储，再重读 meta 变化的股票"""
+        with self.poll_lock:
+            return self._poll()
+
+    def _poll(self) -> dict:
+        changes = Counter()
+
+        with instrument.stage("daemon_ingest"):
+            json_now = _mtimes(self.manual_dir.glob("*.json"))
+            source = ManualSource(self.manual_dir)
+            for path in _changed(self.json_mtimes, json_now):
+                try:
+                    changes[f"manual_{self._ingest(path.stem, source.fetch(path.stem), source.name)}"] += 1
+                except Exception as e:
+                    print(f"❌ {path.name} 并入失败: {e}")
+            self.json_mtimes = json_now
+
+            csv_now = _mtimes(self.csv_dir.glob("*.csv"))
+            for path in _changed(self.csv_mtimes, csv_now):
+                try:
+                    changes[f"csv_{self._ingest(path.stem.split('.')[0], pd.read_csv(path), 'csv')}"] += 1
+                except Exception as e:
+                    print(f"❌ {path.name} 并入失败: {e}")
+            self.csv_mtimes = csv_now
+
+        meta_now = _mtimes(self._meta_paths())
+        codes = [path.parent.name for path in _changed(self.meta_mtimes, meta_now)]
+        removed = [path.parent.name for path in self.meta_mtimes if path not in meta_now]
+        adj_now = self._adj_mtime()
+        if self.adjust is not None and adj_now != self.adj_mtime:
+            codes = [path.parent.name for path in meta_now]
+            changes["adj_factor"] += 1
+        self.adj_mtime = adj_now
+        if codes or removed:
+            self._reload(codes, removed=removed)
+            self._update_gate()
+            changes.update(reloaded=len(codes), removed=len(removed))
+        self.meta_mtimes = meta_now
+
+        changes = +changes      # 去掉计数为 0 的项
+        if changes:
+            self.last_changes = dict(changes)
+        return dict(changes)
+
+    def _reload(self, codes: list, removed: list = ()) -> None:
+        """重读 codes 的尾部（锁外读盘，锁内替换；ETF 不常驻）"""
+        codes = [code for code in codes if not is_etf(code)]
+        events = None
+        adjusted = set()
+        if self.adjust is not None:
+            # 因子表由 adj_factor.py 维护，这里只读
+            events = adj_factor.load_events(codes, self.store_dir)
+            adjusted = adj_factor.covered(codes, self.store_dir)
+
+        with instrument.stage("daemon_reload"):
+            tails = {code: read_tail(code, self.store_dir, self.weeks, events, self.days) for code in codes}
+
+        with self.lock:
+            for code in removed:
+                self.tails.pop(code, None)
+            self.adjusted.difference_update([*codes, *removed])
+            self.adjusted.update(adjusted)
+            for code, tail in tails.items():
+                if tail is None:
+                    self.tails.pop(code, None)
+                else:
+                    self.tails[code] = tail
+                    self.latest[code] = adj_factor.latest_factor((events or {}).get(code))
+            self.version += 1
+            self.reloaded_at = time.time()
+
+    def watch(self, interval: float = POLL_SEC) -> threading.Thread:
+        """后台线程定期 poll（出错只打印，不退出）"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    changes = self.poll()
+                except Exception as e:
+                    print(f"❌ 变化检查失败: {e}")
+                    continue
+                if changes:
+                    print(f"🔄 {time.strftime('%H:%M:%S')} {changes}")
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        return thread
+
+    # -------------------------
+    # 扫描
+    # -------------------------
+
+    def _context(self) -> tuple[list, Intermediates]:
+        """当前版本数据的长表 + 中间量（有变化才重拼，多个请求共用缓存）"""
+        with self.lock:
+            if self._ctx is not None and self._ctx[0] == self.version:
+                return self._ctx[1], self._ctx[2]
+            known = set(self.order)
+            codes = [code for code in self.order if code in self.tails]
+            codes += sorted(code for code in self.tails if code not in known)
+            batch = assemble_batch(len(codes), codes, [self.tails[code] for code in codes])
+            ctx = Intermediates(batch, self.weeks, self.days)
+            self._ctx = (self.version, codes, ctx)
+            return codes, ctx
+
+    def _excluded(self) -> dict:
+        """数据校验排除名单（quality.sqlite 或数据版本变化才重读，校验后更新过的股票不再排除；无索引为空）"""
+        path = validate_bars.quality_path(self.store_dir)
+        key = (path.stat().st_mtime_ns if path.exists() else None, self.version)
+        if key != self._skipped[0]:
+            with self.lock:
+                codes = list(self.tails)
+            skipped = validate_bars.excluded(
+                codes, self.store_dir, lookback_days=7 * (self.params.ma_window + 1)
+            )
+            self._skipped = (key, skipped or {})
+        return self._skipped[1]
+
+    def scan(self, names: list | None = None, limit: int = MAX_OUTPUT) -> pd.DataFrame:
+        """在常驻尾部上判定 names 中的信号；列：code, name, close, 附带列, 各信号 0 / 1, signal, adjust（没有因子的为 none）
+
+        闸门关闭（self.gate["open"] 为 False）时返回同样列的空表
+        """
+        signals = resolve(names)
+        _, ctx = self._context()
+        with instrument.stage("daemon_scan"):
+            hits = evaluate_batch(ctx, signals, self.params)[output_columns(signals, self.params)]
+
+        skipped = self._excluded()
+        if skipped:
+            hits = hits[~hits["code"].isin(list(skipped))]
+        hits = head_per_signal(hits, [signal.name for signal in signals], limit if self.gate["open"] else 0)
+
+        signal_names = [signal.name for signal in signals]
+        prices = ["close"] + [c for signal in signals for c in signal.price_columns(self.params)]
+        if self.adjust == "qfq" and not hits.empty:
+            latest = hits["code"].map(self.latest).fillna(1.0)
+            hits = hits.assign(**{col: hits[col] / latest for col in dict.fromkeys(prices)})
+
+        out = hits.drop(columns=signal_names).set_index("code").astype(float).round(2).reset_index()
+        out.insert(1, "name", out["code"].map(self.names).fillna(""))
+        for name in signal_names:
+            out[name] = hits[name].astype(int).to_numpy()
+        out["signal"] = ["|".join(name for name in signal_names if row[name]) for _, row in hits.iterrows()]
+        out["adjust"] = [self.adjust if code in self.adjusted else "none" for code in out["code"]]
+        return out
+
+    def status(self) -> dict:
+        with self.lock:
+            return {
+                "symbols": len(self.tails),
+                "version": self.version,
+                "reloaded_at": self.reloaded_at,
+                "last_changes": self.last_changes,
+                "weeks": self.weeks,
+                "days": self.days,
+                "adjust": self.adjust,
+                "adjusted": len(self.adjusted),
+                "gate": self.gate,
+                "rss_mb": instrument.round_mb(instrument.rss_mb()),
+            }
+
+
+# =========================
+# HTTP
+# =========================
+
+def make_handler(service: ScanService):
+    class ScanHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"    # keep-alive
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/status":
+                self.reply(200, service.status())
+                return
+            if url.path != "/scan":
+                self.reply(404, {"error": f"未知路径: {url.path}"})
+                return
+
+            query = parse_qs(url.query)
+            names = [n for value in query.get("signals", []) for n in value.split(",") if n] or None
+            started = time.perf_counter()
+            try:
+                limit = int(query.get("limit", [MAX_OUTPUT])[0])
+                hits = service.scan(names, limit)
+            except ValueError as e:
+                self.reply(400, {"error": str(e)})
+                return
+
+            rows = json.loads(hits.to_json(orient="records", force_ascii=False))
+            self.reply(200, {
+                "version": service.version,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+                "count": len(rows),
+                "gate": service.gate,
+                "hits": rows,
+            })
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/reload":
+                self.reply(404, {"error": f"未知路径: {self.path}"})
+                return
+            self.reply(200, {"changes": service.poll(), **service.status()})
+
+        def reply(self, status: int, body: dict):
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ScanHandler
+
+
+def serve(service: ScanService, port: int = PORT) -> ThreadingHTTPServer:
+    """创建（未启动的）扫描服务；port=0 时由系统分配端口"""
+    return ThreadingHTTPServer(("127.0.0.1", port), make_handler(service))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="常驻扫描服务")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--interval", type=float, default=POLL_SEC, help="文件变化检查间隔（秒）")
+    parser.add_argument("--adjust", choices=["qfq", "hfq", "none"], default="qfq", help="复权方式（输出价格口径）")
+    parser.add_argument("--store-dir", type=Path, default=STORE_DIR)
+    parser.add_argument("--manual-dir", type=Path, default=MANUAL_DIR)
+    parser.add_argument("--csv-dir", type=Path, default=CSV_DIR)
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.install_from_args("scan_daemon", args)
+
+    service = ScanService(
+        args.store_dir,
+        args.manual_dir,
+        args.csv_dir,
+        SignalParams(ma_window=MA_WINDOW, min_list_days=MIN_LIST_DAYS),
+        adjust=None if args.adjust == "none" else args.adjust,
+    )
+
+    started = time.perf_counter()
+    with instrument.stage("daemon_load"):
+        loaded = service.start()
+    print(f"📦 常驻 {loaded} 只（{service.weeks} 周 / {service.days} 根），"
+          f"耗时 {time.perf_counter() - started:.1f}s，RSS {instrument.format_mb(instrument.rss_mb())} MB")
+    gate = service.gate
+    if gate["date"] is None:
+        print("⚠️ 本地无行情数据，无法判断市场环境，谨慎放行")
+    else:
+        print(f"🌡 {gate['date']} 上涨占比 {gate['up_ratio']:.1%}，闸门{'打开' if gate['open'] else '关闭（不输出命中）'}")
+
+    service.watch(args.interval)
+    server = serve(service, args.port)
+    print(f"🛰 扫描服务：http://127.0.0.1:{server.server_address[1]}/scan（每 {args.interval:g}s 检查文件变化）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 已停止")
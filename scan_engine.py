@@ -0,0 +1,582 @@
+# scan_engine.py
+"""
+全市场周线扫描引擎（向量化）
+
+- 一次性把 data/bars 载入为「日期 × 代码」列式面板
+- 周线收盘 & MA 对全部代码一次算完（不再逐只 resample / rolling）
+- WEEKLY_TREND_UP 一次判定
+- 结果与逐只循环版本完全一致
+- 可按分片多进程并行（scan_universe），合并顺序与单进程一致
+- incremental=True 时改用 indicator_state 的持久化状态，只消化新增日线
+- streaming=True 时按批只读每只股票判定需要的尾部（最近 MA_WINDOW + 1 周），
+  上市天数 / 首根日期直接取 meta；常驻内存超过上限时批次自动减半
+- 流式批次上的周线矩阵 / MA / 近期成交量由 Intermediates 按需计算并缓存，
+  signals.py 的多个信号在同一遍里共用
+"""
+
+import gc
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import adj_factor
+import indicator_state
+import instrument
+from bar_store import STORE_DIR, from_days, load_universe, read_columns, read_meta, restore_prices
+
+SUSPEND_CHECK_DAYS = 10   # 最近 N 个交易日必须有成交量（防停牌/ST）
+SHARD_SIZE = 250          # 每个分片的股票数
+STREAM_BATCH = 500        # 流式扫描每批股票数
+MAX_RSS_MB = 1024         # 流式扫描常驻内存上限（MB）
+
+
+@dataclass
+class Panel:
+    """全市场日线面板（长表，按 代码 → 日期 排序）"""
+    bars: pd.DataFrame         # 列：code, date, close, volume
+    codes: list                # 面板内代码（保持传入顺序）
+
+
+@instrument.timed("load_panel")
+def load_panel(codes, store_dir: Path = STORE_DIR, adjust: str | None = None) -> Panel:
+    """从列式存储一次载入 codes，拼成一张长表（无需 parse 文本 / 日期）
+
+    adjust：None 不复权 / "hfq" 后复权 / "qfq" 前复权（按 adj_factor 事件表读取时相乘）
+    """
+    loaded, arrays, offsets = load_universe(codes, ["date", "close", "volume"], store_dir)
+
+    if not loaded:
+        empty = pd.DataFrame(columns=["code", "date", "close", "volume"])
+        return Panel(bars=empty, codes=[])
+
+    # 存储内已按日期排序去重，代码保持传入顺序
+    code_idx = np.repeat(np.arange(len(loaded)), np.diff(offsets))
+    close = restore_prices(arrays["close"])
+    if adjust is not None:
+        events = adj_factor.load_events(loaded, store_dir)
+        close = close * adj_factor.universe_factors(loaded, arrays["date"], offsets, events, adjust)
+
+    bars = pd.DataFrame({
+        "code": pd.Categorical.from_codes(code_idx, categories=loaded, ordered=True),
+        "date": pd.to_datetime(from_days(arrays["date"])),
+        "close": close,
+        "volume": arrays["volume"],
+    })
+
+    return Panel(bars=bars, codes=loaded)
+
+
+def weekly_close(panel: Panel) -> pd.DataFrame:
+    """周线收盘（周日为标签，「周 × 代码」宽表）
+
+    等价于逐只 df.resample("W", on="date").last()：
+    - 每周取最后一个非空收盘
+    - 整周无数据的周保留为 NaN（与 resample 一致）
+    """
+    bars = panel.bars
+    week = bars["date"] + pd.to_timedelta(6 - bars["date"].dt.dayofweek, unit="D")
+    week = week.dt.normalize()
+
+    wide = (
+        bars.assign(week=week)
+        .groupby(["week", "code"], observed=True)["close"]
+        .last()
+        .unstack("code")
+    )
+
+    full_weeks = pd.date_range(wide.index.min(), wide.index.max(), freq="W")
+    return wide.reindex(index=full_weeks, columns=panel.codes)
+
+
+@instrument.timed("weekly_scan")
+def scan_weekly_trend_up(
+        panel: Panel,
+        ma_window: int,
+        min_list_days: int,
+) -> pd.DataFrame:
+    """对整个面板一次性判定 WEEKLY_TREND_UP
+
+    返回命中代码（保持面板代码顺序），列：code, close, ma
+    """
+    if not panel.codes:
+        return pd.DataFrame(columns=["code", "close", "ma"])
+
+    bars = panel.bars
+    grouped = bars.groupby("code", observed=True, sort=False)
+
+    # -------------------------
+    # 基础过滤：上市天数 & 停牌
+    # -------------------------
+    rows = grouped.size().reindex(panel.codes)
+    recent_volume = (
+        grouped.tail(SUSPEND_CHECK_DAYS)
+        .groupby("code", observed=True)["volume"]
+        .sum()
+        .reindex(panel.codes)
+    )
+    eligible = (rows >= min_list_days) & (recent_volume != 0)
+
+    # -------------------------
+    # 周线 & MA（全市场一次）
+    # -------------------------
+    # 整数报价单位求和，与增量状态的均线逐位一致（浮点滚动均值有累积误差，
+    # 收盘恰好等于均线时会误判）
+    weekly = (weekly_close(panel) * indicator_state.PRICE_SCALE).round()
+    ma = weekly.rolling(ma_window).sum() / (indicator_state.PRICE_SCALE * ma_window)
+    weekly = weekly / indicator_state.PRICE_SCALE
+
+    # 每只股票自己的首/末周（逐只 resample 的范围）
+    dates = grouped["date"]
+    first_week = dates.min().reindex(panel.codes)
+    last_week = dates.max().reindex(panel.codes)
+    first_pos = weekly.index.get_indexer(
+        (first_week + pd.to_timedelta(6 - first_week.dt.dayofweek, unit="D")).dt.normalize()
+    )
+    last_pos = weekly.index.get_indexer(
+        (last_week + pd.to_timedelta(6 - last_week.dt.dayofweek, unit="D")).dt.normalize()
+    )
+
+    enough_weeks = (last_pos - first_pos + 1) >= ma_window + 1
+    eligible = eligible.to_numpy() & enough_weeks
+
+    col = np.arange(len(panel.codes))
+    prev_pos = np.maximum(last_pos - 1, 0)
+
+    close_arr = weekly.to_numpy()
+    ma_arr = ma.to_numpy()
+
+    this_close = close_arr[last_pos, col]
+    this_ma = ma_arr[last_pos, col]
+    last_close = close_arr[prev_pos, col]
+    last_ma = ma_arr[prev_pos, col]
+
+    # -------------------------
+    # 中长线趋势条件（唯一核心）
+    # -------------------------
+    hit = eligible & (this_close > this_ma) & (last_close <= last_ma)
+
+    return pd.DataFrame({
+        "code": np.asarray(panel.codes, dtype=object)[hit],
+        "close": this_close[hit],
+        "ma": this_ma[hit],
+    })
+
+
+@instrument.timed("state_scan")
+def scan_incremental(
+        codes: list,
+        store_dir: Path,
+        ma_window: int,
+        min_list_days: int,
+        adjust: bool = False,
+) -> pd.DataFrame:
+    """与 scan_weekly_trend_up 相同的判定，但基于周线增量状态（只读新增日线）
+
+    adjust：状态按后复权收盘（close / ma 为后复权价）
+    """
+    states, modes = indicator_state.sync_many(codes, "W", ma_window, SUSPEND_CHECK_DAYS, store_dir, adjust)
+
+    hits = []
+    for code, state in states.items():
+        if state.rows < min_list_days or indicator_state.recent_volume(state) == 0:
+            continue
+        if indicator_state.span_weeks(state) < ma_window + 1:
+            continue
+        if indicator_state.cross(state) != "BUY":
+            continue
+        this_close, this_ma, _, _ = indicator_state.ma_pair(state)
+        hits.append((code, this_close, this_ma))
+
+    return pd.DataFrame(hits, columns=["code", "close", "ma"])
+
+
+# =========================
+# 分片并行
+# =========================
+
+class Progress:
+    """按完成的股票数汇报进度（主进程里调用，跨 worker 汇总）"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.started = time.perf_counter()
+
+    def update(self, n: int) -> None:
+        self.done += n
+        elapsed = time.perf_counter() - self.started
+        pct = self.done / self.total * 100 if self.total else 100
+        print(f"⏳ Progress: {self.done}/{self.total} ({pct:.0f}%)，{elapsed:.1f}s")
+
+
+# =========================
+# 流式扫描（只读尾部）
+# =========================
+
+@dataclass
+class TailBatch:
+    """一批股票的尾部日线（长表，按 代码 → 日期 排序）"""
+    requested: int            # 本批请求的只数（含存储里没有的）
+    codes: list
+    rows: np.ndarray          # 每只股票的总行数（meta，上市天数判断）
+    first_day: np.ndarray     # 每只股票首根日期（天数，周数判断）
+    offsets: np.ndarray       # 第 i 只的尾部为 [offsets[i], offsets[i + 1])
+    date: np.ndarray          # int32 天数
+    ticks: np.ndarray         # int64 收盘报价单位数（复权后取整）
+    valid: np.ndarray         # 收盘非空
+    volume: np.ndarray        # float32
+
+
+class RssGuard:
+    """批次之间检查常驻内存：超过上限先回收，再把之后的批次减半"""
+
+    def __init__(self, max_rss_mb: float, batch_size: int):
+        self.max_rss_mb = max_rss_mb
+        self.batch_size = batch_size
+        self.peak_mb = instrument.rss_mb()
+
+    def check(self) -> None:
+        rss = instrument.rss_mb()
+        if rss is None:     # 读不到 RSS（Windows）：不设上限
+            return
+        self.peak_mb = rss if self.peak_mb is None else max(self.peak_mb, rss)
+        if rss <= self.max_rss_mb:
+            return
+        gc.collect()
+        if self.batch_size > 1:
+            self.batch_size = max(self.batch_size // 2, 1)
+            print(f"⚠️ RSS {rss:.0f} MB 超过上限 {self.max_rss_mb:.0f} MB，批次减为 {self.batch_size} 只")
+
+
+def tail_start(days: np.ndarray, weeks: int, volume_days: int) -> int:
+    """判定只需要的首行：最近 weeks 个自然周（含本周）& 最近 volume_days 根"""
+    first_week = indicator_state.week_end(int(days[-1])) - 7 * (weeks - 1)
+    start = int(np.searchsorted(days, first_week - 6))
+    return max(min(start, len(days) - volume_days), 0)
+
+
+def read_tail(
+        code: str,
+        store_dir: Path,
+        weeks: int,
+        events: dict | None = None,
+        days: int = SUSPEND_CHECK_DAYS,
+) -> tuple | None:
+    """单只股票的尾部：(总行数, 首根日期, 尾部日期, 收盘, 成交量)；存储里没有返回 None
+
+    只读最近 weeks 周 & 最近 days 根（取较长者）
+    events 不为空时收盘按后复权（与 load_panel(adjust="hfq") 逐位一致）
+    """
+    meta = read_meta(code, store_dir)
+    if meta is None or meta["rows"] == 0:
+        return None
+    arrays = read_columns(code, ["date", "close", "volume"], store_dir)
+    start = tail_start(arrays["date"], weeks, days)
+    tail_days = np.array(arrays["date"][start:])
+    close = restore_prices(arrays["close"][start:])
+    if events and code in events:
+        close = close * adj_factor.factors(tail_days, events[code], "hfq")
+    return (
+        meta["rows"],
+        int(arrays["date"][0]),
+        tail_days,
+        close,
+        np.asarray(arrays["volume"][start:], dtype=np.float32),
+    )
+
+
+def assemble_batch(requested: int, codes: list, tails: list) -> TailBatch:
+    """read_tail 的结果（与 codes 一一对应）拼成一批长表"""
+    parts = [tail[2:] for tail in tails]
+    if not parts:
+        parts = [(np.empty(0, dtype=np.int32), np.empty(0), np.empty(0, dtype=np.float32))]
+
+    close = np.concatenate([p[1] for p in parts])
+    valid = ~np.isnan(close)
+    ticks = np.zeros(len(close), dtype=np.int64)
+    ticks[valid] = np.round(close[valid] * indicator_state.PRICE_SCALE).astype(np.int64)
+
+    return TailBatch(
+        requested=requested,
+        codes=list(codes),
+        rows=np.array([tail[0] for tail in tails], dtype=np.int64),
+        first_day=np.array([tail[1] for tail in tails], dtype=np.int64),
+        offsets=np.concatenate([[0], np.cumsum([len(p[0]) for p in parts[:len(codes)]])]).astype(np.int64),
+        date=np.concatenate([p[0] for p in parts]).astype(np.int32),
+        ticks=ticks,
+        valid=valid,
+        volume=np.concatenate([p[2] for p in parts]),
+    )
+
+
+def iter_tail_batches(
+        codes: list,
+        store_dir: Path,
+        weeks: int,
+        guard: RssGuard,
+        events: dict | None = None,
+        days: int = SUSPEND_CHECK_DAYS,
+):
+    """逐批产出 TailBatch；每批只数取 guard.batch_size（可在批次之间变小）
+
+    每只只读最近 weeks 周 & 最近 days 根（取较长者），见 read_tail
+    """
+    pos = 0
+    while pos < len(codes):
+        chunk = codes[pos:pos + guard.batch_size]
+        pos += len(chunk)
+
+        loaded, tails = [], []
+        with instrument.stage("stream_read"):
+            for code in chunk:
+                tail = read_tail(code, store_dir, weeks, events, days)
+                if tail is not None:
+                    loaded.append(code)
+                    tails.append(tail)
+
+        yield assemble_batch(len(chunk), loaded, tails)
+
+
+class Intermediates:
+    """一批尾部上的共享中间量：首次用到时计算并缓存，多个信号同一遍复用
+
+    - 周线矩阵「代码 × 最近 weeks 周」，第 0 列为本周（每只股票自己的最后一周）
+    - 日线矩阵「代码 × 最近 days 根」，第 0 列为最新一根
+    - 价格一律按报价单位（整数）求和 / 比较，与全量 / 增量扫描逐位一致
+    """
+
+    def __init__(self, batch: TailBatch, weeks: int, days: int = SUSPEND_CHECK_DAYS):
+        self.batch = batch
+        self.weeks = weeks
+        self.days = days
+        self.n = len(batch.codes)
+        self._cache = {}
+
+        self.group = np.repeat(np.arange(self.n), np.diff(batch.offsets))
+        self.from_end = batch.offsets[self.group + 1] - 1 - np.arange(len(batch.date))
+        day = batch.date.astype(np.int64)
+        self.week = day + 6 - (day + 3) % 7          # 周末标签（周日）
+        self.last_week = self.week[batch.offsets[1:] - 1]
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def weekly(self) -> tuple[np.ndarray, np.ndarray]:
+        """每只股票每周最后一个非空收盘（报价单位）& 该周是否有值"""
+        def compute():
+            n, width = self.n, self.weeks
+            k = (self.last_week[self.group] - self.week) // 7
+            keep = self.batch.valid & (k < width)
+            keys = self.group[keep] * width + k[keep]
+            last = np.flatnonzero(np.append(keys[1:] != keys[:-1], True))
+            ticks = np.zeros(n * width, dtype=np.int64)
+            has = np.zeros(n * width, dtype=bool)
+            ticks[keys[last]] = self.batch.ticks[keep][last]
+            has[keys[last]] = True
+            return ticks.reshape(n, width), has.reshape(n, width)
+        return self._cached("weekly", compute)
+
+    def weekly_close(self, offset: int = 0) -> np.ndarray:
+        """往前第 offset 周的周收盘（该周无数据为 NaN）"""
+        ticks, has = self.weekly()
+        return np.where(has[:, offset], ticks[:, offset] / indicator_state.PRICE_SCALE, np.nan)
+
+    def weekly_ma(self, window: int, offset: int = 0) -> np.ndarray:
+        """截至往前第 offset 周的周线 MA（窗口内有空周为 NaN）"""
+        if offset + window > self.weeks:
+            raise ValueError(f"weekly_ma({window}, {offset}) 超出已读取的 {self.weeks} 周")
+
+        def compute():
+            ticks, has = self.weekly()
+            cols = slice(offset, offset + window)
+            total = ticks[:, cols].sum(axis=1)
+            return np.where(has[:, cols].all(axis=1), total / (indicator_state.PRICE_SCALE * window), np.nan)
+        return self._cached(("weekly_ma", window, offset), compute)
+
+    def span_weeks(self) -> np.ndarray:
+        """首根日线所在周到最后一周的自然周数（与逐只 resample 的周数一致）"""
+        def compute():
+            first_day = self.batch.first_day
+            first_week = first_day + 6 - (first_day + 3) % 7
+            return (self.last_week - first_week) // 7 + 1
+        return self._cached("span_weeks", compute)
+
+    def daily_ticks(self) -> np.ndarray:
+        """最近 days 根收盘（报价单位），缺失 / 不足为 -1"""
+        def compute():
+            keep = self.from_end < self.days
+            matrix = np.full((self.n, self.days), -1, dtype=np.int64)
+            ticks = np.where(self.batch.valid, self.batch.ticks, -1)
+            matrix[self.group[keep], self.from_end[keep]] = ticks[keep]
+            return matrix
+        return self._cached("daily_ticks", compute)
+
+    def recent_volume(self, days: int = SUSPEND_CHECK_DAYS) -> np.ndarray:
+        """最近 days 根成交量之和"""
+        if days > self.days:
+            raise ValueError(f"recent_volume({days}) 超出已读取的 {self.days} 根")
+
+        def compute():
+            recent = np.where(self.from_end < days, np.nan_to_num(self.batch.volume), 0)
+            return np.bincount(self.group, weights=recent, minlength=self.n)
+        return self._cached(("recent_volume", days), compute)
+
+    def listed(self, min_list_days: int) -> np.ndarray:
+        """基础过滤：上市天数 & 近期未停牌"""
+        return (self.batch.rows >= min_list_days) & (self.recent_volume() != 0)
+
+
+def weekly_trend_up(ctx: Intermediates, ma_window: int, min_list_days: int) -> tuple:
+    """WEEKLY_TREND_UP：本周收盘站上周线 MA、上周还在 MA 之下 → (命中, 本周收盘, 本周 MA)"""
+    this_close = ctx.weekly_close(0)
+    last_close = ctx.weekly_close(1)
+    this_ma = ctx.weekly_ma(ma_window, 0)
+    last_ma = ctx.weekly_ma(ma_window, 1)
+
+    eligible = ctx.listed(min_list_days) & (ctx.span_weeks() >= ma_window + 1)
+    hit = eligible & (this_close > this_ma) & (last_close <= last_ma)
+    return hit, this_close, this_ma
+
+
+def scan_tail_batch(batch: TailBatch, ma_window: int, min_list_days: int) -> pd.DataFrame:
+    """对一批尾部做 WEEKLY_TREND_UP 判定（与 scan_weekly_trend_up 结果一致）"""
+    if not batch.codes:
+        return pd.DataFrame(columns=["code", "close", "ma"])
+    ctx = Intermediates(batch, ma_window + 1)
+    hit, this_close, this_ma = weekly_trend_up(ctx, ma_window, min_list_days)
+    return pd.DataFrame({
+        "code": np.asarray(batch.codes, dtype=object)[hit],
+        "close": this_close[hit],
+        "ma": this_ma[hit],
+    })
+
+
+def scan_streaming(
+        codes: list,
+        store_dir: Path,
+        ma_window: int,
+        min_list_days: int,
+        adjust: bool = False,
+        batch_size: int = STREAM_BATCH,
+        max_rss_mb: float = MAX_RSS_MB,
+        progress: Progress | None = None,
+) -> pd.DataFrame:
+    """流式判定：按批只读尾部，内存与总历史长度无关
+
+    adjust：按后复权收盘判定（close / ma 为后复权价）
+    """
+    events = adj_factor.load_events(codes, store_dir) if adjust else None
+    guard = RssGuard(max_rss_mb, batch_size)
+
+    results = []
+    for batch in iter_tail_batches(codes, store_dir, ma_window + 1, guard, events):
+        with instrument.stage("stream_scan"):
+            results.append(scan_tail_batch(batch, ma_window, min_list_days))
+        if progress is not None:
+            progress.update(batch.requested)
+        del batch
+        guard.check()
+
+    results = [r for r in results if not r.empty]
+    if not results:
+        return pd.DataFrame(columns=["code", "close", "ma"])
+    return pd.concat(results, ignore_index=True)
+
+
+def scan_shard(
+        codes: list,
+        store_dir: Path,
+        ma_window: int,
+        min_list_days: int,
+        incremental: bool = False,
+        adjust: str | None = None,
+        streaming: bool = False,
+        max_rss_mb: float = MAX_RSS_MB,
+) -> pd.DataFrame:
+    """单个分片：载入 + 判定，只返回命中记录
+
+    adjust 不为空时一律按后复权判定（全量 / 增量 / 流式结果一致），输出的 close / ma 再换算成 adjust 口径
+    """
+    if incremental:
+        hits = scan_incremental(codes, store_dir, ma_window, min_list_days, adjust is not None)
+    elif streaming:
+        hits = scan_streaming(codes, store_dir, ma_window, min_list_days, adjust is not None, len(codes), max_rss_mb)
+    else:
+        panel = load_panel(codes, store_dir, "hfq" if adjust is not None else None)
+        hits = scan_weekly_trend_up(panel, ma_window, min_list_days)
+    return to_adjust(hits, store_dir, adjust)
+
+
+def to_adjust(
+        hits: pd.DataFrame,
+        store_dir: Path,
+        adjust: str | None,
+        columns: tuple = ("close", "ma"),
+) -> pd.DataFrame:
+    """后复权的命中价格换算成 adjust 口径（qfq：columns 除以最新后复权因子）"""
+    if adjust != "qfq" or hits.empty:
+        return hits
+    events = adj_factor.load_events(hits["code"], store_dir)
+    latest = hits["code"].map(lambda code: adj_factor.latest_factor(events.get(code)))
+    return hits.assign(**{col: hits[col] / latest for col in columns})
+
+
+def scan_universe(
+        codes,
+        store_dir: Path,
+        ma_window: int,
+        min_list_days: int,
+        workers: int = 1,
+        shard_size: int = SHARD_SIZE,
+        incremental: bool = False,
+        adjust: str | None = None,
+        streaming: bool = False,
+        max_rss_mb: float = MAX_RSS_MB,
+) -> pd.DataFrame:
+    """按分片扫描全部 codes
+
+    - workers <= 1：当前进程逐片执行
+    - workers > 1 ：进程池并行，每个 worker 只回传命中记录
+    - incremental ：走周线增量状态（首次运行会为每只股票建状态）
+    - adjust      ：None / "hfq" / "qfq"，复权后判定（避免除权缺口造成的假上穿 / 下穿）
+    - streaming   ：每批 shard_size 只，只读尾部；单进程时批次按 max_rss_mb 自适应
+    - 合并时按分片顺序拼接，结果顺序 = codes 顺序，与 workers 无关
+    """
+    codes = list(dict.fromkeys(codes))
+    shards = [codes[i:i + shard_size] for i in range(0, len(codes), shard_size)]
+    progress = Progress(len(codes))
+    results = [None] * len(shards)
+
+    if streaming and not incremental and workers <= 1:
+        hits = scan_streaming(
+            codes, store_dir, ma_window, min_list_days, adjust is not None, shard_size, max_rss_mb, progress
+        )
+        return to_adjust(hits, store_dir, adjust)
+
+    if workers <= 1:
+        for i, shard in enumerate(shards):
+            results[i] = scan_shard(shard, store_dir, ma_window, min_list_days, incremental, adjust, streaming, max_rss_mb)
+            progress.update(len(shard))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(
+                    scan_shard, shard, store_dir, ma_window, min_list_days, incremental, adjust, streaming, max_rss_mb
+                ): i
+                for i, shard in enumerate(shards)
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i] = future.result()
+                progress.update(len(shards[i]))
+
+    results = [r for r in results if r is not None and not r.empty]
+    if not results:
+        return pd.DataFrame(columns=["code", "close", "ma"])
+    return pd.concat(results, ignore_index=True)
@@ -0,0 +1,259 @@
+# signals.py
+"""
+信号插件：一次读取、一次算共享中间量，所有信号同一遍判定
+
+- 每个信号声明自己需要的周线周数 / 日线根数（needs），引擎按最大值只读每只股票的尾部
+- 周线矩阵、各窗口 MA、近期成交量等中间量一批内只算一次（scan_engine.Intermediates 缓存）
+- evaluate 返回 命中掩码 + 附带输出列；price_columns 中的列按复权口径换算
+- 输出多列 watchlist：每只命中任一信号的股票一行，每个信号一列 0 / 1 + 各信号的附带列
+
+新增信号（继承 Signal 并实现 needs / evaluate，注册后参与扫描）：
+
+    @register
+    class MySignal(Signal):
+        name = "MY_SIGNAL"
+
+        def needs(self, params):
+            return weeks, days
+
+        def evaluate(self, ctx, params):
+            return hit, {"my_col": values}
+
+多进程（workers > 1）时子进程里的注册表只保证有 signals.py 导入时注册的信号（spawn 启动的子进程不会执行
+调用方 if __name__ == "__main__" 里的注册）：自定义信号写进 signals.py，或用 workers=1；
+子进程里找不到的信号按未知信号报错，不会被悄悄跳过
+"""
+
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import adj_factor
+import indicator_state
+import instrument
+from bar_store import STORE_DIR
+from scan_engine import (
+    MAX_RSS_MB,
+    STREAM_BATCH,
+    SUSPEND_CHECK_DAYS,
+    Intermediates,
+    Progress,
+    RssGuard,
+    iter_tail_batches,
+    to_adjust,
+    weekly_trend_up,
+)
+
+
+@dataclass
+class SignalParams:
+    """全部信号共用的参数"""
+    ma_window: int = 20          # 周线 MA 周数
+    min_list_days: int = 250     # 至少上市的日线根数
+    new_high_days: int = 250     # 新高回看根数（约一年，与 breadth 一致）
+
+
+class Signal(ABC):
+    """信号插件基类"""
+    name = ""
+
+    @abstractmethod
+    def needs(self, params: SignalParams) -> tuple[int, int]:
+        """(最近周线周数（含本周）, 最近日线根数)"""
+
+    def price_columns(self, params: SignalParams) -> list:
+        """附带列里属于价格的列（qfq 时需换算）"""
+        return []
+
+    @abstractmethod
+    def evaluate(self, ctx: Intermediates, params: SignalParams) -> tuple[np.ndarray, dict]:
+        """返回 (命中掩码, {列名: 数组})，数组长度均为 ctx.n"""
+
+
+SIGNALS = {}
+
+
+def register(cls):
+    """类装饰器：注册信号（同名覆盖）"""
+    SIGNALS[cls.name] = cls()
+    return cls
+
+
+def resolve(names=None) -> list:
+    """按名称取信号（None = 全部已注册，保持注册顺序）"""
+    if names is None:
+        return list(SIGNALS.values())
+    unknown = [name for name in names if name not in SIGNALS]
+    if unknown:
+        raise ValueError(f"未知信号: {', '.join(unknown)}（可选 {', '.join(SIGNALS)}）")
+    return [SIGNALS[name] for name in dict.fromkeys(names)]
+
+
+# =========================
+# 内置信号
+# =========================
+
+@register
+class WeeklyTrendUp(Signal):
+    """周收盘上穿周线 MA（原 run_market_scan 的唯一规则）"""
+    name = "WEEKLY_TREND_UP"
+
+    def needs(self, params):
+        return params.ma_window + 1, SUSPEND_CHECK_DAYS
+
+    def price_columns(self, params):
+        return [f"ma{params.ma_window}"]
+
+    def evaluate(self, ctx, params):
+        hit, _, this_ma = weekly_trend_up(ctx, params.ma_window, params.min_list_days)
+        return hit, {f"ma{params.ma_window}": this_ma}
+
+
+@register
+class NewHigh(Signal):
+    """收盘创 new_high_days 根新高（含当日，与 breadth 的 new_highs 同口径）"""
+    name = "NEW_HIGH"
+
+    def needs(self, params):
+        return 1, params.new_high_days
+
+    def price_columns(self, params):
+        return [f"high{params.new_high_days}"]
+
+    def evaluate(self, ctx, params):
+        days = params.new_high_days
+        ticks = ctx.daily_ticks()[:, :days]
+        latest = ticks[:, 0]
+        prior = ticks[:, 1:].max(axis=1) if days > 1 else np.full(ctx.n, -1)
+        complete = (ticks >= 0).all(axis=1)
+
+        hit = ctx.listed(params.min_list_days) & complete & (latest >= prior)
+        return hit, {f"high{days}": np.where(prior >= 0, prior / indicator_state.PRICE_SCALE, np.nan)}
+
+
+# =========================
+# 引擎
+# =========================
+
+def output_columns(signals: list, params: SignalParams) -> list:
+    """watchlist 列顺序：code, close, 各信号附带列, 各信号 0 / 1"""
+    values = []
+    for signal in signals:
+        values += [c for c in signal.price_columns(params) if c not in values]
+    return ["code", "close"] + values + [signal.name for signal in signals]
+
+
+def head_per_signal(hits: pd.DataFrame, names: list, limit: int) -> pd.DataFrame:
+    """每个信号最多保留前 limit 只命中（按 hits 原顺序；命中多个信号的股票仍只占一行）
+
+    对合并后的表整体 head 会让命中多的信号挤掉其它信号
+    """
+    keep = np.zeros(len(hits), dtype=bool)
+    for name in names:
+        flag = hits[name].fillna(0).to_numpy(dtype=bool)
+        keep |= flag & (np.cumsum(flag) <= limit)
+    return hits[keep].reset_index(drop=True)
+
+
+def evaluate_batch(ctx: Intermediates, signals: list, params: SignalParams) -> pd.DataFrame:
+    """一批：依次判定全部信号（共用 ctx 里的中间量），只保留命中任一信号的股票"""
+    columns = {"close": ctx.weekly_close(0)}
+    flags = {}
+    for signal in signals:
+        hit, values = signal.evaluate(ctx, params)
+        flags[signal.name] = hit.astype(np.int8)
+        columns.update(values)
+
+    any_hit = np.logical_or.reduce([flag.astype(bool) for flag in flags.values()])
+    table = pd.DataFrame({"code": np.asarray(ctx.batch.codes, dtype=object), **columns, **flags})
+    return table[any_hit].reset_index(drop=True)
+
+
+def scan_signals_shard(
+        codes: list,
+        store_dir: Path,
+        names: list | None,
+        params: SignalParams,
+        adjust: str | None = None,
+        batch_size: int = STREAM_BATCH,
+        max_rss_mb: float = MAX_RSS_MB,
+        progress: Progress | None = None,
+) -> pd.DataFrame:
+    """流式判定一组代码：按批只读尾部，每批全部信号同一遍
+
+    adjust 不为空时一律按后复权判定，输出价格再换算成 adjust 口径
+    """
+    signals = resolve(names)
+    needs = [signal.needs(params) for signal in signals]
+    weeks = max([w for w, _ in needs] + [1])
+    days = max([d for _, d in needs] + [SUSPEND_CHECK_DAYS])
+
+    events = adj_factor.load_events(codes, store_dir) if adjust is not None else None
+    guard = RssGuard(max_rss_mb, batch_size)
+
+    results = []
+    for batch in iter_tail_batches(codes, store_dir, weeks, guard, events, days):
+        if batch.codes:
+            with instrument.stage("signal_scan"):
+                results.append(evaluate_batch(Intermediates(batch, weeks, days), signals, params))
+        if progress is not None:
+            progress.update(batch.requested)
+        del batch
+        guard.check()
+
+    columns = output_columns(signals, params)
+    results = [r for r in results if not r.empty]
+    if not results:
+        return pd.DataFrame(columns=columns)
+
+    hits = pd.concat(results, ignore_index=True)[columns]
+    prices = ["close"] + [c for signal in signals for c in signal.price_columns(params)]
+    return to_adjust(hits, store_dir, adjust, tuple(dict.fromkeys(prices)))
+
+
+def scan_signals(
+        codes,
+        store_dir: Path = STORE_DIR,
+        names: list | None = None,
+        params: SignalParams | None = None,
+        adjust: str | None = None,
+        workers: int = 1,
+        batch_size: int = STREAM_BATCH,
+        max_rss_mb: float = MAX_RSS_MB,
+) -> pd.DataFrame:
+    """全部 codes 一遍判定 names 中的信号（None = 全部已注册）
+
+    - workers <= 1：当前进程，批次按 max_rss_mb 自适应
+    - workers > 1 ：每 batch_size 只一个分片，进程池并行
+    - 结果顺序 = codes 顺序，与 workers 无关
+    params 为 None 时用默认参数
+    """
+    params = SignalParams() if params is None else params
+    codes = list(dict.fromkeys(codes))
+    progress = Progress(len(codes))
+
+    if workers <= 1:
+        return scan_signals_shard(codes, store_dir, names, params, adjust, batch_size, max_rss_mb, progress)
+
+    # 按名称传给子进程：None 在父进程展开，子进程缺哪个信号就报未知信号，而不是少判一个
+    names = [signal.name for signal in resolve(names)]
+    shards = [codes[i:i + batch_size] for i in range(0, len(codes), batch_size)]
+    results = [None] * len(shards)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(scan_signals_shard, shard, store_dir, names, params, adjust, len(shard), max_rss_mb): i
+            for i, shard in enumerate(shards)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            progress.update(len(shards[i]))
+
+    results = [r for r in results if r is not None and not r.empty]
+    if not results:
+        return pd.DataFrame(columns=output_columns(resolve(names), params))
+    return pd.concat(results, ignore_index=True)
@@ -0,0 +1,236 @@
+# sweep_params.py
+"""
+策略参数网格扫描（MA_WINDOW / STOP_LOSS_PCT / MIN_LIST_DAYS / MIN_UP_RATIO）
+
+- 价格面板只载入一次（默认前复权，--adjust，与 backtest.py 相同），随 initializer 发给每个 worker（不按组合重复传）
+- 各股票收盘价前缀和只算一次，任意窗口的均线 = 两次前缀和相减
+  （整数前缀和，均线精确；与 pandas rolling 只在「收盘价恰好等于均线」时可能不同）
+- 上市天数只算一次；前缀和与上市天数在完整历史上算，再切到 --start 之后回测（开头几天均线、上市天数不被截短）
+- 上涨占比取 breadth.py 的本地宽度序列（缺文件时按面板现算），作为开仓闸门
+- --point-in-time：成分股矩阵只算一次，只在当日成分股上开仓（universe_history）
+- 组合间并行，结果按指标排名输出
+
+用法：
+    python sweep_params.py --ma 10 20 30 60 --stop 0.02 0.03 0.05 --workers 4
+"""
+
+import argparse
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from backtest import (
+    INITIAL_CAPITAL,
+    MA_WINDOW,
+    RISK_PER_TRADE,
+    STOP_LOSS_PCT,
+    UNIVERSE_FILE,
+    load_price_panel,
+    run_backtest,
+    slice_panel,
+    to_matrix,
+)
+from bar_store import PRICE_DECIMALS, STORE_DIR
+from breadth import BREADTH_FILE, compute_breadth, load_breadth
+from universe_history import HISTORY_FILE, ever_members, load, membership_matrix
+
+OUTPUT_DIR = Path("sweep")
+
+MIN_LIST_DAYS = 250
+MIN_UP_RATIO = 0.2      # 上涨占比闸门（与 run_market_scan 一致）；0 = 不设
+
+RANK_BY = "sharpe"
+
+PRICE_SCALE = 10 ** PRICE_DECIMALS
+
+
+# =========================
+# 1. 共享中间量（只算一次）
+# =========================
+
+def prepare_shared(panel: dict, breadth: pd.DataFrame, start: str | None = None) -> tuple[dict, dict]:
+    """所有组合共用的前缀和 / 上市天数 / 上涨占比
+
+    panel 为完整历史（不按 start 过滤）：上市天数、均线窗口都从每只股票的第一根 K 线数起，
+    回测面板再切到 start 之后。返回 (回测面板, 共享中间量)
+    """
+    close = panel["long_close"]
+    counts = np.diff(panel["offsets"])
+
+    # 每只股票内部的行号（第几根 K 线）
+    rank = np.arange(len(close)) - np.repeat(panel["offsets"][:-1], counts)
+
+    # 价格按最小报价单位转成整数再求前缀和：任意窗口求和都精确，没有浮点累积误差
+    # NaN 不进前缀和，另记 NaN 个数，窗口内有 NaN 时均线为 NaN
+    is_nan = np.isnan(close)
+    ticks = np.round(np.where(is_nan, 0.0, close) * PRICE_SCALE).astype(np.int64)
+    csum = np.concatenate([[0], np.cumsum(ticks)])
+    cnan = np.concatenate([[0], np.cumsum(is_nan)])
+
+    sliced, rows = slice_panel(panel, start)
+
+    # 上涨占比：按面板日期对齐，没有宽度数据的日子为 NaN（闸门放行）
+    up_ratio = (
+        breadth.set_index("date")["up_ratio"]
+        .reindex(pd.to_datetime(sliced["dates"]))
+        .to_numpy()
+    )
+
+    return sliced, {
+        "rank": rank,
+        "csum": csum,
+        "cnan": cnan,
+        "rows": rows,
+        "list_days": to_matrix(sliced, rank[rows] + 1, 0),
+        "up_ratio": up_ratio,
+    }
+
+
+def ma_from_prefix(panel: dict, shared: dict, window: int) -> np.ndarray:
+    """前缀和相减得到任意窗口的均线矩阵（窗口可伸到 start 之前的历史）"""
+    idx = shared["rows"]
+    lo = np.maximum(idx + 1 - window, 0)
+
+    total = shared["csum"][idx + 1] - shared["csum"][lo]
+    nans = shared["cnan"][idx + 1] - shared["cnan"][lo]
+
+    valid = (shared["rank"][idx] >= window - 1) & (nans == 0)
+    ma_long = np.where(valid, total / (PRICE_SCALE * window), np.nan)
+    return to_matrix(panel, ma_long)
+
+
+# =========================
+# 2. worker
+# =========================
+
+_panel = None
+_shared = None
+_ma_cache = {}
+
+
+def _init_worker(panel: dict, shared: dict) -> None:
+    global _panel, _shared
+    _panel = panel
+    _shared = shared
+    _ma_cache.clear()
+
+
+def evaluate(params: dict) -> dict:
+    """跑一个参数组合，返回 参数 + 汇总指标"""
+    window = params["ma_window"]
+    if window not in _ma_cache:
+        _ma_cache[window] = ma_from_prefix(_panel, _shared, window)
+
+    entry_mask = (
+        (_shared["list_days"] >= params["min_list_days"])
+        & ~(_shared["up_ratio"] < params["min_up_ratio"])[:, None]
+    )
+    if "members" in _shared:
+        entry_mask &= _shared["members"]
+
+    result = run_backtest(
+        _panel,
+        ma=_ma_cache[window],
+        stop_loss_pct=params["stop_loss_pct"],
+        risk_per_trade=params["risk_per_trade"],
+        initial_capital=params["initial_capital"],
+        entry_mask=entry_mask,
+    )
+    return {**params, **result["summary"]}
+
+
+def build_grid(args) -> list:
+    keys = ["ma_window", "stop_loss_pct", "min_list_days", "min_up_ratio"]
+    grid = []
+    for values in itertools.product(args.ma, args.stop, args.min_list_days, args.min_up):
+        params = dict(zip(keys, values))
+        params["risk_per_trade"] = args.risk
+        params["initial_capital"] = args.capital
+        grid.append(params)
+    return grid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="策略参数网格扫描")
+    parser.add_argument("--codes", nargs="*", help="标的代码（默认 universe）")
+    parser.add_argument("--universe", type=Path, default=UNIVERSE_FILE)
+    parser.add_argument("--store-dir", type=Path, default=STORE_DIR)
+    parser.add_argument("--start", help="起始日期 YYYY-MM-DD")
+    parser.add_argument("--adjust", choices=["qfq", "hfq", "none"], default="qfq", help="复权方式（默认前复权）")
+    parser.add_argument("--ma", type=int, nargs="+", default=[MA_WINDOW])
+    parser.add_argument("--stop", type=float, nargs="+", default=[STOP_LOSS_PCT])
+    parser.add_argument("--min-list-days", type=int, nargs="+", default=[MIN_LIST_DAYS])
+    parser.add_argument("--min-up", type=float, nargs="+", default=[MIN_UP_RATIO], help="上涨占比闸门")
+    parser.add_argument("--breadth-file", type=Path, default=BREADTH_FILE)
+    parser.add_argument("--risk", type=float, default=RISK_PER_TRADE)
+    parser.add_argument("--capital", type=float, default=INITIAL_CAPITAL)
+    parser.add_argument("--rank-by", default=RANK_BY, help="排名指标（summary 字段）")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--out", type=Path, default=OUTPUT_DIR)
+    parser.add_argument("--point-in-time", action="store_true", help="只在当日成分股上开仓（时点成分股库）")
+    parser.add_argument("--history", type=Path, default=HISTORY_FILE, help="时点成分股库")
+    args = parser.parse_args()
+
+    history = load(args.history) if args.point_in_time else None
+    if history is not None and not history.codes:
+        print(f"⚠️ 时点成分股库为空：{args.history}（先运行 universe_history.py --bootstrap / --import-akshare）")
+        exit(1)
+    if args.codes:
+        codes = args.codes
+    elif history is not None:
+        codes = ever_members(history, args.start)
+    else:
+        codes = pd.read_csv(args.universe, dtype=str)["code"].tolist()
+
+    started = time.perf_counter()
+    full = load_price_panel(codes, args.store_dir, adjust=None if args.adjust == "none" else args.adjust)
+    breadth = load_breadth(args.breadth_file)
+    if breadth is None:
+        print(f"⚠️ 缺少 {args.breadth_file}，按回测面板现算宽度")
+        breadth = compute_breadth(full["codes"], args.store_dir)
+    panel, shared = prepare_shared(full, breadth, args.start)
+    del full
+    if history is not None:
+        _, shared["members"] = membership_matrix(history, panel["dates"], panel["codes"])
+    grid = build_grid(args)
+    print(f"📊 面板：{len(panel['codes'])} 只 × {len(panel['dates'])} 天")
+    print(f"🧮 参数组合：{len(grid)} 个，workers={args.workers}")
+
+    if args.workers <= 1:
+        _init_worker(panel, shared)
+        rows = []
+        for i, params in enumerate(grid, 1):
+            rows.append(evaluate(params))
+            print(f"⏳ Progress: {i}/{len(grid)}")
+    else:
+        with ProcessPoolExecutor(
+                max_workers=args.workers,
+                initializer=_init_worker,
+                initargs=(panel, shared),
+        ) as pool:
+            rows = []
+            for i, row in enumerate(pool.map(evaluate, grid), 1):
+                rows.append(row)
+                print(f"⏳ Progress: {i}/{len(grid)}")
+
+    table = (
+        pd.DataFrame(rows)
+        .sort_values(args.rank_by, ascending=False, na_position="last")
+        .reset_index(drop=True)
+    )
+    table.insert(0, "rank", np.arange(1, len(table) + 1))
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    out_file = args.out / f"sweep_{date.today()}.csv"
+    table.to_csv(out_file, index=False, encoding="utf-8-sig")
+
+    show = ["rank", "ma_window", "stop_loss_pct", "min_list_days", "min_up_ratio",
+            "total_return", "max_drawdown", "sharpe", "trades", "win_rate"]
+    print("\n" + table[show].head(10).to_string(index=False))
+    print(f"\n⏱ 耗时：{time.perf_counter() - started:.2f}s")
+    print(f"📁 输出文件：{out_file}")
@@ -0,0 +1,80 @@
+# trade_calendar.py
+"""
+A 股交易日历（本地缓存）
+
+- 缓存：data/calendar/trade_dates.csv（单列 date）
+- python trade_calendar.py 刷新（akshare 新浪交易日历，只在刷新时导入）
+- 无缓存 / 缓存未覆盖的日期：退化为「周一到周五」
+"""
+
+from datetime import datetime, time, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CALENDAR_FILE = Path("data/calendar/trade_dates.csv")
+
+MARKET_CLOSE = time(15, 30)     # 收盘 + 数据落地缓冲，之前当天 K 线视为未完成
+
+_cache = {}
+
+
+def load_trade_dates(calendar_file: Path = CALENDAR_FILE) -> np.ndarray | None:
+    """已缓存的交易日（datetime64[D]，升序），无缓存返回 None"""
+    if calendar_file not in _cache:
+        if not calendar_file.exists():
+            return None
+        dates = pd.read_csv(calendar_file)["date"]
+        _cache[calendar_file] = np.sort(pd.to_datetime(dates).to_numpy().astype("datetime64[D]"))
+    return _cache[calendar_file]
+
+
+def trade_dates_between(start, end, calendar_file: Path = CALENDAR_FILE) -> np.ndarray:
+    """[start, end] 内的交易日；超出缓存的部分按工作日补齐"""
+    start = np.datetime64(pd.Timestamp(start).date(), "D")
+    end = np.datetime64(pd.Timestamp(end).date(), "D")
+
+    days = np.arange(start, end + 1, dtype="datetime64[D]")
+    weekdays = days[np.is_busday(days)]
+
+    cached = load_trade_dates(calendar_file)
+    if cached is None or len(cached) == 0:
+        return weekdays
+
+    covered = (weekdays >= cached[0]) & (weekdays <= cached[-1])
+    known = cached[(cached >= start) & (cached <= end)]
+    return np.union1d(known, weekdays[~covered])
+
+
+def latest_trade_date(day, calendar_file: Path = CALENDAR_FILE) -> str:
+    """不晚于 day 的最近交易日（YYYY-MM-DD）"""
+    day = pd.Timestamp(day)
+    dates = trade_dates_between(day - timedelta(days=30), day, calendar_file)
+    return str(dates[-1])
+
+
+def expected_last_date(now: datetime | None = None, calendar_file: Path = CALENDAR_FILE) -> str:
+    """此刻本地数据「应有的」最后一根日 K 日期
+
+    收盘前当天 K 线还没走完，按上一交易日算
+    """
+    now = now or datetime.now()
+    day = now.date()
+    if now.time() < MARKET_CLOSE:
+        day -= timedelta(days=1)
+    return latest_trade_date(day, calendar_file)
+
+
+if __name__ == "__main__":
+    import akshare as ak
+
+    print("📅 Fetching trade calendar...")
+    df = ak.tool_trade_date_hist_sina()
+    df = df.rename(columns={"trade_date": "date"})[["date"]]
+
+    CALENDAR_FILE.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(CALENDAR_FILE, index=False)
+
+    print(f"✅ 交易日历：{df['date'].min()} ~ {df['date'].max()}，共 {len(df)} 天")
+    print(f"📁 输出：{CALENDAR_FILE}")
@@ -0,0 +1,315 @@
+# universe_history.py
+"""
+成分股时点库（point-in-time universe，universe/history.csv）
+
+每行一个区间：index, code, name, start, end
+- index：hs300 / dividend / st（st 为「名称带 ST」的区间，用来按当时状态去 ST）
+- [start, end)：start 当天起生效，end 当天起不再是成分股；end 为空 = 至今
+- 区间只追加 / 关闭，不删除：历史扫描 / 回测看到的是当时的成分股，没有幸存者偏差
+
+来源：
+- record_snapshot：generate_universe.py 每次拉到的当日成分股，与在册区间比对，新进开区间、调出关区间
+- import_akshare ：akshare 历史调入 / 调出记录（回填已有区间没覆盖到的日期段，可重复执行）
+
+查询（区间索引：按日期排序的差分数组，一次 cumsum）：
+- members_on(hist, D)               D 日成分股
+- membership_matrix(hist, dates)    「日期 × 代码」布尔矩阵，回测直接当 entry_mask
+
+用法：
+    python universe_history.py --bootstrap          # 用现有 universe/*.csv 记一次今天的快照
+    python universe_history.py --import-akshare     # 回填历史调入 / 调出
+    python universe_history.py --as-of 2020-06-30   # 查看某日成分股
+"""
+
+import argparse
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+UNIVERSE_DIR = Path("universe")
+HISTORY_FILE = UNIVERSE_DIR / "history.csv"
+
+INDEXES = {"hs300": "000300", "dividend": "000922"}     # 名称 → 中证指数代码
+ST_INDEX = "st"
+COLUMNS = ["index", "code", "name", "start", "end"]
+AKSHARE_COLUMNS = ["stock_code", "in_date", "out_date"]     # ak.index_stock_hist 的列
+
+OPEN_DATE = "9999-12-31"              # 区间比较时代替空的 end
+
+OPEN_END = np.iinfo(np.int64).max     # 未调出的区间终点
+
+
+# =========================
+# 1. 区间表读写
+# =========================
+
+def load_table(path: Path = HISTORY_FILE) -> pd.DataFrame:
+    """原始区间表（start / end 为 YYYY-MM-DD 字符串，end 可为空）"""
+    if not path.exists():
+        return pd.DataFrame(columns=COLUMNS)
+    return pd.read_csv(path, dtype=str, keep_default_na=False)[COLUMNS].replace({"end": {"": None}})
+
+
+def save_table(table: pd.DataFrame, path: Path = HISTORY_FILE) -> None:
+    table = table.sort_values(["index", "code", "start"], kind="stable")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table[COLUMNS].to_csv(path, index=False, encoding="utf-8-sig")
+
+
+def _close_and_open(table: pd.DataFrame, index: str, current: dict, day: str, starts: dict) -> pd.DataFrame:
+    """index 的在册区间与 current（code → name）比对：调出的关闭于 day，新进的从 starts.get(code, day) 起"""
+    is_open = (table["index"] == index) & table["end"].isna()
+    open_codes = set(table.loc[is_open, "code"])
+
+    gone = is_open & ~table["code"].isin(list(current))
+    table.loc[gone, "end"] = day
+
+    # 仍在册的更新为最新名称
+    stay = is_open & table["code"].isin(list(current))
+    table.loc[stay, "name"] = table.loc[stay, "code"].map(current)
+
+    new = [
+        {"index": index, "code": code, "name": name, "start": min(starts.get(code, day), day), "end": None}
+        for code, name in current.items() if code not in open_codes
+    ]
+    if new:
+        table = pd.concat([table, pd.DataFrame(new, columns=COLUMNS)], ignore_index=True)
+    return table
+
+
+def record_snapshot(
+        index: str,
+        frame: pd.DataFrame,
+        day: str | None = None,
+        path: Path = HISTORY_FILE,
+) -> dict:
+    """记录一次成分股快照（列：code, name，可选 start = 纳入日期）
+
+    同时按名称维护 st 区间（只对本次快照里出现的代码）
+    返回 {"added", "removed"} 只数
+    """
+    day = day or str(date.today())
+    table = load_table(path)
+    before = table[(table["index"] == index) & table["end"].isna()]["code"]
+
+    current = dict(zip(frame["code"], frame["name"]))
+    starts = {}
+    if "start" in frame.columns:
+        starts = {c: s for c, s in zip(frame["code"], frame["start"]) if isinstance(s, str) and s}
+    table = _close_and_open(table, index, current, day, starts)
+
+    # ST：本次出现的代码里，名称带 ST 的开区间、摘帽的关区间
+    st_open = (table["index"] == ST_INDEX) & table["end"].isna()
+    st_now = {code: name for code, name in current.items() if "ST" in name}
+    recovered = st_open & table["code"].isin(list(current)) & ~table["code"].isin(list(st_now))
+    table.loc[recovered, "end"] = day
+    st_known = set(table.loc[st_open & ~recovered, "code"])
+    new_st = [
+        {"index": ST_INDEX, "code": code, "name": name, "start": day, "end": None}
+        for code, name in st_now.items() if code not in st_known
+    ]
+    if new_st:
+        table = pd.concat([table, pd.DataFrame(new_st, columns=COLUMNS)], ignore_index=True)
+
+    save_table(table, path)
+    after = set(current)
+    return {"added": len(after - set(before)), "removed": len(set(before) - after)}
+
+
+def _uncovered(start: str, end: str | None, covered: list) -> list:
+    """[start, end) 去掉 covered 里已有区间（[(start, end)]，按 start 排序）后剩下的片段；end 为空 = 至今"""
+    stop = end if isinstance(end, str) else OPEN_DATE
+    pieces = []
+    cursor = start
+    for lo, hi in covered:
+        hi = hi if isinstance(hi, str) else OPEN_DATE
+        if hi <= cursor or lo >= stop:
+            continue
+        if lo > cursor:
+            pieces.append((cursor, lo))
+        cursor = max(cursor, hi)
+        if cursor >= stop:
+            break
+    if cursor < stop:
+        pieces.append((cursor, stop))
+    return [(lo, None if hi == OPEN_DATE else hi) for lo, hi in pieces]
+
+
+def import_akshare(index: str, path: Path = HISTORY_FILE) -> int:
+    """akshare 历史调入 / 调出记录回填，返回新增区间数
+
+    只追加：已有区间（快照 / 上次回填）原样保留，回填区间只补它们没覆盖到的日期段，重复导入不产生新区间
+    """
+    import akshare as ak
+
+    raw = ak.index_stock_hist(symbol=f"sh{INDEXES[index]}")
+    missing = [col for col in AKSHARE_COLUMNS if col not in raw.columns]
+    if missing:
+        raise ValueError(f"akshare index_stock_hist 缺少列: {missing}（实际列: {list(raw.columns)}）")
+
+    ends = pd.to_datetime(raw["out_date"], errors="coerce").dt.strftime("%Y-%m-%d")
+    imported = pd.DataFrame({
+        "code": raw["stock_code"].astype(str).str.zfill(6),
+        "start": pd.to_datetime(raw["in_date"]).dt.strftime("%Y-%m-%d"),
+        "end": [end if isinstance(end, str) else None for end in ends],
+    }).sort_values(["code", "start"], kind="stable")
+
+    table = load_table(path)
+    existing = table[table["index"] == index]
+    names = existing.drop_duplicates("code", keep="last").set_index("code")["name"]
+    covered = {}
+    for code, lo, hi in zip(existing["code"], existing["start"], existing["end"]):
+        covered.setdefault(code, []).append((lo, hi))
+
+    new = []
+    for code, lo, hi in zip(imported["code"], imported["start"], imported["end"]):
+        spans = sorted(covered.get(code, []), key=lambda span: span[0])
+        for piece in _uncovered(lo, hi, spans):
+            new.append({"index": index, "code": code, "name": names.get(code, ""), "start": piece[0], "end": piece[1]})
+            spans.append(piece)
+        covered[code] = spans
+
+    if new:
+        table = pd.concat([table, pd.DataFrame(new, columns=COLUMNS)], ignore_index=True)
+        save_table(table, path)
+    return len(new)
+
+
+# =========================
+# 2. 区间索引 & 向量化查询
+# =========================
+
+@dataclass
+class History:
+    """区间表的数组形式（按 start 排序）"""
+    codes: list               # 全部出现过的代码（排序）
+    names: dict               # code → 最近名称
+    index: np.ndarray         # 每个区间的 index（str）
+    code_idx: np.ndarray      # 每个区间的代码下标（codes 内）
+    start: np.ndarray         # int64 天数（含）
+    end: np.ndarray           # int64 天数（不含），OPEN_END = 至今
+
+
+def _days(values) -> np.ndarray:
+    return pd.to_datetime(pd.Series(values)).to_numpy().astype("datetime64[D]").astype(np.int64)
+
+
+def load(path: Path = HISTORY_FILE) -> History:
+    table = load_table(path)
+    codes = sorted(table["code"].unique())
+    end = table["end"]
+    has_end = end.notna().to_numpy()
+    end_days = np.full(len(table), OPEN_END, dtype=np.int64)
+    if has_end.any():
+        end_days[has_end] = _days(end[has_end])
+
+    start = _days(table["start"]) if len(table) else np.empty(0, dtype=np.int64)
+    order = np.argsort(start, kind="stable")
+    named = table[table["name"] != ""]
+    return History(
+        codes=codes,
+        names=dict(zip(named["code"], named["name"])),
+        index=table["index"].to_numpy(dtype=str)[order],
+        code_idx=np.searchsorted(codes, table["code"].to_numpy(dtype=str))[order],
+        start=start[order],
+        end=end_days[order],
+    )
+
+
+def _interval_matrix(hist: History, mask: np.ndarray, days: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """选中的区间 → 「日期 × 代码」是否在区间内（差分数组：起点 +1，终点 -1，按日期累加）
+
+    days 升序；cols 为每个 hist.codes 在输出里的列号（-1 = 不要）
+    """
+    out = np.zeros((len(days) + 1, int(cols.max()) + 1 if len(cols) else 0), dtype=np.int32)
+    col = cols[hist.code_idx[mask]]
+    keep = col >= 0
+    lo = np.searchsorted(days, hist.start[mask][keep])
+    hi = np.searchsorted(days, hist.end[mask][keep])
+    np.add.at(out, (lo, col[keep]), 1)
+    np.add.at(out, (hi, col[keep]), -1)
+    return np.cumsum(out, axis=0)[:-1] > 0
+
+
+def membership_matrix(
+        hist: History,
+        dates,
+        codes=None,
+        indexes=tuple(INDEXES),
+        exclude_st: bool = True,
+) -> tuple[list, np.ndarray]:
+    """「日期 × 代码」成分股布尔矩阵（任一 indexes 的成分，且当日不在 st 区间）
+
+    dates：升序日期序列；codes：列顺序（默认全部出现过的代码）
+    返回 (codes, matrix)
+    """
+    codes = list(codes) if codes is not None else hist.codes
+    days = _days(dates) if len(dates) else np.empty(0, dtype=np.int64)
+    cols = np.full(len(hist.codes), -1, dtype=np.int64)
+    pos = {code: i for i, code in enumerate(codes)}
+    for i, code in enumerate(hist.codes):
+        cols[i] = pos.get(code, -1)
+
+    matrix = np.zeros((len(days), len(codes)), dtype=bool)
+    if not len(hist.codes) or not (cols >= 0).any():
+        return codes, matrix
+
+    width = int(cols.max()) + 1
+    member = _interval_matrix(hist, np.isin(hist.index, list(indexes)), days, cols)
+    matrix[:, :width] = member
+    if exclude_st:
+        matrix[:, :width] &= ~_interval_matrix(hist, hist.index == ST_INDEX, days, cols)
+    return codes, matrix
+
+
+def members_on(hist: History, day, indexes=tuple(INDEXES), exclude_st: bool = True) -> list:
+    """day 当日的成分股代码（排序）"""
+    codes, matrix = membership_matrix(hist, [day], None, indexes, exclude_st)
+    return [code for code, hit in zip(codes, matrix[0]) if hit]
+
+
+def ever_members(hist: History, start=None, end=None, indexes=tuple(INDEXES)) -> list:
+    """[start, end] 内任一时刻属于 indexes 的代码（回测应载入的全集）"""
+    lo = _days([start])[0] if start is not None else np.iinfo(np.int64).min
+    hi = _days([end])[0] if end is not None else OPEN_END
+    mask = np.isin(hist.index, list(indexes)) & (hist.start <= hi) & (hist.end > lo)
+    return [hist.codes[i] for i in np.unique(hist.code_idx[mask])]
+
+
+def universe_on(hist: History, day) -> pd.DataFrame:
+    """day 当日的 universe 表（列：code, name），与 build_universe 输出同格式"""
+    codes = members_on(hist, day)
+    return pd.DataFrame({"code": codes, "name": [hist.names.get(code, "") for code in codes]})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="成分股时点库")
+    parser.add_argument("--bootstrap", action="store_true", help="用现有 universe/{hs300,dividend}.csv 记一次快照")
+    parser.add_argument("--date", default=str(date.today()), help="--bootstrap 的快照日期")
+    parser.add_argument("--import-akshare", action="store_true", help="回填 akshare 历史调入 / 调出（只补缺，不改已有区间）")
+    parser.add_argument("--as-of", help="查看某日成分股")
+    parser.add_argument("--history", type=Path, default=HISTORY_FILE)
+    args = parser.parse_args()
+
+    if args.bootstrap:
+        for index in INDEXES:
+            frame = pd.read_csv(UNIVERSE_DIR / f"{index}.csv", dtype=str)
+            changes = record_snapshot(index, frame, args.date, args.history)
+            print(f"📸 {index} @ {args.date}：新进 {changes['added']}，调出 {changes['removed']}")
+
+    if args.import_akshare:
+        for index in INDEXES:
+            print(f"📥 {index}：新增 {import_akshare(index, args.history)} 个区间")
+
+    hist = load(args.history)
+    print(f"📚 区间 {len(hist.start)} 个，代码 {len(hist.codes)} 只")
+
+    if args.as_of:
+        universe = universe_on(hist, args.as_of)
+        print(f"🎯 {args.as_of} 成分股（去 ST）：{len(universe)} 只")
+        print(universe.head(20).to_string(index=False))
+
+    print(f"📁 文件：{args.history}")
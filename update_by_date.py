@@ -0,0 +1,143 @@
+# update_by_date.py
+"""
+按交易日批量更新（一次请求一个交易日，而不是一只股票）
+
+- 每个缺失交易日一次 tushare daily(trade_date=...) 拿到全市场日线
+  或读取录制好的当日快照 data/snapshots/{YYYYMMDD}.csv
+- 整批一次性分发进列式存储（bar_store.append_many，纯追加不读历史）
+- 只更新存储里已有的股票；新代码需先用逐只更新补全历史
+- 落后超过 --max-days 个交易日的股票跳过（逐只补更省请求）
+- 从 tushare 拉到的交易日顺带录制为快照，可离线重放
+
+用法：
+    python update_by_date.py                      # tushare 按交易日
+    python update_by_date.py --source snapshot    # 只用本地快照
+"""
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import manifest
+from bar_store import STORE_DIR, append_many
+from data_sources import TushareSource, empty_batch, normalize
+from trade_calendar import expected_last_date, trade_dates_between
+
+SNAPSHOT_DIR = Path("data/snapshots")
+
+TS_TOKEN = os.getenv("TUSHARE_TOKEN")
+SLEEP_SEC = 0.6         # TuShare 免费限频
+MAX_DAYS = 20           # 最多按交易日补多少天
+
+
+def snapshot_path(snapshot_dir: Path, trade_date: str) -> Path:
+    return snapshot_dir / f"{trade_date}.csv"
+
+
+def read_snapshot(snapshot_dir: Path, trade_date: str) -> pd.DataFrame | None:
+    """读取某交易日快照（统一批次），不存在返回 None"""
+    path = snapshot_path(snapshot_dir, trade_date)
+    if not path.exists():
+        return None
+    return normalize(pd.read_csv(path, dtype={"code": str}, float_precision="round_trip"))
+
+
+def write_snapshot(snapshot_dir: Path, trade_date: str, batch: pd.DataFrame) -> None:
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    path = snapshot_path(snapshot_dir, trade_date)
+    tmp_path = path.with_name(path.name + ".tmp")
+    batch.to_csv(tmp_path, index=False, date_format="%Y-%m-%d")
+    os.replace(tmp_path, path)
+
+
+def pending_dates(last_dates: pd.Series, max_days: int) -> tuple[list, str]:
+    """需要补的交易日（YYYYMMDD）及覆盖下限（早于它的股票不管）"""
+    expected = expected_last_date()
+    window = trade_dates_between(pd.Timestamp(expected) - pd.Timedelta(days=max_days * 2 + 14), expected)
+    window = window[-max_days:]
+    floor = str(window[0] - np.timedelta64(1, "D"))
+
+    in_range = last_dates[last_dates >= floor]
+    if in_range.empty:
+        return [], floor
+
+    oldest = in_range.min()
+    dates = [str(d).replace("-", "") for d in window if str(d) > oldest]
+    return dates, floor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="按交易日批量更新全市场日线")
+    parser.add_argument("--source", choices=["tushare", "snapshot"], default="tushare")
+    parser.add_argument("--snapshot-dir", type=Path, default=SNAPSHOT_DIR)
+    parser.add_argument("--store-dir", type=Path, default=STORE_DIR)
+    parser.add_argument("--max-days", type=int, default=MAX_DAYS, help="最多补多少个交易日")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+
+    # -------------------------
+    # 1. 清单 → 需要补的交易日
+    # -------------------------
+    last_dates = manifest.load(args.store_dir)["last_date"].dropna()
+    if last_dates.empty:
+        print("❌ 存储为空，请先用逐只更新 / migrate_csv_to_store.py 建历史")
+        raise SystemExit(1)
+
+    dates, floor = pending_dates(last_dates, args.max_days)
+    behind = int((last_dates < floor).sum())
+    print(f"🗂 存储股票数：{len(last_dates)}，待补交易日：{len(dates)} 个")
+    if behind:
+        print(f"⚠️ {behind} 只落后超过 {args.max_days} 个交易日，跳过（请用逐只更新）")
+
+    # -------------------------
+    # 2. 每个交易日一次请求 / 一个快照
+    # -------------------------
+    source = TushareSource(TS_TOKEN, sleep=SLEEP_SEC) if args.source == "tushare" else None
+    frames = [empty_batch()]
+    missing = []
+    requests_made = 0
+
+    for trade_date in dates:
+        batch = read_snapshot(args.snapshot_dir, trade_date)
+        if batch is None and source is not None:
+            if requests_made:
+                time.sleep(SLEEP_SEC)
+            requests_made += 1
+            try:
+                batch = source.fetch_trade_date(trade_date)
+            except Exception as e:
+                print(f"❌ {trade_date} 拉取失败: {e}")
+                batch = None
+            if batch is not None and not batch.empty:
+                write_snapshot(args.snapshot_dir, trade_date, batch)
+
+        if batch is None or batch.empty:
+            print(f"⚠️ {trade_date} 无数据（快照缺失 / 尚未发布）")
+            missing.append(pd.Timestamp(trade_date))
+            continue
+
+        print(f"📥 {trade_date}：{len(batch)} 只")
+        frames.append(batch)
+
+    # -------------------------
+    # 3. 只留存储里已有、日期晚于各自最后日期、且中间没有缺失交易日的行，一次分发
+    # -------------------------
+    market = pd.concat(frames, ignore_index=True)
+    market = market[market["code"].map(last_dates).fillna("") >= floor]
+    last = pd.to_datetime(market["code"].map(last_dates))
+
+    # 各股票最后日期之后的第一个缺失交易日：此日及之后的行不能跳着补
+    missing = np.array(missing, dtype="datetime64[ns]")
+    blocked = np.append(missing, np.datetime64("NaT", "ns"))[np.searchsorted(missing, last.to_numpy(), side="right")]
+    blocked = pd.Series(blocked, index=market.index)
+    fresh = market[(market["date"] > last) & (blocked.isna() | (market["date"] < blocked))]
+
+    modes = append_many(fresh, args.store_dir, source=source.name if source else "snapshot")
+
+    print(f"\n🎯 完成：请求 {requests_made} 次，写入 {len(fresh)} 根 K 线，{dict(modes)}")
+    print(f"⏱ 耗时：{time.perf_counter() - started:.2f}s")
@@ -4,16 +4,18 @@
 - 极低频
 - 自动断点
 - 失败不影响整体
+- 退出时输出各阶段耗时 / 内存报告（--report / --profile / --trace-memory）
 """
 
-import time
+import argparse
 from pathlib import Path
 
-import akshare as ak
 import pandas as pd
 
-DATA_DIR = Path("data/stocks")
-DATA_DIR.mkdir(parents=True, exist_ok=True)
+import instrument
+from bar_store import STORE_DIR, merge_bars
+from data_sources import AkshareSource
+from manifest import stale_symbols
 
 UNIVERSE_FILE = Path("universe/final_universe.csv")
 
@@ -22,79 +24,45 @@ SLEEP_SEC = 5  # 每只之间休眠
 START_DATE = "20180101"
 
 if __name__ == '__main__':
-    universe = pd.read_csv(UNIVERSE_FILE, dtype=str)
+    parser = argparse.ArgumentParser(description="akshare 日线更新")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.install_from_args("update_data_akshare", args)
+
+    with instrument.stage("universe"):
+        universe = pd.read_csv(UNIVERSE_FILE, dtype=str)
 
     processed = 0
 
     print(f"📊 Universe 股票数：{len(universe)}")
 
-    for _, row in universe.iterrows():
-        if processed >= MAX_PER_RUN:
-            break
+    # -------------------------
+    # 只查清单挑出过期股票（不打开行情文件）
+    # -------------------------
+    with instrument.stage("stale_symbols"):
+        jobs = stale_symbols(universe["code"], STORE_DIR, START_DATE)
+    print(f"🗂 需要更新：{len(jobs)} 只")
 
-        code = row["code"]
-        file_path = DATA_DIR / f"{code}.csv"
+    # akshare 在第一次真正拉取时才导入（很慢）
+    source = AkshareSource(asset="stock", sleep=SLEEP_SEC)
 
+    for code, df, error in source.fetch_batch(jobs):
         print(f"\n🔄 更新 {code}")
 
-        # -------------------------
-        # 判断是否已有数据
-        # -------------------------
-        if file_path.exists():
-            try:
-                existing = pd.read_csv(file_path)
-                last_date = existing["date"].max()
-                start_date = last_date.replace("-", "")
-            except Exception:
-                start_date = START_DATE
-        else:
-            start_date = START_DATE
-
-        # 判断 start_date 是否已经是今天或更晚
-        today_str = pd.Timestamp.today().strftime("%Y%m%d")
-        if start_date >= today_str:
-            print("⚠️ 数据已是最新，无需更新")
-            continue
-
-        try:
-            df = ak.stock_zh_a_hist(
-                symbol=code,
-                period="daily",
-                start_date=start_date,
-                adjust=""
-            )
-        except Exception as e:
-            print(f"❌ 拉取失败: {e}")
-            time.sleep(SLEEP_SEC)
+        if error is not None:
+            print(f"❌ 拉取失败: {error}")
             continue
 
-        if df is None or df.empty:
+        if df.empty:
             print("⚠️ 无新数据")
-            time.sleep(SLEEP_SEC)
             continue
 
-        df = df.rename(columns={
-            "日期": "date",
-            "开盘": "open",
-            "最高": "high",
-            "最低": "low",
-            "收盘": "close",
-            "成交量": "volume",
-        })
+        rows, mode = merge_bars(code, df, STORE_DIR, source=source.name)
 
-        df = df[["date", "open", "high", "low", "close", "volume"]]
-
-        if file_path.exists():
-            combined = pd.concat([existing, df]).drop_duplicates(subset=["date"])
-        else:
-            combined = df
-
-        combined = combined.sort_values("date")
-        combined.to_csv(file_path, index=False)
-
-        print(f"✅ 更新完成，共 {len(combined)} 行")
+        print(f"✅ 更新完成（{mode}），共 {rows} 行")
 
         processed += 1
-        time.sleep(SLEEP_SEC)
+        if processed >= MAX_PER_RUN:
+            break
 
     print(f"\n🎯 本次更新完成：{processed} 只")
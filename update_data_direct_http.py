@@ -1,137 +1,92 @@
 # update_data.py
 """
 只更新 universe 内股票的日线数据（Eastmoney 直连版）
-- 极低频
+- 并发拉取 + 连接池复用
+- 令牌桶限速，失败抖动退避重试
 - 自动断点
 - 失败不影响整体
+- 退出时输出各阶段耗时 / 内存报告（HTTP 请求数 / 重试 / 限速等待 / 退避）
+- ETF 与股票同一条管线、同一个存储：--universe universe/final_universe.csv universe/etf.csv
 """
 
-import time
-import requests
+import argparse
 from pathlib import Path
 
 import pandas as pd
 
-DATA_DIR = Path("data/stocks")
-DATA_DIR.mkdir(parents=True, exist_ok=True)
+import instrument
+from bar_store import STORE_DIR, merge_bars
+from data_sources import EastmoneySource
+from kline_fetcher import (
+    BURST,
+    CONCURRENCY,
+    EASTMONEY_BASE_URL,
+    MAX_RETRIES,
+    RATE_PER_SEC,
+)
+from manifest import stale_symbols
 
 UNIVERSE_FILE = Path("universe/final_universe.csv")
 
-MAX_PER_RUN = 10
-SLEEP_SEC = 5
+MAX_PER_RUN = None      # None = 全部 universe
 START_DATE = "20180101"
 
 
-def fetch_daily_kline_eastmoney(symbol: str, start_date: str) -> dict:
-    """直接调用 Eastmoney K 线 API，返回 JSON"""
-    market_code = 1 if symbol.startswith("6") else 0
-
-    url = (
-        "https://push2his.eastmoney.com/api/qt/stock/kline/get"
-        "?fields1=f1%2Cf2%2Cf3%2Cf4%2Cf5%2Cf6"
-        "&fields2=f51%2Cf52%2Cf53%2Cf54%2Cf55%2Cf56%2Cf57%2Cf58%2Cf59%2Cf60%2Cf61%2Cf116"
-        "&ut=7eea3edcaed734bea9cbfc24409ed989"
-        "&klt=101"
-        "&fqt=0"
-        f"&secid={market_code}.{symbol}"
-        f"&beg={start_date}"
-        "&end=20500101"
-    )
-
-    resp = requests.get(url, timeout=10)
-    resp.raise_for_status()
-    return resp.json()
-
-
-def parse_eastmoney_klines_to_df(raw: dict) -> pd.DataFrame:
-    """解析 Eastmoney klines → 标准 DataFrame"""
-    data = raw.get("data")
-    if not data or "klines" not in data:
-        return pd.DataFrame()
-
-    rows = []
-    for line in data["klines"]:
-        parts = line.split(",")
-        if len(parts) < 6:
-            continue
-
-        rows.append({
-            "date": parts[0],
-            "open": float(parts[1]),
-            "close": float(parts[2]),
-            "high": float(parts[3]),
-            "low": float(parts[4]),
-            "volume": float(parts[5]),
-        })
-
-    return pd.DataFrame(rows)
-
-
 if __name__ == "__main__":
-    universe = pd.read_csv(UNIVERSE_FILE, dtype=str)
+    parser = argparse.ArgumentParser(description="Eastmoney 日线并发更新")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="并发数")
+    parser.add_argument("--rate", type=float, default=RATE_PER_SEC, help="每秒请求数上限")
+    parser.add_argument("--burst", type=int, default=BURST, help="令牌桶容量")
+    parser.add_argument("--retries", type=int, default=MAX_RETRIES, help="单只最多重试次数")
+    parser.add_argument("--max", type=int, default=MAX_PER_RUN, help="本次最多更新只数")
+    parser.add_argument("--base-url", default=EASTMONEY_BASE_URL, help="API 地址（可指向本地 mock）")
+    parser.add_argument("--universe", type=Path, nargs="+", default=[UNIVERSE_FILE], help="标的列表 CSV（code 列，可多个）")
+    parser.add_argument("--start", default=START_DATE, help="无本地数据时的起始日期 YYYYMMDD")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.install_from_args("update_data_direct_http", args)
+
+    with instrument.stage("universe"):
+        universe = pd.concat([pd.read_csv(path, dtype=str) for path in args.universe], ignore_index=True)
+    print(f"📊 Universe 标的数：{len(universe)}")
+
+    # -------------------------
+    # 断点判断（只查清单）
+    # -------------------------
+    with instrument.stage("stale_symbols"):
+        jobs = stale_symbols(universe["code"], STORE_DIR, args.start)
+
+    if args.max is not None:
+        jobs = jobs[:args.max]
+
+    print(f"🔄 待更新：{len(jobs)} 只（并发 {args.concurrency}，限速 {args.rate}/s）")
+
+    # -------------------------
+    # 并发拉取，主线程解析 + 落盘
+    # -------------------------
     processed = 0
+    failed = 0
+
+    source = EastmoneySource(
+        concurrency=args.concurrency,
+        rate=args.rate,
+        burst=args.burst,
+        max_retries=args.retries,
+        base_url=args.base_url,
+    )
 
-    print(f"📊 Universe 股票数：{len(universe)}")
-
-    for _, row in universe.iterrows():
-        if processed >= MAX_PER_RUN:
-            break
-
-        code = row["code"]
-        file_path = DATA_DIR / f"{code}.csv"
-
-        print(f"\n🔄 更新 {code}")
-
-        # -------------------------
-        # 断点判断
-        # -------------------------
-        if file_path.exists():
-            try:
-                existing = pd.read_csv(file_path)
-                last_date = existing["date"].max()
-                start_date = last_date.replace("-", "")
-            except Exception:
-                start_date = START_DATE
-        else:
-            start_date = START_DATE
-
-        today_str = pd.Timestamp.today().strftime("%Y%m%d")
-        if start_date >= today_str:
-            print("⚠️ 数据已是最新，无需更新")
-            continue
-
-        # -------------------------
-        # 拉取 + 解析
-        # -------------------------
-        try:
-            raw = fetch_daily_kline_eastmoney(code, start_date)
-            df = parse_eastmoney_klines_to_df(raw)
-        except Exception as e:
-            print(f"❌ 拉取失败: {e}")
-            time.sleep(SLEEP_SEC)
+    for code, df, error in source.fetch_batch(jobs):
+        if error is not None:
+            print(f"❌ {code} 拉取失败: {error}")
+            failed += 1
             continue
 
         if df.empty:
-            print("⚠️ 无新数据")
-            time.sleep(SLEEP_SEC)
+            print(f"⚠️ {code} 无新数据")
             continue
 
-        # -------------------------
-        # 合并 & 保存
-        # -------------------------
-        if file_path.exists():
-            combined = (
-                pd.concat([existing, df])
-                .drop_duplicates(subset=["date"])
-                .sort_values("date")
-            )
-        else:
-            combined = df.sort_values("date")
-
-        combined.to_csv(file_path, index=False)
-        print(f"✅ 更新完成，共 {len(combined)} 行")
-
+        rows, mode = merge_bars(code, df, STORE_DIR, source=source.name)
+        print(f"✅ {code} 更新完成（{mode}），共 {rows} 行")
         processed += 1
-        time.sleep(SLEEP_SEC)
 
-    print(f"\n🎯 本次更新完成：{processed} 只")
+    print(f"\n🎯 本次更新完成：{processed} 只，失败 {failed} 只")
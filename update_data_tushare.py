@@ -1,65 +1,51 @@
-import tushare as ts
-import pandas as pd
-from pathlib import Path
-import time
+import argparse
 import os
 
+import pandas as pd
+
+import instrument
+from bar_store import STORE_DIR, merge_bars
+from data_sources import TushareSource
+from manifest import stale_symbols
+
 # ========== 配置 ==========
 TS_TOKEN = os.getenv("TUSHARE_TOKEN")
 UNIVERSE_FILE = "universe/final_universe.csv"
-DATA_DIR = Path("data/stocks")
-DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 START_DATE = "20180101"
 SLEEP_SEC = 0.6   # TuShare 免费限频
 
-# ========== 初始化 ==========
-ts.set_token(TS_TOKEN)
-pro = ts.pro_api()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="tushare 日线更新")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.install_from_args("update_data_tushare", args)
 
-universe = pd.read_csv(UNIVERSE_FILE, dtype={"code": str})
-print(f"📊 Universe 股票数：{len(universe)}")
+    with instrument.stage("universe"):
+        universe = pd.read_csv(UNIVERSE_FILE, dtype={"code": str})
+    print(f"📊 Universe 股票数：{len(universe)}")
 
-# ========== 主循环 ==========
-for _, row in universe.iterrows():
-    code = row["code"].zfill(6)
-    name = row.get("name", "")
+    # 只查清单，已是最新的跳过（过期的从最后日期起增量拉）
+    universe["code"] = universe["code"].str.zfill(6)
+    with instrument.stage("stale_symbols"):
+        jobs = stale_symbols(universe["code"], STORE_DIR, START_DATE)
+    print(f"🗂 需要更新：{len(jobs)} 只")
 
-    ts_code = f"{code}.SH" if code.startswith("6") else f"{code}.SZ"
-    out_file = DATA_DIR / f"{ts_code}.csv"
+    # ========== 主循环 ==========
+    # 只差最近几个交易日的股票合并为按交易日拉全市场，其余逐只
+    source = TushareSource(TS_TOKEN, sleep=SLEEP_SEC)
+    names = universe.set_index("code")["name"] if "name" in universe.columns else {}
 
-    print(f"\n🔄 更新 {ts_code} {name}")
+    for code, df, error in source.fetch_batch(jobs):
+        print(f"\n🔄 更新 {source.ts_code(code)} {names.get(code, '')}")
 
-    try:
-        df = ts.pro_bar(
-            ts_code=ts_code,
-            asset="E",
-            adj=None,
-            freq="D",
-            start_date=START_DATE
-        )
+        if error is not None:
+            print(f"❌ 拉取失败: {error}")
+            continue
 
-        if df is None or df.empty:
+        if df.empty:
             print("⚠️ 无数据，跳过")
             continue
 
-        df = df.sort_values("trade_date")
-        df.rename(columns={
-            "trade_date": "date",
-            "open": "open",
-            "high": "high",
-            "low": "low",
-            "close": "close",
-            "vol": "volume"
-        }, inplace=True)
-
-        df["date"] = pd.to_datetime(df["date"])
-        df = df[["date", "open", "high", "low", "close", "volume"]]
-
-        df.to_csv(out_file, index=False)
-        print(f"✅ 更新完成：{len(df)} 行")
-
-    except Exception as e:
-        print(f"❌ 拉取失败: {e}")
-
-    time.sleep(SLEEP_SEC)
+        rows, mode = merge_bars(code, df, STORE_DIR, source=source.name)
+        print(f"✅ 更新完成（{mode}）：{rows} 行")
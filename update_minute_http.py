@@ -0,0 +1,104 @@
+# update_minute_http.py
+"""
+只更新 universe 内股票的分钟线（Eastmoney 直连，klt = 1 / 5 / 15 / 30 / 60）
+- 与日线共用并发 / 限速 / 退避管线（kline_fetcher）
+- 落盘到 minute_store 按月分区的压缩列式存储（不再是每只一个 CSV）
+- 断点：从每只已有的最后一根所在日期重拉（当天重叠部分去重合并）
+- 失败不影响整体
+
+用法：
+    python update_minute_http.py --klt 5
+    python update_minute_http.py --klt 1 --start 20260105 --max 50
+"""
+
+import argparse
+from pathlib import Path
+
+import pandas as pd
+
+import instrument
+from kline_fetcher import (
+    BURST,
+    CONCURRENCY,
+    EASTMONEY_BASE_URL,
+    MAX_RETRIES,
+    MINUTE_KLTS,
+    RATE_PER_SEC,
+    fetch_many,
+)
+from kline_parser import klines_to_df
+from minute_store import MINUTE_DIR, last_time, merge_minutes
+
+UNIVERSE_FILE = Path("universe/final_universe.csv")
+
+MAX_PER_RUN = None      # None = 全部 universe
+START_DATE = (pd.Timestamp.today() - pd.Timedelta(days=30)).strftime("%Y%m%d")   # 接口分钟线只保留近期
+
+
+def minute_jobs(codes, klt: int, start_date: str, store_dir: Path = MINUTE_DIR) -> list:
+    """[(code, YYYYMMDD)]：已有数据的从最后一根所在日期起，否则从 start_date 起"""
+    jobs = []
+    for code in dict.fromkeys(codes):
+        last = last_time(code, klt, store_dir)
+        jobs.append((code, last.strftime("%Y%m%d") if last is not None else start_date))
+    return jobs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Eastmoney 分钟线并发更新")
+    parser.add_argument("--klt", type=int, choices=MINUTE_KLTS, default=5, help="分钟周期")
+    parser.add_argument("--start", default=START_DATE, help="无本地数据时的起始日期 YYYYMMDD")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="并发数")
+    parser.add_argument("--rate", type=float, default=RATE_PER_SEC, help="每秒请求数上限")
+    parser.add_argument("--burst", type=int, default=BURST, help="令牌桶容量")
+    parser.add_argument("--retries", type=int, default=MAX_RETRIES, help="单只最多重试次数")
+    parser.add_argument("--max", type=int, default=MAX_PER_RUN, help="本次最多更新只数")
+    parser.add_argument("--base-url", default=EASTMONEY_BASE_URL, help="API 地址（可指向本地 mock）")
+    parser.add_argument("--store-dir", type=Path, default=MINUTE_DIR, help="分钟线存储目录")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.install_from_args("update_minute_http", args)
+
+    with instrument.stage("universe"):
+        universe = pd.read_csv(UNIVERSE_FILE, dtype=str)
+    print(f"📊 Universe 股票数：{len(universe)}")
+
+    with instrument.stage("resume"):
+        jobs = minute_jobs(universe["code"], args.klt, args.start, args.store_dir)
+    if args.max is not None:
+        jobs = jobs[:args.max]
+
+    print(f"🔄 待更新：{len(jobs)} 只 {args.klt} 分钟线（并发 {args.concurrency}，限速 {args.rate}/s）")
+
+    # -------------------------
+    # 并发拉取，主线程解析 + 落盘
+    # -------------------------
+    processed = 0
+    failed = 0
+
+    results = fetch_many(
+        jobs,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        burst=args.burst,
+        base_url=args.base_url,
+        max_retries=args.retries,
+        klt=args.klt,
+    )
+    for code, raw, error in results:
+        if error is not None:
+            print(f"❌ {code} 拉取失败: {error}")
+            failed += 1
+            continue
+
+        with instrument.stage("parse"):
+            df = klines_to_df(raw, date_unit="m")
+        if df.empty:
+            print(f"⚠️ {code} 无新数据")
+            continue
+
+        rows, touched = merge_minutes(code, df, args.klt, args.store_dir)
+        print(f"✅ {code} 更新完成：{len(df)} 根，重写 {touched} 个分区（共 {rows} 行）")
+        processed += 1
+
+    print(f"\n🎯 本次更新完成：{processed} 只，失败 {failed} 只")
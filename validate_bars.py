@@ -0,0 +1,457 @@
+# validate_bars.py
+"""
+日线数据校验 + 异常 / 停牌索引（data/bars/quality.sqlite）
+
+全部股票一次载入（load_universe），所有检查在拼接后的一维数组上向量化完成：
+- dup_date         日期重复 / 倒序
+- ohlc             高 < max(开, 收) / 低 > min(开, 收) / 价格 <= 0
+- missing_price    有成交量但收盘缺失
+- non_trading_day  日期不在交易日历内
+- limit_jump       收盘超出涨跌停价（参考价按除权调整；上市前 5 根不限）
+
+停牌段（suspensions）：
+- zero_volume      连续成交量为 0 的日线
+- gap              两根日线之间缺失的交易日；末根到全市场最新交易日缺了 SUSPEND_CHECK_DAYS 个以上也记一段
+
+每只股票一行状态（status）：末尾连续零成交根数、末根落后全市场最新交易日的交易日数（lag_days）、
+各类异常数，以及校验时 meta 的代数 / 行数 / 末根日期。
+扫描直接读 excluded()（停牌 / 坏数据，排除）和 stale()（只是落后几天没更新，报告不排除），不再每次逐文件推导；
+每次运行按传入代码整体重写。
+校验之后又被更新过的股票（当前 meta 与状态里记下的不同）状态已过期，excluded() 不再据此排除。
+
+用法：
+    python validate_bars.py                 # 校验存储内全部股票
+    python validate_bars.py --show 20       # 额外列出最近 20 条异常
+    python validate_bars.py --check         # 对照已知涨停日核对涨跌停判定（不写索引）
+"""
+
+import argparse
+import sqlite3
+from collections import Counter
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import adj_factor
+import instrument
+from bar_store import STORE_DIR, from_days, list_codes, load_universe, read_meta, restore_prices
+from scan_engine import SUSPEND_CHECK_DAYS
+from trade_calendar import load_trade_dates, trade_dates_between
+
+QUALITY_NAME = "quality.sqlite"
+
+HARD_KINDS = ("dup_date", "ohlc", "missing_price")      # 数据本身有问题，扫描会排除
+LISTING_DAYS = 5                # 上市前 N 根不设涨跌幅限制
+PRICE_TOLERANCE = 0.005         # 涨跌停价按分四舍五入（round_price），留半分余量
+# 存储里真实的涨停日（收盘 = 涨停价，且恰好落在半分上：银行家舍入会少一分）
+LIMIT_CHECKS = [
+    ("000063", "2020-02-24"),       # 前收 45.55 × 1.1 = 50.105 → 50.11
+    ("000063", "2024-10-08"),       # 前收 31.15 × 1.1 = 34.265 → 34.27
+]
+CHINEXT_REFORM = "2020-08-24"   # 创业板涨跌幅 10% → 20%
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS anomalies (
+    code    TEXT NOT NULL,
+    day     INTEGER NOT NULL,
+    kind    TEXT NOT NULL,
+    value   REAL,
+    PRIMARY KEY (code, day, kind)
+);
+CREATE TABLE IF NOT EXISTS suspensions (
+    code       TEXT NOT NULL,
+    start_day  INTEGER NOT NULL,
+    end_day    INTEGER NOT NULL,
+    days       INTEGER NOT NULL,
+    kind       TEXT NOT NULL,
+    PRIMARY KEY (code, start_day, kind)
+);
+CREATE TABLE IF NOT EXISTS status (
+    code               TEXT PRIMARY KEY,
+    rows               INTEGER NOT NULL,
+    last_day           INTEGER,
+    market_day         INTEGER,
+    trailing_suspended INTEGER NOT NULL,
+    anomalies          INTEGER NOT NULL,
+    hard_last_day      INTEGER,
+    checked_at         TEXT NOT NULL,
+    gen                INTEGER,
+    lag_days           INTEGER
+);
+"""
+
+
+def quality_path(store_dir: Path) -> Path:
+    return store_dir / QUALITY_NAME
+
+
+def _connect(store_dir: Path) -> sqlite3.Connection:
+    store_dir.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(quality_path(store_dir), timeout=30)
+    conn.executescript(SCHEMA)
+    # 旧索引缺的列补上（没有 gen 的行在 excluded() 里按过期处理，下次校验补上）
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(status)")}
+    for column in ["gen", "lag_days"]:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE status ADD COLUMN {column} INTEGER")
+    return conn
+
+
+# =========================
+# 1. 向量化检查
+# =========================
+
+def round_price(values) -> np.ndarray:
+    """按分四舍五入（交易所算涨跌停价的规则；np.round 是银行家舍入，50.105 会得到 50.10）"""
+    return np.floor(np.asarray(values, dtype=np.float64) * 100 + 0.5 + 1e-9) / 100
+
+
+def limit_ratio(codes: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """每行的涨跌幅限制（按板块；ST 的 5% 无从得知，按所在板块上限放宽）"""
+    reform = int(np.datetime64(CHINEXT_REFORM, "D").astype(np.int64))
+    star = np.char.startswith(codes, "688") | np.char.startswith(codes, "689")
+    chinext = np.char.startswith(codes, "300") | np.char.startswith(codes, "301")
+    bse = np.char.startswith(codes, "8") | np.char.startswith(codes, "4") | np.char.startswith(codes, "92")
+    return np.select([bse, star, chinext & (days >= reform)], [0.30, 0.20, 0.20], 0.10)
+
+
+def market_calendar(days: np.ndarray) -> np.ndarray:
+    """覆盖 days 的交易日（int 天数）
+
+    没有本地交易日历缓存时退化为工作日，此时去掉全部股票都没有数据的工作日（节假日）
+    """
+    calendar = trade_dates_between(str(from_days(days.min())), str(from_days(days.max()))).astype(np.int64)
+    if load_trade_dates() is None:
+        calendar = calendar[np.isin(calendar, days)]
+    return calendar
+
+
+def _runs(flag: np.ndarray, group: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """flag 为真的连续段（不跨股票）→ (段首下标, 段尾下标)"""
+    same_prev = np.append(False, group[1:] == group[:-1])
+    same_next = np.append(group[1:] == group[:-1], False)
+    prev_flag = np.append(False, flag[:-1]) & same_prev
+    next_flag = np.append(flag[1:], False) & same_next
+    return np.flatnonzero(flag & ~prev_flag), np.flatnonzero(flag & ~next_flag)
+
+
+@instrument.timed("validate")
+def validate(codes, store_dir: Path = STORE_DIR) -> dict:
+    """一次校验全部 codes
+
+    返回 {"codes", "anomalies": DataFrame(code, day, kind, value),
+          "suspensions": DataFrame(code, start_day, end_day, days, kind),
+          "status": DataFrame(code, rows, last_day, market_day, trailing_suspended, anomalies, hard_last_day,
+                              gen, lag_days)}
+    """
+    # 先记代数：校验期间被改写的股票宁可记旧代数（之后按过期处理），不会把新数据当成已校验
+    gens = {code: (read_meta(code, store_dir) or {}).get("gen", 0) for code in dict.fromkeys(codes)}
+    columns = ["date", "open", "high", "low", "close", "volume", "change"]
+    loaded, arrays, offsets = load_universe(codes, columns, store_dir)
+    n = len(loaded)
+    counts = np.diff(offsets)
+    group = np.repeat(np.arange(n), counts)
+    code_arr = np.asarray(loaded, dtype=str)
+    row_code = code_arr[group]
+
+    days = arrays["date"].astype(np.int64)
+    open_, high, low, close = (restore_prices(arrays[c]) for c in ["open", "high", "low", "close"])
+    change = restore_prices(arrays["change"])
+    volume = np.asarray(arrays["volume"], dtype=np.float64)
+
+    first = np.zeros(len(days), dtype=bool)
+    first[offsets[:-1][counts > 0]] = True
+    row_in_symbol = np.arange(len(days)) - offsets[group] if n else np.empty(0, dtype=np.int64)
+
+    found = []      # (行下标, kind, value)
+
+    def flag(mask: np.ndarray, kind: str, value) -> None:
+        idx = np.flatnonzero(mask)
+        if len(idx):
+            values = np.broadcast_to(np.asarray(value, dtype=np.float64), mask.shape)[idx]
+            found.append((idx, kind, values))
+
+    if len(days):
+        # -------------------------
+        # 日期：重复 / 倒序 & 交易日历
+        # -------------------------
+        step = np.append(1, np.diff(days))
+        flag(~first & (step <= 0), "dup_date", step)
+
+        calendar = market_calendar(days)
+        pos = np.searchsorted(calendar, days)
+        in_calendar = calendar[np.minimum(pos, len(calendar) - 1)] == days
+        flag(~in_calendar, "non_trading_day", np.nan)
+
+        # -------------------------
+        # OHLC 一致性
+        # -------------------------
+        eps = 1e-6
+        bad = (
+            (high < np.fmax(open_, close) - eps)
+            | (low > np.fmin(open_, close) + eps)
+            | (low > high + eps)
+            | (np.fmin(np.fmin(open_, close), np.fmin(high, low)) <= 0)
+        )
+        flag(bad, "ohlc", close)
+        flag((volume > 0) & np.isnan(close), "missing_price", volume)
+
+        # -------------------------
+        # 涨跌停：参考价 = 前收 ÷ 当日除权比例（adj_factor 事件表，除权日不误报）；
+        # 前收优先用 收盘 - 涨跌额（涨跌额相对不复权前收），没有涨跌额时用上一根收盘
+        # -------------------------
+        factor = adj_factor.universe_factors(loaded, arrays["date"], offsets, adj_factor.load_events(loaded, store_dir), "hfq")
+        prev_close = np.where(np.isnan(change), np.append(np.nan, close[:-1]), close - change)
+        ref = round_price(prev_close / (factor / np.append(np.nan, factor[:-1])))
+        limit = limit_ratio(row_code, days)
+        up = round_price(ref * (1 + limit)) + PRICE_TOLERANCE
+        down = round_price(ref * (1 - limit)) - PRICE_TOLERANCE
+        jump = (row_in_symbol >= LISTING_DAYS) & (ref > 0) & ((close > up) | (close < down))
+        flag(jump, "limit_jump", np.round((close / ref - 1) * 100, 2))
+
+    anomalies = pd.DataFrame({
+        "code": np.concatenate([row_code[idx] for idx, _, _ in found]) if found else np.empty(0, dtype=str),
+        "day": np.concatenate([days[idx] for idx, _, _ in found]) if found else np.empty(0, dtype=np.int64),
+        "kind": np.concatenate([[kind] * len(idx) for idx, kind, _ in found]) if found else np.empty(0, dtype=str),
+        "value": np.concatenate([v for _, _, v in found]) if found else np.empty(0),
+    }).drop_duplicates(subset=["code", "day", "kind"])
+
+    # -------------------------
+    # 停牌段：零成交量 & 交易日缺口
+    # -------------------------
+    suspensions = []
+    market_day = int(days.max()) if len(days) else None
+    trailing = np.zeros(n, dtype=np.int64)      # 末尾连续零成交根数
+    lag = np.zeros(n, dtype=np.int64)           # 末根之后到全市场最新交易日缺的交易日数
+    if len(days):
+        starts, ends = _runs(volume == 0, group)
+        suspensions.append(pd.DataFrame({
+            "code": row_code[starts], "start_day": days[starts], "end_day": days[ends],
+            "days": ends - starts + 1, "kind": "zero_volume",
+        }))
+        last_row = offsets[1:] - 1
+        at_tail = ends == last_row[group[ends]]
+        trailing[group[ends[at_tail]]] = (ends - starts + 1)[at_tail]
+
+        # 相邻两根之间缺的交易日（只数日历内的）
+        cal_pos = np.searchsorted(calendar, days, side="right") - 1
+        missing = np.append(0, np.diff(cal_pos) - 1)
+        missing[first] = 0
+        gap_rows = np.flatnonzero(missing > 0)
+        suspensions.append(pd.DataFrame({
+            "code": row_code[gap_rows],
+            "start_day": calendar[cal_pos[gap_rows - 1] + 1],
+            "end_day": calendar[cal_pos[gap_rows] - 1],
+            "days": missing[gap_rows],
+            "kind": "gap",
+        }))
+
+        # 末根之后到全市场最新交易日的缺口：缺得少是更新落后（stale），缺满 SUSPEND_CHECK_DAYS 才记为停牌段
+        nonempty = np.flatnonzero(counts > 0)
+        lag[nonempty] = (len(calendar) - 1) - cal_pos[last_row[nonempty]]
+        lagging = nonempty[lag[nonempty] >= SUSPEND_CHECK_DAYS]
+        suspensions.append(pd.DataFrame({
+            "code": code_arr[lagging],
+            "start_day": calendar[cal_pos[last_row[lagging]] + 1],
+            "end_day": np.full(len(lagging), market_day),
+            "days": lag[lagging],
+            "kind": "gap",
+        }))
+
+    suspensions = (
+        pd.concat(suspensions, ignore_index=True) if suspensions
+        else pd.DataFrame(columns=["code", "start_day", "end_day", "days", "kind"])
+    )
+
+    per_code = anomalies.groupby("code").size()
+    hard = anomalies[anomalies["kind"].isin(HARD_KINDS)].groupby("code")["day"].max()
+    status = pd.DataFrame({
+        "code": loaded,
+        "rows": counts,
+        "last_day": [int(days[offsets[i + 1] - 1]) if counts[i] else None for i in range(n)],
+        "market_day": market_day,
+        "trailing_suspended": trailing,
+        "anomalies": per_code.reindex(loaded, fill_value=0).to_numpy(),
+        "hard_last_day": hard.reindex(loaded).to_numpy(),
+        "gen": [gens[code] for code in loaded],
+        "lag_days": lag,
+    })
+    return {"codes": loaded, "anomalies": anomalies, "suspensions": suspensions, "status": status}
+
+
+# =========================
+# 2. 索引读写
+# =========================
+
+def _nullable(value):
+    return None if pd.isna(value) else int(value)
+
+
+def save(result: dict, store_dir: Path = STORE_DIR) -> None:
+    """按本次校验的代码整体替换索引中的旧记录（单个事务）"""
+    codes = [(code,) for code in result["codes"]]
+    now = datetime.now().isoformat(timespec="seconds")
+    with closing(_connect(store_dir)) as conn, conn:
+        for table in ["anomalies", "suspensions", "status"]:
+            conn.executemany(f"DELETE FROM {table} WHERE code = ?", codes)
+        conn.executemany(
+            "INSERT INTO anomalies VALUES (?, ?, ?, ?)",
+            [
+                (r.code, int(r.day), r.kind, None if pd.isna(r.value) else float(r.value))
+                for r in result["anomalies"].itertuples(index=False)
+            ],
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO suspensions VALUES (?, ?, ?, ?, ?)",
+            [
+                (r.code, int(r.start_day), int(r.end_day), int(r.days), r.kind)
+                for r in result["suspensions"].itertuples(index=False)
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO status VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    r.code, int(r.rows), _nullable(r.last_day), _nullable(r.market_day),
+                    int(r.trailing_suspended), int(r.anomalies), _nullable(r.hard_last_day), now, int(r.gen),
+                    int(r.lag_days),
+                )
+                for r in result["status"].itertuples(index=False)
+            ],
+        )
+
+
+def load_status(store_dir: Path = STORE_DIR) -> pd.DataFrame | None:
+    """整张状态表（以 code 为索引）；索引不存在返回 None"""
+    if not quality_path(store_dir).exists():
+        return None
+    with closing(_connect(store_dir)) as conn:
+        return pd.read_sql_query("SELECT * FROM status", conn, index_col="code")
+
+
+def load_anomalies(store_dir: Path = STORE_DIR, kinds=None) -> pd.DataFrame:
+    """异常明细（day 还原为日期）"""
+    if not quality_path(store_dir).exists():
+        return pd.DataFrame(columns=["code", "day", "kind", "value"])
+    with closing(_connect(store_dir)) as conn:
+        df = pd.read_sql_query("SELECT * FROM anomalies ORDER BY day, code", conn)
+    if kinds is not None:
+        df = df[df["kind"].isin(kinds)]
+    return df.assign(day=pd.to_datetime(from_days(df["day"].to_numpy())))
+
+
+def _fresh(code: str, gen, rows, last_day, store_dir: Path) -> bool:
+    """状态行（校验时的代数 / 行数 / 末根）是否对应当前已提交的数据"""
+    meta = read_meta(code, store_dir)
+    if meta is None or pd.isna(gen) or not meta["rows"]:
+        return False
+    return (
+        meta.get("gen", 0) == gen
+        and meta["rows"] == rows
+        and int(np.datetime64(meta["last_date"], "D").astype(np.int64)) == last_day
+    )
+
+
+def _fresh_status(codes, store_dir: Path) -> pd.DataFrame | None:
+    """codes 中状态未过期的行（以 code 为索引）；索引不存在返回 None"""
+    status = load_status(store_dir)
+    if status is None:
+        return None
+    status = status.reindex(list(dict.fromkeys(codes))).dropna(subset=["rows"])
+    fresh = [
+        _fresh(code, gen, rows, last_day, store_dir)
+        for code, gen, rows, last_day in zip(status.index, status["gen"], status["rows"], status["last_day"])
+    ]
+    return status[fresh]
+
+
+def excluded(codes, store_dir: Path = STORE_DIR, lookback_days: int = 0) -> dict | None:
+    """扫描前应排除的代码 → 原因；索引不存在返回 None（调用方自行退化）
+
+    - suspended：末尾连续 SUSPEND_CHECK_DAYS 根零成交（不足这么多根时全为零成交，与原扫描规则一致），
+                 或末根之后缺了 SUSPEND_CHECK_DAYS 个以上交易日（记录在案的停牌段）
+    - bad_data ：最近 lookback_days 个自然日内有 HARD_KINDS 异常（会污染均线）
+    只落后几个交易日的股票不排除（见 stale）；校验之后 meta 变过（代数 / 行数 / 末根日期不同）的股票状态已过期，不排除
+    """
+    status = _fresh_status(codes, store_dir)
+    if status is None:
+        return None
+
+    out = {}
+    recent = status["hard_last_day"] >= status["market_day"] - lookback_days
+    for code in status.index[recent.fillna(False).to_numpy(dtype=bool)]:
+        out[code] = "bad_data"
+    zero_tail = status["trailing_suspended"] >= np.minimum(status["rows"], SUSPEND_CHECK_DAYS)
+    for code in status.index[zero_tail | (status["lag_days"] >= SUSPEND_CHECK_DAYS)]:
+        out[code] = "suspended"
+    return out
+
+
+def stale(codes, store_dir: Path = STORE_DIR) -> dict:
+    """末根落后全市场最新交易日、但还不到停牌标准的代码 → 落后交易日数（只报告，扫描照常）"""
+    status = _fresh_status(codes, store_dir)
+    if status is None:
+        return {}
+    lag = status["lag_days"]
+    lagging = (lag > 0) & (lag < SUSPEND_CHECK_DAYS)
+    return {code: int(days) for code, days in lag[lagging].items()}
+
+
+def check_limits(store_dir: Path = STORE_DIR, checks=LIMIT_CHECKS) -> list:
+    """对照存储里已知的涨停日核对涨跌停判定，返回不一致的 [(代码, 日期, 原因)]（缺数据也算不一致）"""
+    failures = []
+    codes = list(dict.fromkeys(code for code, _ in checks))
+    result = validate(codes, store_dir)
+    flagged = result["anomalies"][result["anomalies"]["kind"] == "limit_jump"]
+    flagged = set(zip(flagged["code"], flagged["day"].astype(np.int64)))
+    rows = dict(zip(result["status"]["code"], result["status"]["rows"]))
+    for code, day in checks:
+        target = int(np.datetime64(day, "D").astype(np.int64))
+        if not rows.get(code):
+            failures.append((code, day, "缺少数据"))
+        elif (code, target) in flagged:
+            failures.append((code, day, "涨停被误报为 limit_jump"))
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="日线数据校验 + 异常 / 停牌索引")
+    parser.add_argument("--store-dir", type=Path, default=STORE_DIR)
+    parser.add_argument("--show", type=int, default=0, help="列出最近 N 条异常")
+    parser.add_argument("--check", action="store_true", help="不写索引，只对照已知涨停日核对涨跌停判定")
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.install_from_args("validate_bars", args)
+
+    if args.check:
+        failures = check_limits(args.store_dir)
+        for code, day, reason in failures:
+            print(f"❌ {code} {day}：{reason}")
+        print(f"🩺 核对 {len(LIMIT_CHECKS)} 个涨停日，不一致 {len(failures)} 个")
+        raise SystemExit(1 if failures else 0)
+
+    codes = list_codes(args.store_dir)
+    print(f"🔍 校验 {len(codes)} 只...")
+    result = validate(codes, args.store_dir)
+    with instrument.stage("save"):
+        save(result, args.store_dir)
+
+    kinds = Counter(result["anomalies"]["kind"])
+    runs = Counter(result["suspensions"]["kind"])
+    status = result["status"]
+    print(f"⚠️ 异常：{dict(kinds) or '无'}，涉及 {int((status['anomalies'] > 0).sum())} 只")
+    suspended = (status["trailing_suspended"] >= np.minimum(status["rows"], SUSPEND_CHECK_DAYS)) | (
+        status["lag_days"] >= SUSPEND_CHECK_DAYS
+    )
+    lagging = (status["lag_days"] > 0) & ~suspended
+    print(f"⏸ 停牌段：{dict(runs) or '无'}，当前停牌 {int(suspended.sum())} 只，数据落后 {int(lagging.sum())} 只")
+
+    if args.show:
+        recent = result["anomalies"].sort_values(["day", "code"]).tail(args.show)
+        for r in recent.itertuples(index=False):
+            print(f"   {r.code} {from_days(r.day)} {r.kind} {r.value if not pd.isna(r.value) else ''}")
+
+    print(f"📁 索引：{quality_path(args.store_dir)}")
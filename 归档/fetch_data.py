@@ -1,41 +1,77 @@
 # fetch_data.py
-import akshare as ak
-import pandas as pd
+"""
+ETF 日线增量更新（与股票同一条管线、同一个存储）
+
+- 标的：universe/etf.csv（或 --symbols）
+- 断点只查清单（manifest.stale_symbols）：已有数据的只拉缺的尾部（一次小请求），新标的拉全历史
+- Eastmoney 直连并发 + 令牌桶限速 + 退避重试（EastmoneySource）
+- merge_bars 合并进仓库根目录的 data/bars（run_daily.py 读同一份）
+
+用法：
+    python fetch_data.py
+    python fetch_data.py --symbols 510300 159919 --base-url http://127.0.0.1:8765
+"""
+
+import argparse
+import sys
 from pathlib import Path
 
-symbols = [
-    "510300",
-    "159919",
-    "512100",
-    "513100",
-]
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import instrument
+from bar_store import merge_bars
+from data_sources import EastmoneySource
+from kline_fetcher import BURST, CONCURRENCY, EASTMONEY_BASE_URL, MAX_RETRIES, RATE_PER_SEC
+from manifest import stale_symbols
+
+ETF_FILE = ROOT / "universe" / "etf.csv"
+STORE_DIR = ROOT / "data" / "bars"
+START_DATE = "19700101"     # 新标的拉全历史
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ETF 日线增量更新")
+    parser.add_argument("--symbols", nargs="+", help="ETF 代码（默认 universe/etf.csv）")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="并发数")
+    parser.add_argument("--rate", type=float, default=RATE_PER_SEC, help="每秒请求数上限")
+    parser.add_argument("--burst", type=int, default=BURST, help="令牌桶容量")
+    parser.add_argument("--retries", type=int, default=MAX_RETRIES, help="单只最多重试次数")
+    parser.add_argument("--base-url", default=EASTMONEY_BASE_URL, help="API 地址（可指向本地 mock）")
+    parser.add_argument("--store-dir", type=Path, default=STORE_DIR)
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.install_from_args("fetch_data", args)
 
-output_path = Path("data")
-output_path.mkdir(exist_ok=True)
+    symbols = args.symbols or pd.read_csv(ETF_FILE, dtype=str)["code"].tolist()
 
-for symbol in symbols:
-    print(f"📥 Fetching {symbol} ...")
+    with instrument.stage("stale_symbols"):
+        jobs = stale_symbols(symbols, args.store_dir, START_DATE)
+    print(f"🔄 ETF {len(symbols)} 只，待更新 {len(jobs)} 只")
 
-    df = ak.fund_etf_hist_em(
-        symbol=symbol,
-        period="daily",
-        adjust=""
+    source = EastmoneySource(
+        concurrency=args.concurrency,
+        rate=args.rate,
+        burst=args.burst,
+        max_retries=args.retries,
+        base_url=args.base_url,
     )
 
-    if df is None or df.empty:
-        print(f"❌ {symbol} 数据为空，跳过")
-        continue
+    processed = 0
+    failed = 0
+    for symbol, df, error in source.fetch_batch(jobs):
+        if error is not None:
+            print(f"❌ {symbol} 拉取失败：{error}")
+            failed += 1
+            continue
 
-    df = df.rename(columns={
-        "日期": "date",
-        "开盘": "open",
-        "最高": "high",
-        "最低": "low",
-        "收盘": "close",
-        "成交量": "volume",
-    })
+        if df.empty:
+            print(f"⚠️ {symbol} 无新数据")
+            continue
 
-    df = df[["date", "open", "high", "low", "close", "volume"]]
-    df.to_csv(output_path / f"{symbol}.csv", index=False)
+        rows, mode = merge_bars(symbol, df, args.store_dir, source=source.name)
+        print(f"✅ {symbol} 更新完成（{mode}），共 {rows} 行")
+        processed += 1
 
-    print(f"✅ data/{symbol}.csv 已生成")
+    print(f"\n🎯 本次更新完成：{processed} 只，失败 {failed} 只")
@@ -1,15 +1,36 @@
 # run_daily.py
-import pandas as pd
+"""
+日线收盘 / MA 交叉下单指令
+
+- 行情读仓库根目录的 data/bars（ETF 由 fetch_data.py 增量写入，与股票同一存储）
+- 存储里还没有的标的，若有旧版 归档/data/{code}.csv 则先导入存储（等同 migrate_csv_to_store.py --csv-dir 归档/data）
+- 日线均线增量状态（indicator_state）只消化上次运行之后新增 / 修订的 K 线
+- 信号 / 止损 / 按手取整的数量对全部标的一次性数组计算
+- 默认每个标的一个 orders/{SYMBOL}_{date}.json（+ 人类可读输出）
+- --batch：整个 universe 一天一个 orders/orders_{date}.csv（每个指令一行，字段同单只 JSON），
+  --jsonl 另写 orders/orders_{date}.jsonl（每行一个与单只 JSON 相同的指令）
+
+用法：
+    python run_daily.py
+    python run_daily.py --batch --universe ../universe/final_universe.csv --jsonl
+"""
+
+import argparse
+import sys
 from datetime import date
 from pathlib import Path
 import json
 
-symbols = [
-    "510300",
-    "159919",
-    "512100",
-    "513100",
-]
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import indicator_state
+from bar_store import read_meta, write_bars
+
+ETF_FILE = ROOT / "universe" / "etf.csv"     # 默认标的（fetch_data.py 同一份列表）
 
 # =========================
 # 全局策略参数（统一）
@@ -18,102 +39,192 @@ symbols = [
 MA_WINDOW = 20
 RISK_PER_TRADE = 100
 STOP_LOSS_PCT = 0.02
+LOT_SIZE = 100
+PRICE_BAND = 0.005      # 参考价上下浮动
 
-DATA_DIR = Path("data")
-OUTPUT_DIR = Path("orders")
-OUTPUT_DIR.mkdir(exist_ok=True)
-
-today_str = str(date.today())
-
-for SYMBOL in symbols:
-    print(f"\n🔍 Processing {SYMBOL}")
-
-    data_path = DATA_DIR / f"{SYMBOL}.csv"
-    if not data_path.exists():
-        print(f"❌ 缺少数据文件：{data_path}")
-        continue
-
-    # =========================
-    # 1. 加载数据
-    # =========================
+STORE_DIR = ROOT / "data" / "bars"        # 与股票共用存储（fetch_data.py 增量写入）
+OUTPUT_DIR = ROOT / "orders"
+LEGACY_CSV_DIR = ROOT / "归档" / "data"     # 迁移到 data/bars 之前的逐只 CSV
 
-    df = pd.read_csv(data_path)
-    df["date"] = pd.to_datetime(df["date"])
-    df = df.sort_values("date")
-
-    if len(df) < MA_WINDOW + 1:
-        print("❌ 数据不足，无法计算 MA")
-        continue
-
-    # =========================
-    # 2. 计算指标
-    # =========================
-
-    df["ma"] = df["close"].rolling(MA_WINDOW).mean()
-
-    today = df.iloc[-1]
-    yesterday = df.iloc[-2]
-
-    # =========================
-    # 3. 信号判断
-    # =========================
-
-    signal = "HOLD"
+ORDER_FIELDS = [
+    "trade_date", "symbol", "signal", "price_reference", "price_low", "price_high",
+    "stop_loss", "quantity", "ma_window", "reason",
+]
 
-    if today["close"] > today["ma"] and yesterday["close"] <= yesterday["ma"]:
-        signal = "BUY"
-    elif today["close"] < today["ma"] and yesterday["close"] >= yesterday["ma"]:
-        signal = "SELL"
+today_str = str(date.today())
 
-    # =========================
-    # 4. 风险与仓位
-    # =========================
 
-    price = today["close"]
-    stop_price = round(price * (1 - STOP_LOSS_PCT), 3)
+def period_matrix(states: list, window: int) -> np.ndarray:
+    """每只最近 window + 1 个周期的收盘报价单位（float，缺失 / 不足为 NaN），最后一列为本周期"""
+    out = np.full((len(states), window + 1), np.nan)
+    for i, state in enumerate(states):
+        ticks = [np.nan if t is None else t for _, t in state.periods[-(window + 1):]]
+        if ticks:
+            out[i, -len(ticks):] = ticks
+    return out
+
+
+def import_legacy_csv(codes, store_dir: Path, csv_dir: Path) -> list:
+    """存储里没有、但有旧版 CSV 的标的整只写入存储，返回导入的代码"""
+    imported = []
+    for code in dict.fromkeys(codes):
+        csv_path = csv_dir / f"{code}.csv"
+        if read_meta(code, store_dir) is not None or not csv_path.exists():
+            continue
+        try:
+            write_bars(code, pd.read_csv(csv_path), store_dir, source="csv")
+        except Exception as e:
+            print(f"❌ {csv_path.name} 导入失败: {e}")
+            continue
+        imported.append(code)
+    return imported
+
+
+def round3(values: np.ndarray) -> np.ndarray:
+    """逐个按 Python round 取 3 位（np.round 先乘 1000 再取整，恰在半位时与单只 JSON 不一致）"""
+    return np.array([round(v, 3) for v in values.tolist()], dtype=np.float64)
+
+
+def build_orders(states: dict, window: int, trade_date: str) -> tuple[pd.DataFrame, dict]:
+    """全部状态 → 指令表（与 indicator_state.cross / ma_pair 逐位一致）
+
+    返回 (指令表, {code: 跳过原因})
+    """
+    codes = list(states)
+    periods = period_matrix([states[code] for code in codes], window)
+    rows = np.array([states[code].rows for code in codes], dtype=np.int64)
+
+    scale = indicator_state.PRICE_SCALE
+    this_close = periods[:, -1] / scale
+    last_close = periods[:, -2] / scale
+    this_ma = periods[:, 1:].sum(axis=1) / (scale * window)      # 任一缺失 → NaN
+    last_ma = periods[:, :-1].sum(axis=1) / (scale * window)
+
+    buy = (this_close > this_ma) & (last_close <= last_ma)
+    sell = (this_close < this_ma) & (last_close >= last_ma)
+    signal = np.where(buy, "BUY", np.where(sell, "SELL", "HOLD"))
+
+    # 风险与仓位：固定每笔风险 / 每股风险，向下取整到整手
+    price = np.array([states[code].last_close for code in codes], dtype=np.float64)
+    stop_price = round3(price * (1 - STOP_LOSS_PCT))
     risk_per_share = price - stop_price
-
-    if risk_per_share <= 0:
-        print("❌ 风险计算异常")
-        continue
-
-    max_qty = int(RISK_PER_TRADE / risk_per_share)
-    max_qty = (max_qty // 100) * 100
-
-    # =========================
-    # 5. 生成指令
-    # =========================
-
-    order = {
-        "trade_date": today_str,
-        "symbol": SYMBOL,
-        "signal": signal,
-        "price_reference": round(price, 3),
-        "price_range": [
-            round(price * 0.995, 3),
-            round(price * 1.005, 3)
-        ],
-        "stop_loss": stop_price,
-        "quantity": max_qty if signal != "HOLD" else 0,
-        "ma_window": MA_WINDOW,
+    with np.errstate(divide="ignore", invalid="ignore"):
+        max_qty = np.floor(RISK_PER_TRADE / risk_per_share)
+    max_qty = np.where(risk_per_share > 0, max_qty, 0).astype(np.int64) // LOT_SIZE * LOT_SIZE
+
+    skipped = {}
+    short = rows < window + 1
+    bad_risk = ~short & ~(risk_per_share > 0)
+    for code in np.asarray(codes, dtype=object)[short]:
+        skipped[code] = "数据不足，无法计算 MA"
+    for code in np.asarray(codes, dtype=object)[bad_risk]:
+        skipped[code] = "风险计算异常"
+
+    keep = ~short & ~bad_risk
+    orders = pd.DataFrame({
+        "trade_date": trade_date,
+        "symbol": np.asarray(codes, dtype=object)[keep],
+        "signal": signal[keep],
+        "price_reference": round3(price[keep]),
+        "price_low": round3(price[keep] * (1 - PRICE_BAND)),
+        "price_high": round3(price[keep] * (1 + PRICE_BAND)),
+        "stop_loss": stop_price[keep],
+        "quantity": np.where(signal[keep] != "HOLD", max_qty[keep], 0),
+        "ma_window": window,
         "reason": "Close/MA cross",
+    }, columns=ORDER_FIELDS)
+    return orders, skipped
+
+
+def order_dict(row) -> dict:
+    """指令表的一行 → 单只 JSON 的字段（price_range 为 [下限, 上限]）"""
+    return {
+        "trade_date": row.trade_date,
+        "symbol": row.symbol,
+        "signal": row.signal,
+        "price_reference": float(row.price_reference),
+        "price_range": [float(row.price_low), float(row.price_high)],
+        "stop_loss": float(row.stop_loss),
+        "quantity": int(row.quantity),
+        "ma_window": int(row.ma_window),
+        "reason": row.reason,
     }
 
-    output_file = OUTPUT_DIR / f"{SYMBOL}_{today_str}.json"
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(order, f, indent=2, ensure_ascii=False)
-
-    # =========================
-    # 6. 人类可读输出
-    # =========================
-
-    print("========== DAILY SIGNAL ==========")
-    print(f"Symbol : {SYMBOL}")
-    print(f"Signal : {signal}")
-    if signal != "HOLD":
-        print(f"Qty    : {max_qty}")
-        print(f"Price  : {order['price_range']}")
-        print(f"Stop   : {stop_price}")
-    else:
-        print("No action today.")
-    print("==================================")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="日线 MA 交叉下单指令")
+    parser.add_argument("--symbols", nargs="+", help="标的代码（默认 universe/etf.csv）")
+    parser.add_argument("--universe", type=Path, help="从 CSV 的 code 列读取标的（覆盖 --symbols）")
+    parser.add_argument("--batch", action="store_true", help="一天一个汇总指令文件，不再逐只写 JSON")
+    parser.add_argument("--jsonl", action="store_true", help="--batch 时另写 JSONL 指令流")
+    args = parser.parse_args()
+
+    codes = args.symbols or pd.read_csv(ETF_FILE, dtype=str)["code"].tolist()
+    if args.universe is not None:
+        codes = pd.read_csv(args.universe, dtype=str)["code"].tolist()
+
+    OUTPUT_DIR.mkdir(exist_ok=True)
+
+    imported = import_legacy_csv(codes, STORE_DIR, LEGACY_CSV_DIR)
+    if imported:
+        print(f"📥 从旧版 CSV 导入存储 {len(imported)} 只：{imported}")
+
+    # 日线均线增量状态：只消化上次运行之后新增 / 修订的 K 线
+    states, modes = indicator_state.sync_many(codes, "D", MA_WINDOW, 1, STORE_DIR)
+    print(f"🧮 指标状态：{dict(modes)}")
+
+    orders, skipped = build_orders(states, MA_WINDOW, today_str)
+    missing = [code for code in dict.fromkeys(codes) if code not in states]
+
+    if args.batch:
+        # =========================
+        # 汇总输出：一天一个指令表
+        # =========================
+
+        output_file = OUTPUT_DIR / f"orders_{today_str}.csv"
+        orders.to_csv(output_file, index=False, encoding="utf-8-sig")
+
+        if args.jsonl:
+            jsonl_file = OUTPUT_DIR / f"orders_{today_str}.jsonl"
+            with open(jsonl_file, "w", encoding="utf-8") as f:
+                for row in orders.itertuples(index=False):
+                    f.write(json.dumps(order_dict(row), ensure_ascii=False) + "\n")
+            print(f"📁 JSONL：{jsonl_file}")
+
+        counts = orders["signal"].value_counts()
+        print(f"\n✅ 指令 {len(orders)} 条：BUY {counts.get('BUY', 0)} / SELL {counts.get('SELL', 0)}"
+              f" / HOLD {counts.get('HOLD', 0)}（缺少数据 {len(missing)}，跳过 {len(skipped)}）")
+        print(f"📁 输出文件：{output_file}")
+        raise SystemExit(0)
+
+    by_symbol = {row.symbol: row for row in orders.itertuples(index=False)}
+    for SYMBOL in dict.fromkeys(codes):
+        print(f"\n🔍 Processing {SYMBOL}")
+
+        if SYMBOL not in states:
+            print(f"❌ 缺少数据：{STORE_DIR / SYMBOL}")
+            continue
+        if SYMBOL in skipped:
+            print(f"❌ {skipped[SYMBOL]}")
+            continue
+
+        order = order_dict(by_symbol[SYMBOL])
+
+        output_file = OUTPUT_DIR / f"{SYMBOL}_{today_str}.json"
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(order, f, indent=2, ensure_ascii=False)
+
+        # =========================
+        # 人类可读输出
+        # =========================
+
+        print("========== DAILY SIGNAL ==========")
+        print(f"Symbol : {SYMBOL}")
+        print(f"Signal : {order['signal']}")
+        if order["signal"] != "HOLD":
+            print(f"Qty    : {order['quantity']}")
+            print(f"Price  : {order['price_range']}")
+            print(f"Stop   : {order['stop_loss']}")
+        else:
+            print("No action today.")
+        print("==================================")